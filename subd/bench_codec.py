@@ -0,0 +1,71 @@
+import matplotlib.pyplot as plt
+import os
+import struct
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+
+def legacy_parse_row(table, row_data):
+    # прежний разбор строки: проход по всем столбцам и декодирование каждого VARCHAR
+    row = []
+    pos = 1
+    for col in table.columns:
+        if col.type == 'INT':
+            val = struct.unpack('Q', row_data[pos:pos + 8])[0]
+            pos += 8
+        elif 'VARCHAR' in col.type:
+            val_bytes = row_data[pos:pos + col.length * 2]
+            val = val_bytes.decode('utf-16').rstrip('\0')
+            pos += col.length * 2
+        row.append(val)
+    return row
+
+
+def legacy_select(table, columns):
+    results = []
+    for offset, row_data in table._scan_matching(None):
+        row = legacy_parse_row(table, row_data)
+        col_indices = [[c.name for c in table.columns].index(col) for col in columns]
+        results.append([row[i] for i in col_indices])
+    return results
+
+
+N_values = [10000, 100000, 1000000]
+legacy_times = []
+compiled_times = []
+
+try:
+    for N in N_values:
+        with closing(Database()) as db:
+            db.execute("CREATE TABLE users (id INT, name VARCHAR(50), email VARCHAR(100), city VARCHAR(50))")
+            db.executemany("INSERT INTO users VALUES (?, ?, ?, ?)",
+                           [(i, f"User_{i}", f"user_{i}@example.com", "Москва") for i in range(N)])
+            table = db.tables['users']
+
+            start = time.time()
+            legacy = legacy_select(table, ['name'])
+            legacy_times.append(time.time() - start)
+
+            start = time.time()
+            compiled = db.execute("SELECT name FROM users")
+            compiled_times.append(time.time() - start)
+
+            assert legacy == compiled
+            print(f"N={N}: _parse_row {legacy_times[-1]:.3f} с, скомпилированный декодер {compiled_times[-1]:.3f} с")
+finally:
+    # файлы удаляются и после упавшей проверки; база к этому моменту закрыта
+    for file_name in ["users.dat", "users.schema.json", "users.seg", "users_id.idx"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+plt.figure(figsize=(10, 6))
+plt.plot(N_values, legacy_times, marker='o', label='_parse_row по всем столбцам')
+plt.plot(N_values, compiled_times, marker='o', label='struct.Struct + проекция')
+plt.xscale('log')
+plt.title('SELECT name FROM users: время vs N')
+plt.xlabel('N (количество записей)')
+plt.ylabel('Время (с)')
+plt.legend()
+plt.tight_layout()
+plt.show()
@@ -0,0 +1,68 @@
+import matplotlib.pyplot as plt
+import os
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+N_values = [10000, 100000, 1000000]
+COLUMNS = "id INT, name VARCHAR(50), email VARCHAR(100), bio VARCHAR(255), city VARCHAR(50)"
+QUERIES = {
+    'SELECT name': "SELECT name FROM {}",
+    'SELECT name WHERE city': "SELECT name FROM {} WHERE city = 'Казань'",
+}
+
+
+def files_size(table, col_names):
+    # байты, которые запрос читает с диска: весь .dat у строковой таблицы,
+    # флаги и файлы нужных столбцов у колоночной
+    if table.storage == 'row':
+        return os.path.getsize(table.data_file)
+    return os.path.getsize(table.data_file) + sum(
+        os.path.getsize(table.column_files[table.column_index[col_name]]) for col_name in col_names)
+
+
+times = {(storage, label): [] for storage in ('row', 'column') for label in QUERIES}
+bytes_read = {(storage, label): [] for storage in ('row', 'column') for label in QUERIES}
+
+try:
+    for N in N_values:
+        rows = [(i, f"User_{i}", f"user_{i}@example.com", "Профиль " * 20, "Казань" if i % 10 == 0 else "Москва")
+                for i in range(N)]
+        with closing(Database()) as db:
+            db.execute(f"CREATE TABLE wide_row ({COLUMNS})")
+            db.execute(f"CREATE TABLE wide_column ({COLUMNS}) WITH (storage = column)")
+            db.executemany("INSERT INTO wide_row VALUES (?, ?, ?, ?, ?)", rows)
+            db.executemany("INSERT INTO wide_column VALUES (?, ?, ?, ?, ?)", rows)
+
+            for label, query in QUERIES.items():
+                results = {}
+                for storage in ('row', 'column'):
+                    table = db.tables[f'wide_{storage}']
+                    start = time.time()
+                    results[storage] = db.execute(query.format(table.name))
+                    times[storage, label].append(time.time() - start)
+                    col_names = ['name', 'city'] if 'city' in label else ['name']
+                    bytes_read[storage, label].append(files_size(table, col_names))
+                assert results['row'] == results['column']
+                print(f"N={N}, {label}: строки {times['row', label][-1]:.3f} с / {bytes_read['row', label][-1]} байт, "
+                      f"столбцы {times['column', label][-1]:.3f} с / {bytes_read['column', label][-1]} байт")
+finally:
+    # файлы удаляются и после упавшей проверки; базы к этому моменту закрыты
+    for file_name in os.listdir('.'):
+        if file_name.startswith(('wide_row', 'wide_column')):
+            os.remove(file_name)
+
+fig, (ax_time, ax_bytes) = plt.subplots(1, 2, figsize=(14, 6))
+for (storage, label), values in times.items():
+    ax_time.plot(N_values, values, marker='o', label=f'{storage}: {label}')
+for (storage, label), values in bytes_read.items():
+    ax_bytes.plot(N_values, values, marker='o', label=f'{storage}: {label}')
+for ax, title, ylabel in ((ax_time, 'Время запроса', 'Время (с)'), (ax_bytes, 'Прочитано с диска', 'Байт')):
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_title(title)
+    ax.set_xlabel('N (количество записей)')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+plt.tight_layout()
+plt.show()
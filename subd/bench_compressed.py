@@ -0,0 +1,85 @@
+import matplotlib.pyplot as plt
+import os
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+N_values = [10000, 100000, 1000000]
+STORAGES = {
+    'row': "",
+    'zlib': " WITH (storage = compressed)",
+    'lzma': " WITH (storage = compressed, compression = lzma)",
+}
+COLUMNS = "ts INT, name VARCHAR(50), email VARCHAR(100), city VARCHAR(50)"
+
+
+def table_size(table):
+    return sum(os.path.getsize(path) for path in table._data_files())
+
+
+def queries(N):
+    # полный проход по строковому условию и узкий диапазон по ts, который карта зон сводит к паре блоков
+    lo = 1700000000 + N // 2
+    return {
+        'WHERE city': "SELECT name FROM {} WHERE city = 'Казань'",
+        'ts BETWEEN': f"SELECT name FROM {{}} WHERE ts BETWEEN {lo} AND {lo + 100}",
+    }
+
+
+sizes = {storage: [] for storage in STORAGES}
+times = {}
+
+# построчная вставка: сжатая таблица пересжимает последний неполный блок (до BLOCK_SIZE байт) на каждую строку,
+# поэтому большие объёмы в неё грузятся пачками
+SINGLE_ROWS = 2000
+
+try:
+    for N in N_values:
+        rows = [(1700000000 + i, f"User_{i}", f"user_{i}@example.com", "Казань" if i % 10 == 0 else "Москва")
+                for i in range(N)]
+        with closing(Database()) as db:
+            for storage, options in STORAGES.items():
+                db.execute(f"CREATE TABLE events_{storage} ({COLUMNS}){options}")
+                db.executemany(f"INSERT INTO events_{storage} VALUES (?, ?, ?, ?)", rows)
+                sizes[storage].append(table_size(db.tables[f'events_{storage}']))
+
+            for label, query in queries(N).items():
+                results = {}
+                for storage in STORAGES:
+                    start = time.time()
+                    results[storage] = db.execute(query.format(f'events_{storage}'))
+                    times.setdefault((storage, label), []).append(time.time() - start)
+                assert results['row'] == results['zlib'] == results['lzma']
+                print(f"N={N}, {label}: "
+                      + ", ".join(f"{storage} {times[storage, label][-1]:.3f} с" for storage in STORAGES))
+            print(f"N={N}, размер: " + ", ".join(f"{storage} {sizes[storage][-1]} байт" for storage in STORAGES))
+
+    with closing(Database()) as db:
+        for storage, options in STORAGES.items():
+            db.execute(f"CREATE TABLE events_single_{storage} ({COLUMNS}){options}")
+            start = time.time()
+            for i in range(SINGLE_ROWS):
+                db.execute(f"INSERT INTO events_single_{storage} VALUES ({1700000000 + i}, 'User_{i}', "
+                           f"'user_{i}@example.com', 'Москва')")
+            print(f"построчная вставка {SINGLE_ROWS} строк, {storage}: "
+                  f"{(time.time() - start) / SINGLE_ROWS * 1e6:.0f} мкс на строку")
+finally:
+    # файлы удаляются и после упавшей проверки; базы к этому моменту закрыты
+    for file_name in os.listdir('.'):
+        if file_name.startswith('events_'):
+            os.remove(file_name)
+
+fig, (ax_time, ax_size) = plt.subplots(1, 2, figsize=(14, 6))
+for (storage, label), values in times.items():
+    ax_time.plot(N_values, values, marker='o', label=f'{storage}: {label}')
+for storage, values in sizes.items():
+    ax_size.plot(N_values, values, marker='o', label=storage)
+for ax, title, ylabel in ((ax_time, 'Время запроса', 'Время (с)'), (ax_size, 'Размер данных на диске', 'Байт')):
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_title(title)
+    ax.set_xlabel('N (количество записей)')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+plt.tight_layout()
+plt.show()
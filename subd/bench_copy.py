@@ -0,0 +1,66 @@
+import csv
+import matplotlib.pyplot as plt
+import os
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+N_values = [10000, 100000, 1000000, 10000000]
+BATCH = 10000
+CSV_FILE = 'events.csv'
+
+
+def rows(N):
+    return ((i, 1700000000 + (i * 7919) % N, f"Event_{i}") for i in range(N))
+
+
+insert_times = []
+copy_times = []
+
+try:
+    for N in N_values:
+        with open(CSV_FILE, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'ts', 'name'])
+            writer.writerows(rows(N))
+
+        with closing(Database()) as db:
+            db.execute("CREATE TABLE events_insert (id INT, ts INT, name VARCHAR(20))")
+            db.execute("CREATE TABLE events_copy (id INT, ts INT, name VARCHAR(20))")
+
+            # прежний способ: пачки executemany, индексы обновляются после каждой пачки
+            start = time.time()
+            batch = []
+            for row in rows(N):
+                batch.append(row)
+                if len(batch) == BATCH:
+                    db.executemany("INSERT INTO events_insert VALUES (?, ?, ?)", batch)
+                    batch = []
+            if batch:
+                db.executemany("INSERT INTO events_insert VALUES (?, ?, ?)", batch)
+            insert_times.append(time.time() - start)
+
+            start = time.time()
+            db.execute(f"COPY events_copy FROM '{CSV_FILE}'")
+            copy_times.append(time.time() - start)
+
+            assert db.execute("SELECT id FROM events_copy WHERE ts = 1700000005") == \
+                db.execute("SELECT id FROM events_insert WHERE ts = 1700000005")
+            print(f"N={N}: executemany по {BATCH} {insert_times[-1]:.2f} с, COPY {copy_times[-1]:.2f} с")
+finally:
+    # файлы удаляются и после упавшей проверки; базы к этому моменту закрыты
+    for file_name in os.listdir('.'):
+        if file_name.startswith('events_') or file_name == CSV_FILE:
+            os.remove(file_name)
+
+plt.figure(figsize=(10, 6))
+plt.plot(N_values, insert_times, marker='o', label=f'executemany по {BATCH} строк')
+plt.plot(N_values, copy_times, marker='o', label='COPY из CSV')
+plt.xscale('log')
+plt.yscale('log')
+plt.title('Загрузка таблицы с двумя INT-индексами: время vs N')
+plt.xlabel('N (количество записей)')
+plt.ylabel('Время (с)')
+plt.legend()
+plt.tight_layout()
+plt.show()
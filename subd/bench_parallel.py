@@ -0,0 +1,52 @@
+import matplotlib.pyplot as plt
+import os
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+N = 10000000
+CHUNK = 1000000
+QUERY = "SELECT name FROM people WHERE city > 'City_90' AND name < 'Name_5'"
+
+
+def load(db):
+    db.execute("CREATE TABLE people (name VARCHAR(20), city VARCHAR(20))")
+    # без INT-столбцов у таблицы нет индексов, и запрос всегда идёт полным проходом
+    for start in range(0, N, CHUNK):
+        db.executemany("INSERT INTO people VALUES (?, ?)",
+                       [(f"Name_{i}", f"City_{i % 100}") for i in range(start, min(start + CHUNK, N))])
+
+
+if __name__ == "__main__":
+    # пул процессов на Windows/macOS запускает интерпретатор заново, поэтому всё под __main__
+    worker_counts = list(range(1, (os.cpu_count() or 1) + 1))
+    times = []
+    expected = None
+
+    try:
+        for workers in worker_counts:
+            with closing(Database(workers=workers)) as db:
+                load(db)
+                db.execute(QUERY)  # прогрев: процессы пула и страничный кэш ОС
+
+                start = time.time()
+                result = db.execute(QUERY)
+                times.append(time.time() - start)
+
+            if expected is None:
+                expected = result
+            assert result == expected
+            print(f"процессов: {workers}, время {times[-1]:.3f} с, ускорение {times[0] / times[-1]:.2f}x")
+    finally:
+        # файлы удаляются и после упавшей проверки; базы к этому моменту закрыты
+        for file_name in ["people.dat", "people.schema.json", "people.seg"]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    plt.figure(figsize=(10, 6))
+    plt.plot(worker_counts, times, marker='o')
+    plt.title(f'Полный проход по {N} строкам: время vs число процессов')
+    plt.xlabel('Число процессов')
+    plt.ylabel('Время (с)')
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,51 @@
+import matplotlib.pyplot as plt
+import os
+import time
+from contextlib import closing
+from mainSUBD import Database, parse_where
+
+N = 1000000
+selectivities = [0.0001, 0.001, 0.01, 0.1, 0.5, 1.0]
+
+index_times = []
+scan_times = []
+
+try:
+    with closing(Database()) as db:
+        db.execute("CREATE TABLE events (id INT, ts INT, data VARCHAR(20))")
+        db.executemany("INSERT INTO events VALUES (?, ?, ?)", [(i, 1700000000 + i, f"Data_{i}") for i in range(N)])
+        table = db.tables['events']
+
+        for selectivity in selectivities:
+            hi = 1700000000 + int(N * selectivity) - 1
+            where_str = f"ts BETWEEN 1700000000 AND {hi}"
+
+            start = time.time()
+            by_index = db.execute(f"SELECT id FROM events WHERE {where_str}")
+            index_times.append(time.time() - start)
+
+            # тот же запрос полным проходом по файлу, минуя индекс
+            decode = table._projection(['id'])
+            start = time.time()
+            by_scan = [decode(row_data) for _, row_data in table._scan_matching(parse_where(where_str))]
+            scan_times.append(time.time() - start)
+
+            assert sorted(by_index) == sorted(by_scan)
+            print(f"селективность {selectivity}: индекс {index_times[-1]:.4f} с, полный проход {scan_times[-1]:.4f} с")
+finally:
+    # файлы удаляются и после упавшей проверки; база к этому моменту закрыта
+    for file_name in ["events.dat", "events.schema.json", "events.seg", "events_id.idx", "events_ts.idx"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+plt.figure(figsize=(10, 6))
+plt.plot(selectivities, index_times, marker='o', label='Диапазон по B+дереву')
+plt.plot(selectivities, scan_times, marker='o', label='Полный проход')
+plt.xscale('log')
+plt.yscale('log')
+plt.title(f'Диапазонная выборка на {N} строках: время vs селективность')
+plt.xlabel('Доля подходящих строк')
+plt.ylabel('Время (с)')
+plt.legend()
+plt.tight_layout()
+plt.show()
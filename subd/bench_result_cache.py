@@ -0,0 +1,63 @@
+import matplotlib.pyplot as plt
+import os
+import random
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+N = 100000
+QUERIES = 20000
+# доля INSERT среди запросов
+write_ratios = [0, 0.01, 0.05, 0.2]
+RESULT_CACHE_SIZE = 16 * 1024 * 1024
+
+
+def workload(db, write_ratio):
+    # точечные запросы по небольшому набору «горячих» ключей вперемешку со вставками новых строк
+    rng = random.Random(42)
+    hot = [rng.randrange(N) for _ in range(1000)]
+    next_id = N
+    start = time.time()
+    for _ in range(QUERIES):
+        if rng.random() < write_ratio:
+            db.execute(f"INSERT INTO users VALUES ({next_id}, {next_id % 100}, 'User_{next_id}')")
+            next_id += 1
+        elif rng.random() < 0.5:
+            db.execute(f"SELECT name FROM users WHERE id = {rng.choice(hot)}")
+        else:
+            db.execute(f"SELECT COUNT(*) FROM users WHERE age = {rng.choice(hot) % 100}")
+    return QUERIES / (time.time() - start)
+
+
+results = {False: [], True: []}
+hit_rates = []
+try:
+    for write_ratio in write_ratios:
+        for cached in (False, True):
+            with closing(Database(result_cache_size=RESULT_CACHE_SIZE if cached else 0)) as db:
+                db.execute("CREATE TABLE users (id INT, age INT, name VARCHAR(20))")
+                db.executemany("INSERT INTO users VALUES (?, ?, ?)", [(i, i % 100, f"User_{i}") for i in range(N)])
+                results[cached].append(workload(db, write_ratio))
+                if cached:
+                    hit_rates.append(db.result_cache.stats()['hit_rate'])
+        print(f"доля INSERT {write_ratio}: без кэша {results[False][-1]:.0f} запросов/с, "
+              f"с кэшем {results[True][-1]:.0f} запросов/с, попаданий {hit_rates[-1]:.0%}")
+finally:
+    # файлы удаляются и после прерванного замера; базы к этому моменту закрыты
+    for file_name in ["users.dat", "users.schema.json", "users.seg", "users_id.idx", "users_age.idx"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+fig, (ax_qps, ax_hits) = plt.subplots(1, 2, figsize=(14, 6))
+ax_qps.plot(write_ratios, results[False], marker='o', label='Без кэша результатов')
+ax_qps.plot(write_ratios, results[True], marker='o', label='С кэшем результатов')
+ax_qps.set_title('Пропускная способность')
+ax_qps.set_ylabel('Запросов в секунду')
+ax_qps.legend()
+ax_hits.plot(write_ratios, [rate * 100 for rate in hit_rates], marker='o')
+ax_hits.set_title('Доля попаданий в кэш')
+ax_hits.set_ylabel('%')
+for ax in (ax_qps, ax_hits):
+    ax.set_xlabel('Доля INSERT среди запросов')
+plt.tight_layout()
+plt.show()
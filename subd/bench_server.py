@@ -0,0 +1,97 @@
+import asyncio
+import matplotlib.pyplot as plt
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from client import Client
+from mainSUBD import Database
+
+N = 100000
+DURATION = 5
+# запросов, одновременно отправленных по одному соединению (глубина конвейера)
+PIPELINE = 8
+connection_counts = [1, 4, 16, 64]
+DIRECTORY = 'bench_server_db'
+PORT = 5441
+QUERY = "SELECT name FROM users WHERE id = ?"
+
+
+def load():
+    db = Database(DIRECTORY)
+    db.execute("CREATE TABLE users (id INT, name VARCHAR(20))")
+    db.executemany("INSERT INTO users VALUES (?, ?)", [(i, f"User_{i}") for i in range(N)])
+    db.close()
+
+
+def wait_for_server(timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', PORT)).close()
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+async def connection_load(client, deadline, latencies, rng):
+    # PIPELINE задач делят одно соединение: каждая отправляет следующий запрос сразу после ответа на свой
+    async def sender():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await client.execute(QUERY, [rng.randrange(N)])
+            latencies.append(time.perf_counter() - start)
+    await asyncio.gather(*[sender() for _ in range(PIPELINE)])
+
+
+async def measure(connections):
+    clients = [await Client.connect(port=PORT) for _ in range(connections)]
+    latencies = []
+    rng = random.Random(connections)
+    start = time.perf_counter()
+    await asyncio.gather(*[connection_load(client, start + DURATION, latencies, rng) for client in clients])
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+if __name__ == "__main__":
+    shutil.rmtree(DIRECTORY, ignore_errors=True)
+    load()
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+                               DIRECTORY, '--port', str(PORT)])
+    try:
+        wait_for_server()
+        qps, p50, p99 = [], [], []
+        for connections in connection_counts:
+            result = asyncio.run(measure(connections))
+            for values, value in zip((qps, p50, p99), result):
+                values.append(value)
+            print(f"соединений: {connections}, {qps[-1]:.0f} запросов/с, "
+                  f"p50 {p50[-1] * 1000:.2f} мс, p99 {p99[-1] * 1000:.2f} мс")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(DIRECTORY, ignore_errors=True)
+
+    fig, (ax_qps, ax_latency) = plt.subplots(1, 2, figsize=(14, 6))
+    ax_qps.plot(connection_counts, qps, marker='o')
+    ax_qps.set_title('Пропускная способность')
+    ax_qps.set_ylabel('Запросов в секунду')
+    ax_latency.plot(connection_counts, [value * 1000 for value in p50], marker='o', label='p50')
+    ax_latency.plot(connection_counts, [value * 1000 for value in p99], marker='o', label='p99')
+    ax_latency.set_title('Задержка запроса')
+    ax_latency.set_ylabel('мс')
+    ax_latency.legend()
+    for ax in (ax_qps, ax_latency):
+        ax.set_xscale('log')
+        ax.set_xlabel(f'Соединений (по {PIPELINE} запросов в конвейере)')
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,81 @@
+import matplotlib.pyplot as plt
+import os
+import random
+import threading
+import time
+from contextlib import closing
+from mainSUBD import Database
+
+N = 100000
+DURATION = 3
+thread_counts = [1, 2, 4, 8]
+QUERIES = [
+    "SELECT name FROM users WHERE id = {}",
+    "SELECT COUNT(*) FROM users WHERE age = {}",
+    "SELECT id FROM users WHERE name = 'User_{}'",
+]
+
+
+def reader(db, stop, counts, n):
+    # поток выполняет запросы вперемешку, пока не истечёт время замера
+    rng = random.Random(n)
+    done = 0
+    while not stop.is_set():
+        key = rng.randrange(N)
+        query = QUERIES[done % len(QUERIES)]
+        db.execute(query.format(key % 100 if 'age' in query else key))
+        done += 1
+    counts[n] = done
+
+
+def writer(db, stop):
+    # фоновый писатель: вставки и удаления небольшими пачками
+    next_id = N
+    while not stop.is_set():
+        db.executemany("INSERT INTO users VALUES (?, ?, ?)",
+                       [(i, i % 100, f"User_{i}") for i in range(next_id, next_id + 100)])
+        db.execute(f"DELETE FROM users WHERE id = {next_id}")
+        next_id += 100
+
+
+def measure(db, threads, with_writer):
+    stop = threading.Event()
+    counts = [0] * threads
+    workers = [threading.Thread(target=reader, args=(db, stop, counts, n)) for n in range(threads)]
+    if with_writer:
+        workers.append(threading.Thread(target=writer, args=(db, stop)))
+    for worker in workers:
+        worker.start()
+    time.sleep(DURATION)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / DURATION
+
+
+results = {False: [], True: []}
+try:
+    with closing(Database()) as db:
+        db.execute("CREATE TABLE users (id INT, age INT, name VARCHAR(20))")
+        db.executemany("INSERT INTO users VALUES (?, ?, ?)", [(i, i % 100, f"User_{i}") for i in range(N)])
+
+        for with_writer in (False, True):
+            for threads in thread_counts:
+                results[with_writer].append(measure(db, threads, with_writer))
+                print(f"потоков: {threads}, {'с писателем' if with_writer else 'только чтение'}: "
+                      f"{results[with_writer][-1]:.0f} запросов/с")
+finally:
+    # файлы удаляются и после прерванного замера; база к этому моменту закрыта
+    for file_name in ["users.dat", "users.schema.json", "users.seg", "users_id.idx", "users_age.idx"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+plt.figure(figsize=(10, 6))
+plt.plot(thread_counts, results[False], marker='o', label='Только SELECT')
+plt.plot(thread_counts, results[True], marker='o', label='SELECT + фоновые INSERT/DELETE')
+plt.title(f'Пропускная способность на {N} строках: запросов/с vs число потоков')
+plt.xlabel('Число читающих потоков')
+plt.ylabel('Запросов в секунду')
+plt.legend()
+plt.tight_layout()
+plt.show()
@@ -0,0 +1,75 @@
+import asyncio
+from collections import deque
+from server import DEFAULT_HOST, DEFAULT_PORT, encode_frame, read_frame
+
+
+class Client:
+    # асинхронный клиент сервера базы. запрос уходит в сокет сразу, не дожидаясь ответов на предыдущие:
+    # несколько задач, вызывающих execute на одном клиенте, образуют конвейер. сервер отвечает по порядку,
+    # поэтому ответ достаётся самому старому из ждущих запросов
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._waiting = deque()
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def execute(self, sql, params=None):
+        # строки результата SELECT, None для остальных запросов; ошибка сервера - ValueError
+        request = {'sql': sql}
+        if params is not None:
+            request['params'] = list(params)
+        return await self._request(request)
+
+    async def executemany(self, sql, rows):
+        await self._request({'sql': sql, 'many': [list(row) for row in rows]})
+
+    async def _request(self, request):
+        if self._receiver.done():
+            raise ConnectionError("Соединение с сервером закрыто")
+        future = asyncio.get_running_loop().create_future()
+        # запись в буфер и постановка в очередь ответов идут без переключения задач, так что порядок совпадает
+        self.writer.write(encode_frame(request))
+        self._waiting.append(future)
+        await self.writer.drain()
+        response = await future
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['rows']
+
+    async def _receive(self):
+        error = ConnectionError("Соединение с сервером закрыто")
+        try:
+            while True:
+                response = await read_frame(self.reader)
+                if response is None:
+                    break
+                future = self._waiting.popleft()
+                # ждавший ответа мог уже отменить запрос
+                if not future.done():
+                    future.set_result(response)
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"Соединение с сервером оборвано: {e}")
+        finally:
+            while self._waiting:
+                future = self._waiting.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self):
+        # сервер отвечает на всё, что успел принять, и закрывает соединение после нас
+        if self.writer.can_write_eof():
+            self.writer.write_eof()
+        await self._receiver
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,7 +1,1164 @@
+import csv
+import hashlib
+import heapq
+import itertools
 import json
+import lzma
+import mmap
+import operator
+import os
 import struct
 import re
+import shutil
+import sys
+import tempfile
+import threading
 import time
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# размер страницы индексного файла
+PAGE_SIZE = 8192
+# бюджет памяти буферного пула по умолчанию
+DEFAULT_BUFFER_POOL_SIZE = 32 * 1024 * 1024
+# INT хранится как беззнаковое 8-байтовое число
+MAX_INT = 2 ** 64 - 1
+INT_STRUCT = struct.Struct('<Q')
+COMPARISONS = {
+    '=': operator.eq,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+# как агрегат вбирает очередное значение группы (AVG копит сумму)
+AGGREGATE_COMBINE = {
+    'SUM': operator.add,
+    'AVG': operator.add,
+    'MIN': min,
+    'MAX': max,
+}
+# режимы полного прохода по таблице
+SCAN_MMAP = 'mmap'
+SCAN_BUFFERED = 'buffered'
+SCAN_NUMPY = 'numpy'
+# в режиме numpy файл обрабатывается кусками по столько строк
+NUMPY_CHUNK_ROWS = 1 << 20
+# сколько разобранных запросов Database держит в кэше
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+# потоковый курсор читает строки пачками по столько, держа блокировку чтения только на время пачки
+CURSOR_CHUNK_ROWS = 1024
+# память под хеш-таблицу соединения; сверх неё обе стороны раскладываются по файлам-разделам
+DEFAULT_JOIN_MEMORY = 64 * 1024 * 1024
+JOIN_SPILL_PARTITIONS = 32
+# глубже раздел не делится: перекос по одному ключу делением не лечится
+JOIN_SPILL_MAX_DEPTH = 3
+# способы хранения таблицы: строками в одном файле или каждым столбцом в своём файле
+STORAGE_ROW = 'row'
+STORAGE_COLUMN = 'column'
+STORAGE_HEAP = 'heap'
+STORAGE_COMPRESSED = 'compressed'
+# сжатие блоков таблицы с хранением compressed: (сжать, распаковать)
+COMPRESSIONS = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+DEFAULT_COMPRESSION = 'zlib'
+# примерный объём строк одного блока до сжатия. последний неполный блок пересжимается целиком при каждой
+# вставке, так что построчная загрузка платит сжатием до BLOCK_SIZE байт за строку (распаковки нет - несжатый
+# хвост остаётся в кэше блоков); большие объёмы грузятся пачками executemany или COPY (bench_compressed.py)
+BLOCK_SIZE = 64 * 1024
+# сколько распакованных блоков держится в памяти для чтения строк по индексу
+BLOCK_CACHE_SIZE = 16
+# карта отрезков таблицы: строк в отрезке, бит фильтра Блума на строку отрезка и число хеш-функций фильтра
+SEGMENT_ROWS = 1 << 13
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 3
+# с какого числа различных значений биты фильтра Блума ставятся через numpy: на меньших пачках (вставка одной
+# строки) накладные расходы numpy больше самой работы
+BLOOM_NUMPY_MIN_KEYS = 32
+# ссылка на значение VARCHAR в куче таблицы с хранением heap: смещение в файле кучи и длина в байтах UTF-8
+HEAP_SLOT = struct.Struct('<QH')
+# на длину в ссылке два байта: значение VARCHAR длиннее стольких байт UTF-8 в кучу не помещается
+HEAP_MAX_VALUE = 0xFFFF
+# проход с равенством по VARCHAR в куче помнит ответы не больше чем для стольких ссылок той же длины, что и искомое
+HEAP_EQUALS_MEMO = 1 << 12
+# колоночная таблица читается кусками по столько строк
+COLUMN_CHUNK_ROWS = 1 << 16
+# параллельный проход включается только для таблиц не меньше этого числа строк
+PARALLEL_SCAN_MIN_ROWS = 100000
+# имя поля флага удаления в структурном dtype (не может совпасть с именем столбца)
+NUMPY_FLAG_FIELD = '#flag'
+# пачка индексных записей, больше 1/BULK_MERGE_RATIO размера дерева, сливается с ним через перестроение
+BULK_MERGE_RATIO = 8
+# виды индексов
+INDEX_BTREE = 'btree'
+INDEX_HASH = 'hash'
+# хеш-индекс: начальное число корзин и среднее число записей на корзину, после которого число корзин удваивается
+HASH_INITIAL_BUCKETS = 8
+HASH_BUCKET_FILL = 256
+# первый байт каждой строки в .dat - флаг: живая строка или удалённая
+ROW_LIVE = 0
+ROW_DELETED = 1
+ROW_LIVE_FLAG = bytes([ROW_LIVE])
+ROW_DELETED_FLAG = bytes([ROW_DELETED])
+# сколько байт читается за раз при сжатии таблицы
+VACUUM_CHUNK_SIZE = 1 << 20
+# массовая загрузка (COPY) кодирует и пишет строки пачками по столько, а записи индексов сортирует
+# в памяти кусками по столько и сливает куски одним проходом
+COPY_CHUNK_ROWS = 1 << 16
+EXTERNAL_SORT_RUN = 1 << 20
+# файл схемы таблицы: <имя таблицы> + SCHEMA_SUFFIX
+SCHEMA_SUFFIX = '.schema.json'
+# типы записей журнала упреждающей записи (WAL)
+WAL_CHECKPOINT = b'C'
+WAL_INSERT = b'I'
+WAL_DELETE = b'D'
+WAL_VACUUM = b'V'
+WAL_REINDEX = b'X'
+WAL_HEAP = b'H'
+# смещения строк, которые DELETE сейчас пометит удалёнными на месте: пишется на диск до пометки, и если группа
+# так и не зафиксирована, восстановление по ней возвращает строки
+WAL_UNDO = b'U'
+WAL_COMMIT = b'K'
+# журнал длиннее этого сбрасывается контрольной точкой
+WAL_CHECKPOINT_SIZE = 64 * 1024 * 1024
+
+
+class RWLock:
+    # блокировка таблицы: читателей сколько угодно, писатель один и без читателей. ждущий писатель
+    # не пропускает вперёд новых читателей, иначе непрерывный поток SELECT не дал бы ему войти.
+    # блокировка не повторная: поток, держащий чтение, не должен брать её ещё раз
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class BufferPool:
+    # общий кэш страниц файлов данных и индексов с вытеснением давно не использованных (LRU).
+    # запись сквозная: данные сразу уходят в файл, а закэшированные страницы обновляются.
+    # пул общий для всех потоков базы: кэш и позиции дескрипторов меняются только под его блокировкой
+    def __init__(self, capacity=DEFAULT_BUFFER_POOL_SIZE):
+        self.capacity = capacity
+        self.max_pages = max(1, capacity // PAGE_SIZE)
+        self.pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = {}
+        self._lock = threading.RLock()
+
+    def _file(self, path):
+        f = self._files.get(path)
+        if f is None:
+            f = self._files[path] = open(path, 'r+b', buffering=0)
+        return f
+
+    def get_page(self, path, page_no):
+        key = (path, page_no)
+        with self._lock:
+            page = self.pages.get(key)
+            if page is not None:
+                self.hits += 1
+                self.pages.move_to_end(key)
+                return page
+            self.misses += 1
+            f = self._file(path)
+            f.seek(page_no * PAGE_SIZE)
+            page = f.read(PAGE_SIZE)
+            if page:
+                self._put(key, page)
+            return page
+
+    def _put(self, key, page):
+        self.pages[key] = page
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+            self.evictions += 1
+
+    def read(self, path, offset, size):
+        # чтение произвольного диапазона, который может пересекать границу страниц
+        page_no, start = divmod(offset, PAGE_SIZE)
+        with self._lock:
+            page = self.get_page(path, page_no)
+            if start + size <= PAGE_SIZE:
+                return page[start:start + size]
+            parts = [page[start:]]
+            remaining = size - (PAGE_SIZE - start)
+            while remaining > 0 and len(page) == PAGE_SIZE:
+                page_no += 1
+                page = self.get_page(path, page_no)
+                parts.append(page[:remaining])
+                remaining -= PAGE_SIZE
+            return b''.join(parts)
+
+    def write(self, path, offset, data):
+        with self._lock:
+            f = self._file(path)
+            f.seek(offset)
+            f.write(data)
+            end = offset + len(data)
+            for page_no in range(offset // PAGE_SIZE, (end - 1) // PAGE_SIZE + 1):
+                key = (path, page_no)
+                page_start = page_no * PAGE_SIZE
+                if offset == page_start and len(data) >= PAGE_SIZE and key not in self.pages:
+                    # страница записана целиком - сразу кладём её в кэш
+                    self._put(key, bytes(data[:PAGE_SIZE]))
+                    continue
+                page = self.pages.get(key)
+                if page is None:
+                    continue
+                lo = max(offset, page_start) - page_start
+                hi = min(end, page_start + PAGE_SIZE) - page_start
+                if lo > len(page):
+                    del self.pages[key]
+                    continue
+                self.pages[key] = page[:lo] + data[lo + page_start - offset:hi + page_start - offset] + page[hi:]
+
+    def append(self, path, data):
+        with self._lock:
+            f = self._file(path)
+            offset = f.seek(0, os.SEEK_END)
+            self.write(path, offset, data)
+            return offset
+
+    def size(self, path):
+        with self._lock:
+            return self._file(path).seek(0, os.SEEK_END)
+
+    def scan(self, path, start=0):
+        # последовательный проход по файлу страницами, начиная со страницы, содержащей start
+        page_no = start // PAGE_SIZE
+        while True:
+            page = self.get_page(path, page_no)
+            if not page:
+                return
+            yield page_no * PAGE_SIZE, page
+            if len(page) < PAGE_SIZE:
+                return
+            page_no += 1
+
+    def sync(self, path):
+        # fsync через тот же дескриптор, которым пишутся страницы; сам fsync идёт без блокировки пула,
+        # чтобы не останавливать читателей (закрывает дескрипторы только писатель, а он здесь один)
+        with self._lock:
+            fd = self._file(path).fileno()
+        os.fsync(fd)
+
+    def invalidate(self, path):
+        # файл пересоздан или заменён - выбрасываем его страницы и закрываем дескриптор
+        with self._lock:
+            for key in [key for key in self.pages if key[0] == path]:
+                del self.pages[key]
+            f = self._files.pop(path, None)
+            if f is not None:
+                f.close()
+
+    def close(self):
+        # закрытие всех дескрипторов; пул остаётся рабочим - при следующем обращении файл откроется заново
+        with self._lock:
+            self.pages.clear()
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+                'pages': len(self.pages),
+                'capacity_pages': self.max_pages,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+class ResultCache:
+    # LRU результатов SELECT с бюджетом памяти в байтах. запись помнит таблицы запроса; запрос к одной таблице
+    # с условием WHERE столбец = значение помнит ещё столбец и байты значения (как их даёт _raw_key) и сбрасывается
+    # только изменением строк с такими байтами в этом столбце, остальные записи таблицы сбрасывает любое её изменение.
+    # у каждой таблицы есть счётчик изменений: результат, при подсчёте которого таблица изменилась, не кэшируется
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.size = 0
+        self.by_table = {}
+        self.changes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            # строки результата - списки, и вызывающий может их менять
+            return [row[:] for row in entry[0]]
+
+    def snapshot(self, table_names):
+        with self._lock:
+            return [self.changes.get(name, 0) for name in table_names]
+
+    def put(self, key, rows, table_names, point, snapshot):
+        size = sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in rows)
+        if size > self.capacity:
+            return
+        with self._lock:
+            if [self.changes.get(name, 0) for name in table_names] != snapshot or key in self.entries:
+                return
+            self.entries[key] = ([row[:] for row in rows], size, table_names, point)
+            self.size += size
+            for name in table_names:
+                self.by_table.setdefault(name, set()).add(key)
+            while self.size > self.capacity:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, table_names, _ = self.entries.pop(key)
+        self.size -= size
+        for name in table_names:
+            keys = self.by_table[name]
+            keys.discard(key)
+            if not keys:
+                del self.by_table[name]
+
+    def invalidate(self, table, rows=None):
+        # table изменилась; rows - байты вставленных или удалённых строк, None - изменение неизвестно какое
+        with self._lock:
+            self.changes[table.name] = self.changes.get(table.name, 0) + 1
+            keys = self.by_table.get(table.name)
+            if not keys:
+                return
+            values = {}
+            stale = []
+            for key in keys:
+                point = self.entries[key][3]
+                if rows is None or point is None:
+                    stale.append(key)
+                    continue
+                col_name, value = point
+                if col_name not in values:
+                    field = table._field_bytes(col_name)
+                    values[col_name] = {field(row_data) for row_data in rows}
+                if value in values[col_name]:
+                    stale.append(key)
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self.entries),
+                'size': self.size,
+                'capacity': self.capacity,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+
+class WriteAheadLog:
+    # журнал упреждающей записи базы. записи копятся в памяти и уходят на диск одной записью с одним fsync
+    # при фиксации группы (групповая фиксация); после последней контрольной точки журнал содержит всё,
+    # что нужно, чтобы довести файлы таблиц до зафиксированного состояния.
+    # запись: длина тела, crc32, тип, затем имя таблицы с длиной и данные записи
+    RECORD_HEADER = struct.Struct('<IIc')
+    NAME_LENGTH = struct.Struct('<H')
+
+    def __init__(self, path, tables, buffer_pool, checkpoint_size=WAL_CHECKPOINT_SIZE, lock=None):
+        self.path = path
+        self.tables = tables
+        self.buffer_pool = buffer_pool
+        self.checkpoint_size = checkpoint_size
+        self.pending = []
+        self.file = open(path, 'ab', buffering=0)
+        self.size = self.file.seek(0, os.SEEK_END)
+        # файл журнала пишет не только писатель: исходное состояние таблицы, которую открыл читатель, уходит
+        # в журнал из его потока (log_state). контрольная точка держит блокировку целиком; у базы это
+        # блокировка каталога таблиц, под которой таблицы и открываются
+        self.lock = lock if lock is not None else threading.RLock()
+
+    def log(self, kind, table_name=b'', payload=b''):
+        name = table_name.encode('utf-8') if isinstance(table_name, str) else table_name
+        body = self.NAME_LENGTH.pack(len(name)) + name + payload
+        self.pending.append(self.RECORD_HEADER.pack(len(body), zlib.crc32(kind + body), kind) + body)
+
+    def commit(self, checkpoint=True):
+        # checkpoint=False - только фиксация группы: изменения, ради которых она фиксируется, ещё не сделаны,
+        # и контрольная точка не должна сбросить журнал раньше них
+        self._flush()
+        if checkpoint and self.size >= self.checkpoint_size:
+            self.checkpoint()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        self.log(WAL_COMMIT)
+        data = b''.join(self.pending)
+        self.pending = []
+        self._write(data)
+
+    def _write(self, data):
+        with self.lock:
+            self.file.write(data)
+            os.fsync(self.file.fileno())
+            self.size += len(data)
+
+    def log_undo(self, table_name, offsets):
+        # before-image пометок удаления: в отличие от остальных записей уходит на диск сразу, потому что
+        # флаги меняются на месте до фиксации. после фиксации группы запись больше ничего не значит
+        self._write_now(WAL_UNDO, table_name, b''.join(map(INT_STRUCT.pack, offsets)))
+
+    def log_state(self, table_name, size, dead_rows):
+        # исходное состояние таблицы, открытой после контрольной точки. как и before-image, уходит на диск
+        # сразу и не фиксирует ждущую группу (открытую транзакцию): по нему восстановление отрезает строки,
+        # которые незафиксированная группа успела дописать в таблицу
+        self._write_now(WAL_CHECKPOINT, payload=json.dumps({table_name: [size, dead_rows]}).encode('utf-8'))
+
+    def _write_now(self, kind, table_name=b'', payload=b''):
+        name = table_name.encode('utf-8') if isinstance(table_name, str) else table_name
+        body = self.NAME_LENGTH.pack(len(name)) + name + payload
+        self._write(self.RECORD_HEADER.pack(len(body), zlib.crc32(kind + body), kind) + body)
+
+    def rollback(self):
+        # записи отменённой транзакции отбрасываются. таблицы к этому моменту уже возвращены в прежнее
+        # состояние; контрольная точка сбрасывает их на диск и убирает из журнала before-images транзакции
+        self.pending = []
+        self.checkpoint()
+
+    def checkpoint(self):
+        # все файлы таблиц сбрасываются на диск, после чего журнал заменяется одной записью
+        # с размерами файлов данных и счётчиками строк
+        self._flush()
+        with self.lock:
+            state = {}
+            for name, table in self.tables.items():
+                for path in table._data_files() + [index.path for index in table.indexes.values()]:
+                    self.buffer_pool.sync(path)
+                table.segments.save()
+                if table.dead_rows_dirty:
+                    table._save_dead_rows()
+                state[name] = [table._data_size(), table.dead_rows]
+            self.file.truncate(0)
+            self.size = 0
+            self.log(WAL_CHECKPOINT, payload=json.dumps(state).encode('utf-8'))
+            self._flush()
+
+    def close(self):
+        self.checkpoint()
+        self.file.close()
+
+    @classmethod
+    def records(cls, path):
+        # зафиксированные записи журнала по порядку: (тип, имя таблицы, данные).
+        # оборванный или повреждённый хвост и записи без отметки фиксации отбрасываются; из незафиксированного
+        # хвоста в конце отдаются только записи, которые пишутся сразу: исходные состояния таблиц (WAL_CHECKPOINT)
+        # и before-images (WAL_UNDO), чтобы отрезать дописанные строки и откатить сделанные на месте пометки
+        with open(path, 'rb') as f:
+            data = f.read()
+        group = []
+        pos = 0
+        while pos + cls.RECORD_HEADER.size <= len(data):
+            length, crc, kind = cls.RECORD_HEADER.unpack_from(data, pos)
+            body = data[pos + cls.RECORD_HEADER.size:pos + cls.RECORD_HEADER.size + length]
+            if len(body) < length or zlib.crc32(kind + body) != crc:
+                break
+            pos += cls.RECORD_HEADER.size + length
+            if kind == WAL_COMMIT:
+                yield from (record for record in group if record[0] != WAL_UNDO)
+                group = []
+                continue
+            name_length = cls.NAME_LENGTH.unpack_from(body)[0]
+            name_end = cls.NAME_LENGTH.size + name_length
+            group.append((kind, body[cls.NAME_LENGTH.size:name_end].decode('utf-8'), body[name_end:]))
+        yield from (record for record in group if record[0] in (WAL_UNDO, WAL_CHECKPOINT))
+
+
+class BPlusTree:
+    # дисковое B+дерево для INT-столбцов.
+    # страница 0 - заголовок, остальные - узлы. ключ записи - значения столбцов и смещение строки,
+    # всё в big-endian, поэтому порядок байт совпадает с порядком чисел и сравнивать можно сами байты
+    HEADER = struct.Struct('<4sIIIQ')
+    NODE_HEADER = struct.Struct('<BxHI')
+    MAGIC = b'BPT1'
+
+    def __init__(self, path, key_width=1, buffer_pool=None):
+        self.path = path
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+        self.key_width = key_width
+        self.entry_size = 8 * (key_width + 1)
+        self.entry_struct = struct.Struct('>' + 'Q' * (key_width + 1))
+        self.leaf_cap = (PAGE_SIZE - self.NODE_HEADER.size) // self.entry_size
+        self.inner_cap = (PAGE_SIZE - self.NODE_HEADER.size - 4) // (self.entry_size + 4)
+        self.children_pos = self.NODE_HEADER.size + self.inner_cap * self.entry_size
+        self.root = 0
+        self.num_pages = 0
+        self.num_entries = 0
+        # при пакетной вставке изменённые страницы копятся здесь и пишутся один раз в конце
+        self._dirty = None
+
+    def create(self):
+        open(self.path, 'wb').close()
+        self.buffer_pool.invalidate(self.path)
+        self.root = 1
+        self.num_pages = 2
+        self.num_entries = 0
+        self._write_page(1, self._make_node(True, b'', 0))
+        self._write_header()
+
+    def open(self):
+        header = self.buffer_pool.read(self.path, 0, self.HEADER.size)
+        magic, key_width, self.root, self.num_pages, self.num_entries = self.HEADER.unpack(header)
+        if magic != self.MAGIC or key_width != self.key_width:
+            raise ValueError(f"файл '{self.path}' не является индексом B+дерева")
+
+    def close(self):
+        self.buffer_pool.invalidate(self.path)
+
+    def _write_header(self):
+        header = self.HEADER.pack(self.MAGIC, self.key_width, self.root, self.num_pages, self.num_entries)
+        self._write_page(0, header.ljust(PAGE_SIZE, b'\0'))
+
+    def _read_page(self, page_no):
+        if self._dirty is not None and page_no in self._dirty:
+            return self._dirty[page_no]
+        return self.buffer_pool.get_page(self.path, page_no)
+
+    def _write_page(self, page_no, data):
+        if self._dirty is not None:
+            self._dirty[page_no] = data
+            return
+        self.buffer_pool.write(self.path, page_no * PAGE_SIZE, data)
+
+    def _make_node(self, is_leaf, entries, n, next_page=0, children=b''):
+        page = bytearray(PAGE_SIZE)
+        self.NODE_HEADER.pack_into(page, 0, is_leaf, n, next_page)
+        page[self.NODE_HEADER.size:self.NODE_HEADER.size + len(entries)] = entries
+        if children:
+            page[self.children_pos:self.children_pos + len(children)] = children
+        return page
+
+    def _bisect(self, page, n, target, right):
+        # бинарный поиск по отсортированному массиву записей прямо в байтах страницы
+        size = self.entry_size
+        base = self.NODE_HEADER.size
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = page[base + mid * size:base + (mid + 1) * size]
+            if key < target or (right and key == target):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _child(self, page, i):
+        return struct.unpack_from('<I', page, self.children_pos + i * 4)[0]
+
+    def _find_leaf(self, target, right=True):
+        # right=False - спуск в лист, где лежат ближайшие записи меньше target
+        path = []
+        page_no = self.root
+        page = self._read_page(page_no)
+        is_leaf, n, _ = self.NODE_HEADER.unpack_from(page)
+        while not is_leaf:
+            i = self._bisect(page, n, target, right=right)
+            path.append((page_no, i))
+            page_no = self._child(page, i)
+            page = self._read_page(page_no)
+            is_leaf, n, _ = self.NODE_HEADER.unpack_from(page)
+        return page_no, page, path
+
+    def insert(self, keys, offset):
+        self.insert_many([(keys, offset)])
+
+    def insert_many(self, entries):
+        entries = sorted(entries)
+        if not entries:
+            return
+        if len(entries) * BULK_MERGE_RATIO >= self.num_entries:
+            # пачка сравнима с деревом - дешевле слить её с существующими записями и построить дерево заново
+            existing = list(self)
+            self.bulk_load(heapq.merge(existing, (keys + (offset,) for keys, offset in entries)))
+            return
+        # иначе вставляем по одной в отсортированном порядке, чтобы соседние записи попадали в одни листья,
+        # и сбрасываем каждую затронутую страницу на диск один раз
+        self._dirty = {}
+        try:
+            for keys, offset in entries:
+                self._insert(self.entry_struct.pack(*keys, offset))
+        finally:
+            dirty, self._dirty = self._dirty, None
+            for page_no in sorted(dirty):
+                self._write_page(page_no, dirty[page_no])
+            self._write_header()
+
+    def _insert(self, entry):
+        page_no, page, path = self._find_leaf(entry)
+        _, n, next_page = self.NODE_HEADER.unpack_from(page)
+        size = self.entry_size
+        base = self.NODE_HEADER.size
+        pos = self._bisect(page, n, entry, right=False)
+        self.num_entries += 1
+        if n < self.leaf_cap:
+            page = bytearray(page)
+            page[base + pos * size:base + (n + 1) * size] = entry + page[base + pos * size:base + n * size]
+            self.NODE_HEADER.pack_into(page, 0, True, n + 1, next_page)
+            self._write_page(page_no, page)
+            return
+        # лист переполнен - делим пополам и поднимаем разделитель в родителя
+        entries = page[base:base + pos * size] + entry + page[base + pos * size:base + n * size]
+        n += 1
+        mid = n // 2
+        new_page_no = self._allocate_page()
+        self._write_page(page_no, self._make_node(True, entries[:mid * size], mid, new_page_no))
+        self._write_page(new_page_no, self._make_node(True, entries[mid * size:], n - mid, next_page))
+        self._insert_into_parent(path, entries[mid * size:(mid + 1) * size], page_no, new_page_no)
+
+    def _insert_into_parent(self, path, separator, left_no, right_no):
+        size = self.entry_size
+        base = self.NODE_HEADER.size
+        while path:
+            page_no, i = path.pop()
+            page = self._read_page(page_no)
+            _, n, _ = self.NODE_HEADER.unpack_from(page)
+            keys = bytes(page[base:base + i * size]) + separator + bytes(page[base + i * size:base + n * size])
+            children_end = self.children_pos + (n + 1) * 4
+            children = (bytes(page[self.children_pos:self.children_pos + (i + 1) * 4]) + struct.pack('<I', right_no)
+                        + bytes(page[self.children_pos + (i + 1) * 4:children_end]))
+            n += 1
+            if n <= self.inner_cap:
+                self._write_page(page_no, self._make_node(False, keys, n, children=children))
+                return
+            # внутренний узел переполнен: средний ключ уходит наверх
+            mid = n // 2
+            new_page_no = self._allocate_page()
+            self._write_page(page_no, self._make_node(False, keys[:mid * size], mid,
+                                                      children=children[:(mid + 1) * 4]))
+            self._write_page(new_page_no, self._make_node(False, keys[(mid + 1) * size:], n - mid - 1,
+                                                          children=children[(mid + 1) * 4:]))
+            separator = keys[mid * size:(mid + 1) * size]
+            left_no, right_no = page_no, new_page_no
+        # разделился корень - дерево растёт на уровень
+        new_root = self._allocate_page()
+        self._write_page(new_root, self._make_node(False, separator, 1,
+                                                   children=struct.pack('<II', left_no, right_no)))
+        self.root = new_root
+
+    def _allocate_page(self):
+        page_no = self.num_pages
+        self.num_pages += 1
+        return page_no
+
+    def _iter_from(self, target):
+        # записи по возрастанию, начиная с первой >= target
+        size = self.entry_size
+        base = self.NODE_HEADER.size
+        _, page, _ = self._find_leaf(target)
+        _, n, next_page = self.NODE_HEADER.unpack_from(page)
+        pos = self._bisect(page, n, target, right=False)
+        while True:
+            for i in range(pos, n):
+                yield page[base + i * size:base + (i + 1) * size]
+            if not next_page:
+                return
+            page = self._read_page(next_page)
+            _, n, next_page = self.NODE_HEADER.unpack_from(page)
+            pos = 0
+
+    def search(self, keys):
+        # смещения строк, у которых первые len(keys) ключей равны keys
+        prefix = struct.pack('>' + 'Q' * len(keys), *keys)
+        target = prefix.ljust(self.entry_size, b'\0')
+        for entry in self._iter_from(target):
+            if entry[:len(prefix)] != prefix:
+                return
+            yield int.from_bytes(entry[-8:], 'big')
+
+    def range(self, lo, hi):
+        # смещения строк, у которых первый ключ лежит в [lo, hi], в порядке ключа;
+        # читаются только листья с подходящими записями
+        target = struct.pack('>Q', lo).ljust(self.entry_size, b'\0')
+        hi_prefix = struct.pack('>Q', hi)
+        for entry in self._iter_from(target):
+            if entry[:8] > hi_prefix:
+                return
+            yield int.from_bytes(entry[-8:], 'big')
+
+    def __iter__(self):
+        for entry in self._iter_from(bytes(self.entry_size)):
+            yield self.entry_struct.unpack(entry)
+
+    def iter_reverse(self):
+        # записи по убыванию. ссылок на предыдущий лист нет, поэтому каждый следующий лист
+        # находится спуском от корня к записям меньше первой записи текущего
+        size = self.entry_size
+        base = self.NODE_HEADER.size
+        target = b'\xff' * size
+        while True:
+            _, page, _ = self._find_leaf(target, right=False)
+            _, n, _ = self.NODE_HEADER.unpack_from(page)
+            pos = self._bisect(page, n, target, right=False)
+            if not pos:
+                return
+            for i in range(pos - 1, -1, -1):
+                yield self.entry_struct.unpack(page[base + i * size:base + (i + 1) * size])
+            target = bytes(page[base:base + size])
+
+    def bulk_load(self, entries):
+        # строит дерево снизу вверх из отсортированной последовательности кортежей (ключи..., смещение)
+        self.create()
+        size = self.entry_size
+        level = []
+        chunk = []
+        page_no = self.root
+        # полный лист упаковывается одним вызовом struct
+        leaf_struct = struct.Struct('>' + 'Q' * (self.key_width + 1) * self.leaf_cap)
+        for entry in entries:
+            if len(chunk) == self.leaf_cap:
+                next_page = self._allocate_page()
+                packed = leaf_struct.pack(*itertools.chain.from_iterable(chunk))
+                self._write_page(page_no, self._make_node(True, packed, len(chunk), next_page))
+                level.append((packed[:size], page_no))
+                self.num_entries += len(chunk)
+                page_no = next_page
+                chunk = []
+            chunk.append(entry)
+        packed = b''.join(self.entry_struct.pack(*entry) for entry in chunk)
+        self._write_page(page_no, self._make_node(True, packed, len(chunk)))
+        level.append((packed[:size] if chunk else bytes(size), page_no))
+        self.num_entries += len(chunk)
+        while len(level) > 1:
+            upper = []
+            for start in range(0, len(level), self.inner_cap + 1):
+                group = level[start:start + self.inner_cap + 1]
+                keys = b''.join(first for first, _ in group[1:])
+                children = struct.pack('<' + 'I' * len(group), *(child for _, child in group))
+                node_no = self._allocate_page()
+                self._write_page(node_no, self._make_node(False, keys, len(group) - 1, children=children))
+                upper.append((group[0][0], node_no))
+            level = upper
+        self.root = level[0][1]
+        self._write_header()
+
+
+class HashIndex:
+    # дисковый хеш-индекс для VARCHAR: страница 0 - заголовок, страницы 1..num_buckets - корзины,
+    # переполнившиеся корзины продолжаются цепочкой страниц в конце файла.
+    # запись - (64-битный хеш закодированного значения, смещение строки); при совпадении хешей значение
+    # сверяется со строкой таблицы
+    HEADER = struct.Struct('<4sIIQ')
+    BUCKET_HEADER = struct.Struct('<HxxI')
+    ENTRY = struct.Struct('<QQ')
+    MAGIC = b'HSH1'
+
+    def __init__(self, path, buffer_pool=None):
+        self.path = path
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+        self.bucket_cap = (PAGE_SIZE - self.BUCKET_HEADER.size) // self.ENTRY.size
+        self.num_buckets = 0
+        self.num_pages = 0
+        self.num_entries = 0
+
+    def create(self, num_buckets=HASH_INITIAL_BUCKETS):
+        open(self.path, 'wb').close()
+        self.buffer_pool.invalidate(self.path)
+        self.num_buckets = num_buckets
+        self.num_pages = num_buckets + 1
+        self.num_entries = 0
+        empty = bytes(PAGE_SIZE)
+        self.buffer_pool.write(self.path, PAGE_SIZE, empty * num_buckets)
+        self._write_header()
+
+    def open(self):
+        header = self.buffer_pool.read(self.path, 0, self.HEADER.size)
+        magic, self.num_buckets, self.num_pages, self.num_entries = self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise ValueError(f"файл '{self.path}' не является хеш-индексом")
+
+    def close(self):
+        self.buffer_pool.invalidate(self.path)
+
+    def _write_header(self):
+        header = self.HEADER.pack(self.MAGIC, self.num_buckets, self.num_pages, self.num_entries)
+        self.buffer_pool.write(self.path, 0, header.ljust(PAGE_SIZE, b'\0'))
+
+    @staticmethod
+    def hash_key(key):
+        # устойчивый между запусками хеш (встроенный hash() для bytes рандомизирован)
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+    def _read_page(self, page_no):
+        return self.buffer_pool.get_page(self.path, page_no)
+
+    def _write_page(self, page_no, page):
+        self.buffer_pool.write(self.path, page_no * PAGE_SIZE, page)
+
+    def _chain(self, key_hash):
+        # страницы цепочки корзины: (номер, байты страницы)
+        page_no = 1 + key_hash % self.num_buckets
+        while page_no:
+            page = self._read_page(page_no)
+            yield page_no, page
+            page_no = self.BUCKET_HEADER.unpack_from(page)[1]
+
+    def search(self, key_hash):
+        target = struct.pack('<Q', key_hash)
+        base = self.BUCKET_HEADER.size
+        size = self.ENTRY.size
+        for _, page in self._chain(key_hash):
+            n = self.BUCKET_HEADER.unpack_from(page)[0]
+            end = base + n * size
+            pos = page.find(target, base, end)
+            while pos >= 0:
+                if (pos - base) % size == 0:
+                    yield int.from_bytes(page[pos + 8:pos + 16], 'little')
+                    pos = page.find(target, pos + size, end)
+                else:
+                    pos = page.find(target, pos + 1, end)
+
+    def insert(self, key_hash, offset):
+        self.insert_many([(key_hash, offset)])
+
+    def insert_many(self, entries):
+        entries = list(entries)
+        if not entries:
+            return
+        if self.num_entries + len(entries) > self.num_buckets * HASH_BUCKET_FILL:
+            # корзины заполнились - перестраиваем индекс с вдвое большим числом корзин
+            self.bulk_load(list(self) + entries)
+            return
+        by_bucket = {}
+        for key_hash, offset in entries:
+            by_bucket.setdefault(key_hash % self.num_buckets, []).append(self.ENTRY.pack(key_hash, offset))
+        base = self.BUCKET_HEADER.size
+        size = self.ENTRY.size
+        for bucket, packed in by_bucket.items():
+            for page_no, page in self._chain(bucket):
+                pass
+            page = bytearray(page)
+            n, next_page = self.BUCKET_HEADER.unpack_from(page)
+            while packed:
+                free = self.bucket_cap - n
+                if free:
+                    chunk, packed = packed[:free], packed[free:]
+                    page[base + n * size:base + (n + len(chunk)) * size] = b''.join(chunk)
+                    n += len(chunk)
+                    self.BUCKET_HEADER.pack_into(page, 0, n, next_page)
+                if not packed:
+                    break
+                # страница заполнена - цепляем новую страницу переполнения
+                new_page_no = self.num_pages
+                self.num_pages += 1
+                self.BUCKET_HEADER.pack_into(page, 0, n, new_page_no)
+                self._write_page(page_no, page)
+                page_no, page, n, next_page = new_page_no, bytearray(PAGE_SIZE), 0, 0
+            self._write_page(page_no, page)
+        self.num_entries += len(entries)
+        self._write_header()
+
+    def delete_many(self, entries):
+        # запись удаляется заменой на последнюю запись той же страницы
+        base = self.BUCKET_HEADER.size
+        size = self.ENTRY.size
+        for key_hash, offset in entries:
+            target = self.ENTRY.pack(key_hash, offset)
+            for page_no, page in self._chain(key_hash):
+                n, next_page = self.BUCKET_HEADER.unpack_from(page)
+                pos = page.find(target, base, base + n * size)
+                while pos >= 0 and (pos - base) % size:
+                    pos = page.find(target, pos + 1, base + n * size)
+                if pos < 0:
+                    continue
+                page = bytearray(page)
+                last = base + (n - 1) * size
+                page[pos:pos + size] = page[last:last + size]
+                page[last:last + size] = bytes(size)
+                self.BUCKET_HEADER.pack_into(page, 0, n - 1, next_page)
+                self._write_page(page_no, page)
+                self.num_entries -= 1
+                break
+        self._write_header()
+
+    def __iter__(self):
+        base = self.BUCKET_HEADER.size
+        for bucket in range(self.num_buckets):
+            for _, page in self._chain(bucket):
+                n = self.BUCKET_HEADER.unpack_from(page)[0]
+                yield from self.ENTRY.iter_unpack(page[base:base + n * self.ENTRY.size])
+
+    @staticmethod
+    def buckets_for(count):
+        # корзин берётся вдвое больше минимально нужного, чтобы следующие вставки долго не требовали перестроения
+        return max(HASH_INITIAL_BUCKETS, 2 * -(-count // HASH_BUCKET_FILL))
+
+    def bulk_load(self, entries):
+        # раскладывает записи по корзинам в памяти и пишет файл последовательно
+        entries = list(entries)
+        num_buckets = self.buckets_for(len(entries))
+        buckets = [[] for _ in range(num_buckets)]
+        for entry in entries:
+            buckets[entry[0] % num_buckets].append(entry)
+        self.load_sorted(itertools.chain.from_iterable(buckets), num_buckets)
+
+    def load_sorted(self, entries, num_buckets):
+        # строит индекс потоком из записей, идущих по возрастанию номера корзины (key_hash % num_buckets):
+        # основные страницы корзин пишутся подряд, страницы переполнения - в конец файла, те и другие
+        # кусками по VACUUM_CHUNK_SIZE
+        open(self.path, 'wb').close()
+        self.buffer_pool.invalidate(self.path)
+        self.num_buckets = num_buckets
+        self.num_pages = num_buckets + 1
+        self.num_entries = 0
+        batch = max(1, VACUUM_CHUNK_SIZE // PAGE_SIZE)
+        empty = bytes(PAGE_SIZE)
+        pages = []
+        written = 1
+        overflow = []
+        overflow_written = self.num_pages
+        bucket = 0
+        for bucket_no, group in itertools.groupby(entries, key=lambda entry: entry[0] % num_buckets):
+            pages.extend([empty] * (bucket_no - bucket))
+            packed = [self.ENTRY.pack(*entry) for entry in group]
+            self.num_entries += len(packed)
+            chunks = [packed[i:i + self.bucket_cap] for i in range(0, len(packed), self.bucket_cap)]
+            page_numbers = [self.num_pages + i for i in range(len(chunks) - 1)]
+            self.num_pages += len(page_numbers)
+            links = page_numbers + [0]
+            pages.append(self._make_bucket(chunks[0], links[0]))
+            for chunk, next_page in zip(chunks[1:], links[1:]):
+                overflow.append(self._make_bucket(chunk, next_page))
+            bucket = bucket_no + 1
+            if len(pages) >= batch:
+                self.buffer_pool.write(self.path, written * PAGE_SIZE, b''.join(pages))
+                written += len(pages)
+                pages = []
+            if len(overflow) >= batch:
+                self.buffer_pool.write(self.path, overflow_written * PAGE_SIZE, b''.join(overflow))
+                overflow_written += len(overflow)
+                overflow = []
+        pages.extend([empty] * (num_buckets - bucket))
+        self.buffer_pool.write(self.path, written * PAGE_SIZE, b''.join(pages))
+        if overflow:
+            self.buffer_pool.write(self.path, overflow_written * PAGE_SIZE, b''.join(overflow))
+        self._write_header()
+
+    def _make_bucket(self, packed, next_page):
+        page = bytearray(PAGE_SIZE)
+        self.BUCKET_HEADER.pack_into(page, 0, len(packed), next_page)
+        data = b''.join(packed)
+        page[self.BUCKET_HEADER.size:self.BUCKET_HEADER.size + len(data)] = data
+        return page
+
+
+class SegmentMap:
+    # метаданные таблицы по отрезкам из SEGMENT_ROWS строк: число живых строк, min/max каждого INT-столбца и
+    # фильтр Блума по значениям каждого VARCHAR-столбца. проход без индекса пропускает отрезки, где искомого
+    # значения быть не может, а поиск отсутствующего значения не читает файл данных вовсе.
+    # min/max и фильтры только расширяются: удаление уменьшает лишь число живых строк, точными их делает VACUUM
+    BLOOM_BYTES = SEGMENT_ROWS * BLOOM_BITS_PER_KEY // 8
+    HEADER = struct.Struct('<QI')
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.int_columns = [i for i, col in enumerate(columns) if col.type == 'INT']
+        self.string_columns = [i for i, col in enumerate(columns) if col.type != 'INT']
+        self.segment_struct = struct.Struct('<I' + 'QQ' * len(self.int_columns))
+        self.dirty = True
+        self.clear()
+
+    def clear(self):
+        # rows - сколько строк файла данных покрыто картой; None - карта не соответствует файлу
+        # и не используется до перестроения
+        self._touch()
+        self.rows = 0
+        self.live = []
+        self.zones = []
+        self.blooms = []
+
+    def _touch(self):
+        # файл карты сохраняется при закрытии и контрольных точках. при первом изменении после сохранения
+        # он удаляется: после сбоя без журнала карты просто нет, и устаревшей она оказаться не может
+        if not self.dirty:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.dirty = True
+
+    def load(self):
+        self.clear()
+        self.dirty = False
+        if not os.path.exists(self.path):
+            self.rows = None
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.rows, count = self.HEADER.unpack_from(data)
+        pos = self.HEADER.size
+        for _ in range(count):
+            live, *zone = self.segment_struct.unpack_from(data, pos)
+            pos += self.segment_struct.size
+            blooms = []
+            for _ in self.string_columns:
+                blooms.append(bytearray(data[pos:pos + self.BLOOM_BYTES]))
+                pos += self.BLOOM_BYTES
+            self.live.append(live)
+            self.zones.append(zone)
+            self.blooms.append(blooms)
+
+    def save(self):
+        if not self.dirty or self.rows is None:
+            return
+        parts = [self.HEADER.pack(self.rows, len(self.live))]
+        for live, zone, blooms in zip(self.live, self.zones, self.blooms):
+            parts.append(self.segment_struct.pack(live, *zone))
+            parts.extend(blooms)
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(b''.join(parts))
+        os.replace(self.path + '.tmp', self.path)
+        self.dirty = False
+
+    def update(self, segment, ints, strings, live, string_key=None):
+        # в отрезок добавляются значения строк: ints / strings - значения по INT- и VARCHAR-столбцам;
+        # string_key переводит хранимое значение VARCHAR в байты, по которым ищет _varchar_key
+        self._touch()
+        while len(self.live) <= segment:
+            self.live.append(0)
+            self.zones.append([MAX_INT, 0] * len(self.int_columns))
+            self.blooms.append([bytearray(self.BLOOM_BYTES) for _ in self.string_columns])
+        self.live[segment] += live
+        zone = self.zones[segment]
+        for n, values in enumerate(ints):
+            zone[2 * n] = min(zone[2 * n], min(values))
+            zone[2 * n + 1] = max(zone[2 * n + 1], max(values))
+        # позиции - как в _bloom_positions; с numpy биты большой пачки ставятся векторно
+        bits = self.BLOOM_BYTES * 8
+        crc32 = zlib.crc32
+        for bloom, values in zip(self.blooms[segment], strings):
+            keys = set(values)
+            vectorized = np is not None and len(keys) >= BLOOM_NUMPY_MIN_KEYS
+            if string_key is not None:
+                keys = map(string_key, keys)
+            if vectorized:
+                h = np.fromiter(map(crc32, keys), dtype=np.uint64)
+                step = ((h >> 17 | h << 15) & 0xFFFFFFFF) | 1
+                target = np.frombuffer(bloom, dtype=np.uint8)
+                for i in range(BLOOM_HASHES):
+                    p = (h + i * step) % bits
+                    np.bitwise_or.at(target, p >> 3, (1 << (p & 7)).astype(np.uint8))
+                continue
+            for key in keys:
+                h = crc32(key)
+                step = ((h >> 17 | h << 15) & 0xFFFFFFFF) | 1
+                p = h % bits
+                for _ in range(BLOOM_HASHES):
+                    bloom[p >> 3] |= 1 << (p & 7)
+                    p = (p + step) % bits
+
+    def delete(self, rows):
+        self._touch()
+        for row in rows:
+            self.live[row // SEGMENT_ROWS] -= 1
+
+    def live_segments(self):
+        return {segment for segment, live in enumerate(self.live) if live}
+
+    def int_segments(self, col_idx, lo, hi):
+        z = 2 * self.int_columns.index(col_idx)
+        return {segment for segment, zone in enumerate(self.zones)
+                if self.live[segment] and zone[z] <= hi and zone[z + 1] >= lo}
+
+    def string_segments(self, col_idx, key):
+        n = self.string_columns.index(col_idx)
+        positions = _bloom_positions(key)
+        return {segment for segment, blooms in enumerate(self.blooms)
+                if self.live[segment] and all(blooms[n][p >> 3] >> (p & 7) & 1 for p in positions)}
+
+
+def _bloom_positions(key):
+    # двойное хеширование: шаг - тот же crc32, повёрнутый на 15 бит. хеш считается на каждое значение
+    # при вставке, поэтому один вызов crc32 на уровне C вместо криптографического хеша
+    h = zlib.crc32(key)
+    step = ((h >> 17 | h << 15) & 0xFFFFFFFF) | 1
+    bits = SegmentMap.BLOOM_BYTES * 8
+    return [(h + i * step) % bits for i in range(BLOOM_HASHES)]
 
 
 class Column:
@@ -12,233 +1169,2717 @@ class Column:
 
 
 class Table:
-    def __init__(self, name, columns):
+    storage = STORAGE_ROW
+    # значения VARCHAR лежат в самой строке (UTF-16, дополненные нулями до длины столбца)
+    inline_strings = True
+
+    def __init__(self, name, columns, vacuum_ratio=None, buffer_pool=None, scan_mode=SCAN_MMAP, create=True,
+                 executor=None, workers=1, directory=''):
         self.name = name
         self.columns = columns
-        self.schema_file = f"{name}.schema.json"
-        self.data_file = f"{name}.dat"
-        # определяем размер строки, 1 байт для числовых данных, 2 байта на символ для строки
-        self.row_size = sum(8 if col.type == 'INT' else col.length * 2 for col in columns)
-        schema = {
-            'columns': [{'name': col.name, 'type': col.type, 'length': col.length} for col in columns]
-        }
-        with open(self.schema_file, 'w') as f:
+        # все файлы таблицы лежат в каталоге базы ('' - текущий каталог)
+        self.directory = directory
+        self.schema_file = os.path.join(directory, name + SCHEMA_SUFFIX)
+        self.data_file = os.path.join(directory, f"{name}.dat")
+        # определяем размер строки: байт флага удаления, 8 байт для числовых данных, 2 байта на символ для строки
+        self.column_widths = [self._column_width(col) for col in columns]
+        self.row_size = 1 + sum(self.column_widths)
+        # вся строка упаковывается одним вызовом; 's' сам дополняет строку нулями до длины столбца
+        self.row_struct = struct.Struct('<B' + ''.join('Q' if col.type == 'INT' else f'{width}s'
+                                                       for col, width in zip(columns, self.column_widths)))
+        self.column_index = {col.name: i for i, col in enumerate(columns)}
+        # скомпилированные декодеры для наборов столбцов из SELECT
+        self._projections = {}
+        # смещение каждого столбца внутри строки
+        self.column_offsets = []
+        pos = 1
+        for width in self.column_widths:
+            self.column_offsets.append(pos)
+            pos += width
+        # полный проход по таблице: через mmap (SCAN_MMAP), страницами буферного пула (SCAN_BUFFERED)
+        # или векторно через numpy (SCAN_NUMPY)
+        if scan_mode == SCAN_NUMPY and np is None:
+            raise ValueError("для режима сканирования numpy нужен установленный пакет numpy")
+        self.scan_mode = scan_mode
+        if np is not None:
+            # строка фиксированной длины ложится на структурный тип numpy без выравнивания
+            self.numpy_dtype = np.dtype([(NUMPY_FLAG_FIELD, 'u1')] + [
+                (col.name, '<u8' if col.type == 'INT' else f'S{width}') for col, width in zip(columns, self.column_widths)])
+        # доля удалённых строк, при которой таблица сжимается автоматически (None - только явный VACUUM)
+        self.vacuum_ratio = vacuum_ratio
+        self.row_count = 0
+        self.dead_rows = 0
+        # True - в схеме на диске вместо счётчика удалённых строк записан None (см. _touch_dead_rows)
+        self.dead_rows_dirty = True
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+        # пул процессов для параллельного полного прохода (общий на базу) и число частей, на которые режется файл
+        self.executor = executor
+        self.workers = workers
+        # журнал упреждающей записи базы; None - изменения пишутся сразу в файлы без журнала
+        self.wal = None
+        # внутри транзакции - смещения строк, помеченных ею удалёнными (по ним ROLLBACK возвращает строки);
+        # None - транзакции нет
+        self.undo = None
+        # внутри транзакции - (размер данных до её первого изменения, поток транзакции): другие потоки
+        # читают таблицу в этом зафиксированном состоянии (см. _snapshot)
+        self.committed = None
+        self.segments = SegmentMap(os.path.join(directory, f"{name}.seg"), columns)
+        # SELECT читают под блокировкой чтения, изменения файлов и индексов - под блокировкой записи;
+        # писателей между собой упорядочивает Database. version растёт, когда смещения строк теряют смысл
+        # (DELETE без условия, DROP, ROLLBACK), - по ней потоковый курсор замечает, что его снимок устарел
+        self.lock = RWLock()
+        self.version = 0
+        # открытые потоковые курсоры по таблице: перед заменой файлов VACUUM дочитывает те из них,
+        # что не держат свои файлы открытыми
+        self.cursors = weakref.WeakSet()
+        # вызывается под блокировкой записи при каждом изменении строк: (таблица, байты вставленных
+        # или удалённых строк, None - изменились неизвестно какие); через него кэш результатов Database
+        # сбрасывает устаревшие записи
+        self.on_change = None
+
+        # каждый INT-столбец автоматически получает B+дерево с именем столбца, остальные индексы - через CREATE INDEX
+        self.index_files = {col.name: os.path.join(directory, f"{name}_{col.name}.idx")
+                            for col in columns if col.type == 'INT'}
+        self.indexes = {}
+        for col_name in self.index_files:
+            self.indexes[col_name] = self._make_index(col_name, (col_name,), INDEX_BTREE)
+
+        if not create:
+            # таблица уже лежит на диске - файлы не трогаем, индексы из CREATE INDEX берутся из схемы
+            # и читаются только в open_indexes()
+            self.row_count = self._data_size() // self.row_size
+            with open(self.schema_file) as f:
+                schema = json.load(f)
+            for spec in schema.get('indexes', []):
+                self.indexes[spec['name']] = self._make_index(spec['name'], spec['columns'], spec['kind'])
+            self.dead_rows = schema.get('dead_rows', 0)
+            self.dead_rows_dirty = self._dead_rows is None
+            self.segments.load()
+            return
+        self._truncate_data(0)
+        for index in self.indexes.values():
+            index.create()
+        self._write_schema()
+
+    def open_indexes(self):
+        for index in self.indexes.values():
+            index.open()
+
+    @property
+    def dead_rows(self):
+        # None - счётчик на диске не сходится с флагами строк (сбой посреди DELETE или VACUUM):
+        # тогда он считается проходом при первом обращении, и быстрый COUNT(*) не видит устаревшего значения
+        if self._dead_rows is None:
+            self._dead_rows = self.row_count - sum(1 for _ in self._scan_matching(None))
+        return self._dead_rows
+
+    @dead_rows.setter
+    def dead_rows(self, value):
+        self._dead_rows = value
+
+    def drop(self):
+        with self.lock.write():
+            self.version += 1
+            self._changed()
+            self._drop_files()
+
+    def _changed(self, rows=None):
+        if self.on_change is not None:
+            self.on_change(self, rows)
+
+    def _drop_files(self):
+        for index in self.indexes.values():
+            index.close()
+            os.remove(index.path)
+        for path in self._data_files():
+            self.buffer_pool.invalidate(path)
+            os.remove(path)
+        if os.path.exists(self.segments.path):
+            os.remove(self.segments.path)
+        os.remove(self.schema_file)
+
+    # хранение строк. смещение строки - её номер, умноженный на row_size; индексы, журнал и DELETE
+    # работают со смещениями и обращаются к файлам только через эти методы
+    def _data_files(self):
+        return [self.data_file]
+
+    def _data_size(self):
+        return self.buffer_pool.size(self.data_file)
+
+    def _write_rows(self, offset, data):
+        self.buffer_pool.write(self.data_file, offset, data)
+
+    def _mark_deleted(self, offset):
+        self._write_flag(offset, ROW_DELETED_FLAG)
+
+    def _write_flag(self, offset, flag):
+        self.buffer_pool.write(self.data_file, offset, flag)
+
+    def _truncate_data(self, size):
+        for path in self._data_files():
+            self.buffer_pool.invalidate(path)
+        with open(self.data_file, 'ab') as f:
+            f.truncate(size)
+
+    def _write_schema(self):
+        self._save_schema(self._schema())
+        self.segments.save()
+
+    def _touch_dead_rows(self):
+        # вызывается перед изменением флагов строк. как и файл карты отрезков (SegmentMap._touch), счётчик
+        # удалённых строк в схеме при первом изменении после сохранения заменяется на None: таблица, открытая
+        # после сбоя, пересчитает его проходом, а не увидит старое значение. следующие DELETE схему
+        # не переписывают - счётчик сохраняется при закрытии базы и в контрольных точках журнала
+        if not self.dead_rows_dirty:
+            self._save_dead_rows(known=False)
+
+    def _save_dead_rows(self, known=True):
+        schema = self._schema()
+        if not known:
+            schema['dead_rows'] = None
+        self._save_schema(schema)
+
+    def _save_schema(self, schema):
+        # схема заменяется целиком через временный файл, чтобы сбой не оставил её недописанной
+        tmp_file = self.schema_file + '.tmp'
+        with open(tmp_file, 'w') as f:
             json.dump(schema, f)
+        os.replace(tmp_file, self.schema_file)
+        self.dead_rows_dirty = schema['dead_rows'] is None
 
-        open(self.data_file, 'wb').close()
-        self.index_files = {col.name: f"{name}_{col.name}.idx" for col in columns if col.type == 'INT'}
+    def _schema(self):
+        return {
+            'columns': [{'name': col.name, 'type': col.type, 'length': col.length} for col in self.columns],
+            'indexes': [{'name': index_name, 'columns': list(index.columns), 'kind': index.kind}
+                        for index_name, index in self.indexes.items() if index_name not in self.index_files],
+            # счётчик удалённых строк сохраняется, чтобы не считать его проходом при открытии (см. _touch_dead_rows)
+            'dead_rows': self.dead_rows,
+            'storage': self.storage,
+        }
 
-        for col in columns:
-            if col.type == 'INT':
-                open(self.index_files[col.name], 'wb').close()
+    def _make_index(self, index_name, columns, kind):
+        if kind == INDEX_BTREE:
+            index = BPlusTree(os.path.join(self.directory, f"{self.name}_{index_name}.idx"), len(columns),
+                              self.buffer_pool)
+        else:
+            index = HashIndex(os.path.join(self.directory, f"{self.name}_{index_name}.hidx"), self.buffer_pool)
+        index.columns = tuple(columns)
+        index.kind = kind
+        index.key_of = self._compile_index_key(columns, kind)
+        return index
+
+    def _compile_index_key(self, columns, kind):
+        # ключ индекса достаётся прямо из байт строки: кортеж чисел для B+дерева, хеш сырых байт для хеш-индекса
+        indices = [self._get_column_index(col) for col in columns]
+        fields = [(self.column_offsets[i], self.column_widths[i]) for i in indices]
+        if kind == INDEX_BTREE:
+            unpack_int = INT_STRUCT.unpack_from
+            if len(fields) == 1:
+                col_offset = fields[0][0]
+                return lambda row_data: (unpack_int(row_data, col_offset)[0],)
+            return lambda row_data: tuple(unpack_int(row_data, col_offset)[0] for col_offset, _ in fields)
+        if self.inline_strings or all(self.columns[i].type == 'INT' for i in indices):
+            return lambda row_data: HashIndex.hash_key(b''.join(row_data[o:o + width] for o, width in fields))
+        string_bytes = self._string_bytes
+        fields = [(o, width, self.columns[i].type != 'INT') for i, (o, width) in zip(indices, fields)]
+        return lambda row_data: HashIndex.hash_key(b''.join(
+            string_bytes(row_data[o:o + width]) if is_string else row_data[o:o + width] for o, width, is_string in fields))
+
+    def create_index(self, index_name, columns):
+        if index_name in self.indexes:
+            raise ValueError(f"Индекс '{index_name}' уже существует")
+        types = [self.columns[self._get_column_index(col)].type for col in columns]
+        if len(set(columns)) != len(columns):
+            raise ValueError("столбцы индекса не должны повторяться")
+        if len(columns) == 1 and types[0] == 'INT':
+            raise ValueError(f"INT-столбец '{columns[0]}' уже проиндексирован")
+        # только INT - упорядоченное составное B+дерево, иначе хеш по значениям всех столбцов
+        kind = INDEX_BTREE if all(col_type == 'INT' for col_type in types) else INDEX_HASH
+        index = self._make_index(index_name, columns, kind)
+        if self.wal is not None:
+            # при сбое посреди построения индексы таблицы перестраиваются при восстановлении
+            self.wal.log(WAL_REINDEX, self.name)
+            self.wal.commit()
+        # индекс по уже существующим данным строится одной загрузкой; пока он не добавлен в таблицу,
+        # SELECT его не видят и идут параллельно с построением
+        with self.lock.read():
+            self._load_index(index, [(index.key_of(row_data), offset)
+                                     for offset, row_data in self._scan_matching(None)])
+        with self.lock.write():
+            self.indexes[index_name] = index
+        self._write_schema()
+        if self.wal is not None:
+            self.wal.checkpoint()
+
+    def rebuild_indexes(self):
+        # все индексы и счётчики строк заново по файлу данных
+        live = list(self._scan_matching(None))
+        for index in self.indexes.values():
+            self._load_index(index, [(index.key_of(row_data), offset) for offset, row_data in live])
+        self.row_count = self._data_size() // self.row_size
+        self.dead_rows = self.row_count - len(live)
+        self.segments.clear()
+        self._add_to_segments((offset // self.row_size, row_data) for offset, row_data in live)
+        self.segments.rows = self.row_count
+
+    def _load_index(self, index, entries):
+        if index.kind == INDEX_BTREE:
+            index.bulk_load(sorted(key + (offset,) for key, offset in entries))
+        else:
+            index.bulk_load(entries)
 
     def insert(self, values):
-        if len(values) != len(self.columns):
-            raise ValueError("количество значений не совпадает с количеством столбцов")
+        self.insert_many([values])
 
-        row_data = b''
-        for col, val in zip(self.columns, values):
-            if col.type == 'INT':
-                row_data += struct.pack('Q', int(val))
-            elif 'VARCHAR' in col.type:
-                val_str = str(val)
-                encoded = val_str.encode('utf-16')
-                if len(encoded) % 2 != 0:
-                    encoded = encoded[:-1]
-                row_data += encoded.ljust(col.length * 2, b'\0')
+    def insert_many(self, rows):
+        # все строки кодируются в один буфер и дописываются одной записью, индексы обновляются пачкой.
+        # кодирование идёт до блокировки записи: читатели ждут только саму запись
+        buffer = self._encode_rows(rows)
+        if not buffer:
+            return
 
-        with open(self.data_file, 'ab') as f:
-            offset = f.tell()
-            f.write(row_data)
-        for col, val in zip(self.columns, values):
-            if col.type == 'INT':
-                with open(self.index_files[col.name], 'ab') as idx_f:
-                    idx_f.write(struct.pack('QQ', int(val), offset))
-
-    def select(self, columns='*', where=None):
-        results = []
-        if where and where[0] in self.index_files:
-            col_name, op, val = where
-            if op == '=':
-                with open(self.index_files[col_name], 'rb') as idx_f:
-                    while True:
-                        index_data = idx_f.read(16)
-                        if not index_data:
-                            break
-                        idx_val, offset = struct.unpack('QQ', index_data)
-                        if idx_val == int(val):
-                            with open(self.data_file, 'rb') as f:
-                                f.seek(offset)
-                                row_data = f.read(self.row_size)
-                                row = self._parse_row(row_data)
-                                if columns == '*':
-                                    results.append(row)
-                                else:
-                                    col_indices = [self._get_column_index(col) for col in columns]
-                                    results.append([row[i] for i in col_indices])
+        data = b''.join(buffer)
+        with self.lock.write():
+            if self.wal is not None:
+                # запись журнала - физическая: смещение и байты строк, повтор при восстановлении идемпотентен
+                self.wal.log(WAL_INSERT, self.name, INT_STRUCT.pack(self._data_size()) + data)
+            first_offset = self._data_size()
+            self._write_rows(first_offset, data)
+            self.row_count += len(buffer)
+            first_row = first_offset // self.row_size
+            if self.segments.rows == first_row:
+                self._add_to_segments(enumerate(buffer, first_row))
+                self.segments.rows = self.row_count
+            for index in self.indexes.values():
+                key_of = index.key_of
+                index.insert_many((key_of(row_data), first_offset + n * self.row_size)
+                                  for n, row_data in enumerate(buffer))
+            self._changed(buffer)
+
+    def bulk_load(self, rows):
+        # массовая загрузка (COPY): строки кодируются пачками по COPY_CHUNK_ROWS прямо в файлы данных, а записи
+        # индексов копятся во временных файлах и после загрузки сортируются внешней сортировкой, так что каждый
+        # индекс строится одним проходом. строки не пишутся в журнал: загрузку фиксирует контрольная точка
+        # в конце, а при сбое посреди неё восстановление отрезает файлы по прошлой точке. возвращает число строк
+        rows = iter(rows)
+        chunk = list(itertools.islice(rows, COPY_CHUNK_ROWS))
+        if len(chunk) < COPY_CHUNK_ROWS and len(chunk) * BULK_MERGE_RATIO < self.row_count - self.dead_rows:
+            # немного строк в большую таблицу - обычная вставка дешевле перестроения индексов
+            self.insert_many(chunk)
+            return len(chunk)
+        wal = self.wal
+        if wal is not None:
+            wal.log(WAL_REINDEX, self.name)
+            wal.commit()
+        loaded = 0
+        spill_dir = tempfile.mkdtemp(prefix='copy_', dir=self.directory or None)
+        try:
+            with self.lock.write():
+                start_size = self._data_size()
+                spill_files = {index_name: os.path.join(spill_dir, index_name) for index_name in self.indexes}
+                try:
+                    self.wal = None
+                    loaded = self._load_chunks(chunk, rows, spill_files)
+                except BaseException:
+                    # строки неудачной загрузки отрезаются; индексы ещё не тронуты, карта отрезков строится заново
+                    self._truncate_data(start_size)
+                    self.row_count = start_size // self.row_size
+                    self.segments.clear()
+                    self._add_to_segments((offset // self.row_size, row_data)
+                                          for offset, row_data in self._scan_matching(None))
+                    self.segments.rows = self.row_count
+                    raise
+                finally:
+                    self.wal = wal
+                for index_name, index in self.indexes.items():
+                    self._load_spilled_index(index, spill_files[index_name], spill_dir)
+                self._changed()
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        if wal is not None:
+            wal.checkpoint()
+        return loaded
+
+    def _load_chunks(self, chunk, rows, spill_files):
+        # записи индексов пишутся упакованными (_spill_packer); прежние записи индексов выгружаются туда же
+        packers = {}
+        files = {}
+        try:
+            for index_name, index in self.indexes.items():
+                f = files[index_name] = open(spill_files[index_name], 'wb')
+                packers[index_name] = _spill_packer(index)
+                if index.kind == INDEX_BTREE:
+                    for entry in index._iter_from(bytes(index.entry_size)):
+                        f.write(entry)
+                else:
+                    for entry in index:
+                        f.write(HashIndex.ENTRY.pack(*entry))
+            loaded = 0
+            row_size = self.row_size
+            while chunk:
+                buffer = self._encode_rows(chunk)
+                first_offset = self._data_size()
+                self._write_rows(first_offset, b''.join(buffer))
+                self.row_count += len(buffer)
+                first_row = first_offset // row_size
+                if self.segments.rows == first_row:
+                    self._add_to_segments(enumerate(buffer, first_row))
+                    self.segments.rows = self.row_count
+                for index_name, index in self.indexes.items():
+                    key_of = index.key_of
+                    pack = packers[index_name]
+                    files[index_name].write(b''.join(pack(key_of(row_data), first_offset + n * row_size)
+                                                     for n, row_data in enumerate(buffer)))
+                loaded += len(buffer)
+                chunk = list(itertools.islice(rows, COPY_CHUNK_ROWS))
+            return loaded
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _load_spilled_index(self, index, path, spill_dir):
+        if index.kind == INDEX_BTREE:
+            entries = _external_sort(path, index.entry_size, spill_dir)
+            index.bulk_load(map(index.entry_struct.unpack, entries))
+            return
+        entry_size = HashIndex.ENTRY.size
+        num_buckets = HashIndex.buckets_for(os.path.getsize(path) // entry_size)
+        entries = _external_sort(path, entry_size, spill_dir,
+                                 key=lambda record: int.from_bytes(record[:8], 'little') % num_buckets)
+        index.load_sorted(map(HashIndex.ENTRY.unpack, entries), num_buckets)
+
+    def _add_to_segments(self, numbered_rows, segments=None):
+        # (номер строки, байты строки) по возрастанию номеров раскладываются по отрезкам карты
+        # (по умолчанию - текущей карты таблицы)
+        unpack = self.row_struct.unpack
+        segments = segments if segments is not None else self.segments
+        for segment, group in itertools.groupby(numbered_rows, key=lambda item: item[0] // SEGMENT_ROWS):
+            fields = list(zip(*(unpack(row_data) for _, row_data in group)))
+            segments.update(segment, [fields[i + 1] for i in segments.int_columns],
+                            [fields[i + 1] for i in segments.string_columns], len(fields[0]),
+                            None if self.inline_strings else self._string_bytes)
+
+    def _segment_candidates(self, where):
+        # номера отрезков, где могут быть строки под условием; None - карта не покрывает файл
+        segments = self.segments
+        if segments.rows != self._data_size() // self.row_size:
+            return None
+        if _is_compound(where):
+            conjunction, conditions = where
+            parts = [self._segment_candidates(condition) for condition in conditions]
+            if conjunction == 'AND':
+                return set.intersection(*parts)
+            return set.union(*parts)
+        col_name, op, val = where
+        col_idx = self._get_column_index(col_name)
+        col = self.columns[col_idx]
+        if col.type == 'INT':
+            bounds = _int_bounds(op, val)
+            return segments.int_segments(col_idx, *bounds) if bounds is not None else set()
+        if op == '=':
+            return segments.string_segments(col_idx, self._varchar_key(col, val))
+        return segments.live_segments()
+
+    def _segment_ranges(self, where):
+        # отрезки-кандидаты как байтовые диапазоны файла данных, соседние склеены; без карты - весь файл
+        size = self._data_size()
+        candidates = self._segment_candidates(where) if where else None
+        if candidates is None:
+            return [(0, size)] if size else []
+        step = SEGMENT_ROWS * self.row_size
+        ranges = []
+        for segment in sorted(candidates):
+            start, end = segment * step, min((segment + 1) * step, size)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def _encode_rows(self, rows):
+        buffer = []
+        for values in rows:
+            if len(values) != len(self.columns):
+                raise ValueError("количество значений не совпадает с количеством столбцов")
+            buffer.append(self._encode_row(values))
+        return buffer
+
+    def _encode_row(self, values):
+        fields = [int(val) if col.type == 'INT' else str(val).encode('utf-16')
+                  for col, val in zip(self.columns, values)]
+        return self.row_struct.pack(ROW_LIVE, *fields)
+
+    def select(self, columns='*', where=None, limit=None, offset=0):
+        return list(self.iter_select(columns, where, limit, offset))
+
+    def iter_select(self, columns='*', where=None, limit=None, offset=0, group_by=None):
+        # ленивая выборка: строки декодируются по одной, и чтение файла прекращается, как только набран LIMIT
+        if group_by or (columns != '*' and any(not isinstance(col, str) for col in columns)):
+            rows = iter(self.aggregate(columns, where, group_by or ()))
         else:
-            with open(self.data_file, 'rb') as f:
-                offset = 0
-                while True:
-                    f.seek(offset)
-                    row_data = f.read(self.row_size)
-                    if not row_data:
-                        break
-                    row = self._parse_row(row_data)
-                    if where:
-                        col_name, op, val = where
-                        col_idx = self._get_column_index(col_name)
-                        col_type = self.columns[col_idx].type
-                        if col_type == 'INT':
-                            val = int(val)
-                        if op == '=' and row[col_idx] != val:
-                            offset += self.row_size
-                            continue
-                    if columns == '*':
-                        results.append(row)
-                    else:
-                        col_indices = [self._get_column_index(col) for col in columns]
-                        results.append([row[i] for i in col_indices])
-                    offset += self.row_size
-        return results
+            rows = self._iter_rows(columns, where)
+        if offset or limit is not None:
+            rows = itertools.islice(rows, offset, None if limit is None else offset + limit)
+        return rows
 
-    def delete(self, where=None):
-        if where:
-            col_name, op, val = where
-            if col_name in self.index_files and op == '=':
-                with open(self.index_files[col_name], 'rb') as idx_f:
-                    offsets_to_delete = []
-                    while True:
-                        index_data = idx_f.read(16)
-                        if not index_data:
-                            break
-                        idx_val, offset = struct.unpack('QQ', index_data)
-                        if idx_val == int(val):
-                            offsets_to_delete.append(offset)
-                with open(self.data_file, 'rb') as f:
-                    new_data = b''
-                    offset = 0
-                    while True:
-                        f.seek(offset)
-                        row_data = f.read(self.row_size)
-                        if not row_data:
-                            break
-                        if offset not in offsets_to_delete:
-                            new_data += row_data
-                        offset += self.row_size
-                with open(self.data_file, 'wb') as f:
-                    f.write(new_data)
-                for idx_file in self.index_files.values():
-                    open(idx_file, 'wb').close()
-                with open(self.data_file, 'rb') as f:
-                    offset = 0
-                    while True:
-                        f.seek(offset)
-                        row_data = f.read(self.row_size)
-                        if not row_data:
-                            break
-                        row = self._parse_row(row_data)
-                        for col, val in zip(self.columns, row):
-                            if col.type == 'INT':
-                                with open(self.index_files[col.name], 'ab') as idx_f:
-                                    idx_f.write(struct.pack('QQ', val, offset))
-                        offset += self.row_size
+    def _iter_rows(self, columns, where):
+        # декодируются только запрошенные столбцы, условие WHERE проверяется по сырым байтам
+        snapshot = self._snapshot()
+        if snapshot is None and self._use_parallel_scan() and (not where or self._index_offsets(where) is None):
+            # фильтрация и проекция целиком на стороне процессов, обратно приходят готовые строки
+            yield from self._parallel_scan(where, columns)
+            return
+        decode = self._projection(columns)
+        for offset, row_data in self._matching_rows(where, snapshot):
+            yield decode(row_data)
+
+    def aggregate(self, columns, where=None, group_by=()):
+        # столбцы SELECT - имена из GROUP BY и агрегаты (функция, столбец или '*').
+        # потоковая хеш-агрегация: читаются только нужные столбцы, в памяти - по состоянию на группу
+        aggregates = []
+        for item in columns:
+            if isinstance(item, str):
+                if item not in group_by:
+                    raise ValueError(f"Столбец '{item}' должен входить в GROUP BY")
+                continue
+            func, arg = item
+            if arg == '*':
+                if func != 'COUNT':
+                    raise ValueError(f"{func}(*) не поддерживается")
+            elif func in ('SUM', 'AVG') and self.columns[self._get_column_index(arg)].type != 'INT':
+                raise ValueError(f"{func} применим только к INT-столбцам")
+            aggregates.append(item)
+        if not group_by and self._snapshot() is None:
+            values = self._index_aggregates(aggregates, where)
+            if values is not None:
+                return [values]
+
+        needed = list(dict.fromkeys(list(group_by) + [arg for _, arg in aggregates if arg != '*']))
+        position = {col_name: n for n, col_name in enumerate(needed)}
+        key_positions = [position[col_name] for col_name in group_by]
+        # состояние группы: [число строк, значение агрегата 1, ...]; COUNT обходится числом строк,
+        # AVG копит сумму и делится в конце
+        updates = [(slot, AGGREGATE_COMBINE[func], position[arg])
+                   for slot, (func, arg) in enumerate(aggregates, 1) if func != 'COUNT']
+        groups = {}
+        for row in self._iter_rows(needed, where):
+            key = tuple([row[n] for n in key_positions])
+            state = groups.get(key)
+            if state is None:
+                state = groups[key] = [0] + [None] * len(aggregates)
+            state[0] += 1
+            for slot, combine, n in updates:
+                current = state[slot]
+                state[slot] = row[n] if current is None else combine(current, row[n])
+        if not groups and not group_by:
+            # агрегат без GROUP BY по пустой выборке - одна строка: COUNT = 0, остальное None
+            groups[()] = [0] + [None] * len(aggregates)
+
+        result = []
+        for key, state in groups.items():
+            count = state[0]
+            row = []
+            slot = 1
+            for item in columns:
+                if isinstance(item, str):
+                    row.append(key[group_by.index(item)])
+                    continue
+                func = item[0]
+                if func == 'COUNT':
+                    row.append(count)
+                elif func == 'AVG':
+                    row.append(state[slot] / count if count else None)
+                else:
+                    row.append(state[slot])
+                slot += 1
+            result.append(row)
+        return result
+
+    def _index_aggregates(self, aggregates, where):
+        # COUNT(*) - по счётчикам таблицы или по записям B+дерева, MIN/MAX по INT-столбцу без WHERE -
+        # по первой живой записи с нужного края дерева. None, если хотя бы один агрегат требует прохода
+        values = []
+        for func, arg in aggregates:
+            if func == 'COUNT':
+                value = self._index_count(where)
+            elif func in ('MIN', 'MAX') and where is None and self._btree_for(arg) is not None:
+                value = self._index_extreme(self._btree_for(arg), func == 'MAX')
             else:
-                with open(self.data_file, 'rb') as f:
-                    new_data = b''
-                    offset = 0
+                return None
+            if value is None and func == 'COUNT':
+                return None
+            values.append(value)
+        return values
+
+    def _index_count(self, where):
+        if where is None:
+            return self.row_count - self.dead_rows
+        if _is_compound(where) or self.columns[self._get_column_index(where[0])].type != 'INT':
+            return None
+        offsets = self._leaf_index_offsets(where)
+        if offsets is None:
+            return None
+        if not self.dead_rows:
+            return sum(1 for _ in offsets)
+        # B+деревья хранят записи удалённых строк до VACUUM - у них проверяется только байт флага
+        return sum(1 for offset in offsets if self._is_live(offset))
+
+    def _index_extreme(self, btree, largest):
+        for entry in (btree.iter_reverse() if largest else iter(btree)):
+            if not self.dead_rows or self._is_live(entry[-1]):
+                return entry[0]
+        return None
+
+    def _is_live(self, offset):
+        return self.buffer_pool.read(self.data_file, offset, 1) == ROW_LIVE_FLAG
+
+    def _use_parallel_scan(self):
+        return (self.executor is not None and self.workers > 1 and self.scan_mode != SCAN_NUMPY
+                and self.row_count >= PARALLEL_SCAN_MIN_ROWS)
+
+    def _parallel_scan(self, where, columns):
+        # файл режется на куски по границам строк, каждый процесс сам фильтрует и проецирует свой кусок;
+        # результаты отдаются в порядке смещений
+        # кусками режутся только отрезки, которые не исключила карта отрезков
+        ranges = self._segment_ranges(where)
+        step = -(-sum(end - start for start, end in ranges) // self.row_size // self.workers) * self.row_size
+        spec = (self.name, os.path.abspath(self.directory), [(col.name, col.type) for col in self.columns],
+                self.storage)
+        futures = [self.executor.submit(_scan_partition, spec, where, columns, pos, min(pos + step, end))
+                   for start, end in ranges for pos in range(start, end, step)]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _pins_snapshot(self, where):
+        # True, если проход для SELECT держит открытыми файлы, с которых начал: mmap и numpy по строкам
+        # со строками внутри, файлы столбцов и блоков. выборка по индексу, буферный пул, куча и параллельный
+        # проход читают файлы по имени при каждом обращении
+        if where and self._index_offsets(where) is not None:
+            return False
+        return self.inline_strings and self.scan_mode in (SCAN_MMAP, SCAN_NUMPY) and not self._use_parallel_scan()
+
+    def _snapshot(self):
+        # вызывается под блокировкой чтения. если таблицу изменила открытая транзакция другого потока -
+        # (размер данных до транзакции, смещения помеченных ею строк): читатель видит только зафиксированные
+        # строки, поэтому дописанные транзакцией строки для него не существуют, а помеченные ею удалёнными
+        # ещё живы. None - таблица читается как есть
+        if self.committed is None:
+            return None
+        size, thread = self.committed
+        if thread == threading.get_ident():
+            return None
+        return size, frozenset(self.undo)
+
+    def _matching_rows(self, where, snapshot=None):
+        # живые строки под условием: по индексу, если он применим, иначе полным проходом;
+        # snapshot - зафиксированное состояние из _snapshot
+        offsets = self._index_offsets(where) if where else None
+        if offsets is None:
+            yield from self._scan_visible(where, snapshot)
+            return
+        yield from self._fetch_rows(_with_undone(offsets, snapshot), where, snapshot)
+
+    def _fetch_rows(self, offsets, where, snapshot=None):
+        # строки из индекса перепроверяются: у хеш-индекса бывают совпадения хешей.
+        # со snapshot строки, помеченные удалёнными транзакцией, считаются живыми
+        predicate = self._compile_predicate(where) if where else None
+        # строки, дописанные после начала чтения, не видны (снимок для потокового курсора)
+        end = self._data_size()
+        undone = ()
+        if snapshot is not None:
+            end, undone = snapshot
+        for offset in offsets:
+            if offset >= end:
+                continue
+            row_data = self._read_row(offset)
+            if row_data[0] != ROW_LIVE:
+                if offset not in undone:
+                    continue
+                row_data = ROW_LIVE_FLAG + row_data[1:]
+            if predicate is None or predicate(row_data, 0):
+                yield offset, row_data
+
+    def _scan_visible(self, where, snapshot):
+        # полный проход в зафиксированном состоянии: строки транзакции отрезаются по размеру, а помеченные ею
+        # читаются по смещениям и вливаются в проход на свои места
+        if snapshot is None:
+            yield from self._scan_matching(where)
+            return
+        size, undone = snapshot
+        predicate = self._compile_predicate(where) if where else None
+        restored = []
+        for offset in sorted(undone):
+            if offset < size:
+                row_data = ROW_LIVE_FLAG + self._read_row(offset)[1:]
+                if predicate is None or predicate(row_data, 0):
+                    restored.append((offset, row_data))
+        committed = ((offset, row_data) for offset, row_data in self._scan_matching(where) if offset < size)
+        yield from heapq.merge(committed, restored, key=operator.itemgetter(0))
+
+    def _index_offsets(self, where):
+        # смещения строк-кандидатов по индексам или None, если условие требует полного прохода
+        if not _is_compound(where):
+            return self._leaf_index_offsets(where)
+        conjunction, conditions = where
+        if conjunction == 'OR':
+            # объединение допустимо, только если каждую ветку можно взять из индекса
+            parts = [self._index_offsets(condition) for condition in conditions]
+            if any(part is None for part in parts):
+                return None
+            return sorted(set(itertools.chain.from_iterable(parts)))
+        offsets = self._composite_index_offsets(conditions)
+        if offsets is not None:
+            return offsets
+        # пересечение результатов всех индексов, подходящих к отдельным условиям
+        parts = [part for part in map(self._index_offsets, conditions) if part is not None]
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        result = set(parts[0])
+        for part in parts[1:]:
+            result.intersection_update(part)
+        return sorted(result)
+
+    def _btree_for(self, col_name):
+        # B+дерево, ведущий столбец которого - col_name: собственное дерево INT-столбца или составное
+        btree = self.indexes.get(col_name) if col_name in self.index_files else None
+        if btree is None:
+            btree = next((index for index in self.indexes.values()
+                          if index.kind == INDEX_BTREE and index.columns[0] == col_name), None)
+        return btree
+
+    def _leaf_index_offsets(self, where):
+        col_name, op, val = where
+        btree = self._btree_for(col_name)
+        if btree is not None:
+            bounds = _int_bounds(op, val)
+            if bounds is None:
+                return iter(())
+            lo, hi = bounds
+            if lo == hi:
+                return btree.search((lo,))
+            return btree.range(lo, hi)
+        if op == '=':
+            for index in self.indexes.values():
+                if index.kind == INDEX_HASH and index.columns == (col_name,):
+                    return index.search(HashIndex.hash_key(self._raw_key(where)[1]))
+        return None
+
+    def _composite_index_offsets(self, conditions):
+        # составной индекс, у которого на равенства из AND приходится больше одного ведущего столбца
+        equalities = {}
+        for condition in conditions:
+            if not _is_compound(condition) and condition[1] == '=':
+                equalities.setdefault(condition[0], condition)
+        best, best_prefix = None, 1
+        for index in self.indexes.values():
+            if len(index.columns) < 2:
+                continue
+            if index.kind == INDEX_HASH:
+                if all(col in equalities for col in index.columns) and len(index.columns) > best_prefix:
+                    best, best_prefix = index, len(index.columns)
+                continue
+            prefix = 0
+            while prefix < len(index.columns) and index.columns[prefix] in equalities:
+                prefix += 1
+            if prefix > best_prefix:
+                best, best_prefix = index, prefix
+        if best is None:
+            return None
+        if best.kind == INDEX_HASH:
+            key = b''.join(self._raw_key(equalities[col])[1] for col in best.columns)
+            return best.search(HashIndex.hash_key(key))
+        return best.search(tuple(int(equalities[col][2]) for col in best.columns[:best_prefix]))
+
+    # представление VARCHAR: ширина поля в строке, ключ для сравнения на равенство и хеш-индекса, декодирование.
+    # HeapTable переопределяет их, храня в строке только ссылку на значение
+    def _column_width(self, col):
+        return 8 if col.type == 'INT' else col.length * 2
+
+    def _varchar_key(self, col, val):
+        return str(val).encode('utf-16')[:col.length * 2].ljust(col.length * 2, b'\0')
+
+    def _string_decoder(self):
+        return _decode_varchar
+
+    def _searchable_condition(self, where):
+        # равенство, байты значения которого можно искать прямо в файле данных
+        condition = _equality_condition(where)
+        if condition is None or self.inline_strings or self.columns[self._get_column_index(condition[0])].type == 'INT':
+            return condition
+        return None
+
+    def _raw_key(self, where):
+        # значение из WHERE в том виде, в каком оно лежит в строке: так сравнение идёт по сырым байтам без декодирования
+        col_name, op, val = where
+        if op != '=':
+            raise ValueError(f"неподдерживаемый оператор '{op}'")
+        col_idx = self._get_column_index(col_name)
+        col = self.columns[col_idx]
+        if col.type == 'INT':
+            key = struct.pack('<Q', int(val))
+        else:
+            key = self._varchar_key(col, val)
+        return self.column_offsets[col_idx], key
+
+    def _field_bytes(self, col_name):
+        # функция байты строки -> значение столбца в том виде, в каком его возвращает _raw_key
+        col_idx = self._get_column_index(col_name)
+        col_offset = self.column_offsets[col_idx]
+        end = col_offset + self.column_widths[col_idx]
+        if self.inline_strings or self.columns[col_idx].type == 'INT':
+            return lambda row_data: bytes(row_data[col_offset:end])
+        string_bytes = self._string_bytes
+        return lambda row_data: string_bytes(row_data[col_offset:end])
+
+    def _compile_predicate(self, where):
+        # условие превращается в функцию (буфер, начало строки) -> bool, работающую по сырым байтам;
+        # INT сравнивается как число без разбора строки, VARCHAR декодируется только для сравнений порядка
+        if _is_compound(where):
+            conjunction, conditions = where
+            predicates = [self._compile_predicate(condition) for condition in conditions]
+            if conjunction == 'AND':
+                return lambda buf, pos: all(predicate(buf, pos) for predicate in predicates)
+            return lambda buf, pos: any(predicate(buf, pos) for predicate in predicates)
+        col_name, op, val = where
+        col_idx = self._get_column_index(col_name)
+        col = self.columns[col_idx]
+        col_offset = self.column_offsets[col_idx]
+        if col.type == 'INT':
+            bounds = _int_bounds(op, val)
+            if bounds is None:
+                return lambda buf, pos: False
+            lo, hi = bounds
+            unpack_int = INT_STRUCT.unpack_from
+            return lambda buf, pos: lo <= unpack_int(buf, pos + col_offset)[0] <= hi
+        width = self.column_widths[col_idx]
+        if op == '=':
+            _, key = self._raw_key(where)
+            if self.inline_strings:
+                return lambda buf, pos: buf[pos + col_offset:pos + col_offset + width] == key
+            equals = self._string_equals(key)
+            return lambda buf, pos: equals(buf[pos + col_offset:pos + col_offset + width])
+        compare = _string_comparison(op, val)
+        decode = self._string_decoder()
+        return lambda buf, pos: compare(decode(buf[pos + col_offset:pos + col_offset + width]))
+
+    def _scan_matching(self, where=None):
+        # живые строки, подходящие под WHERE, в порядке файла: (смещение, байты строки)
+        if self._use_parallel_scan():
+            yield from self._parallel_scan(where, None)
+            return
+        if self.scan_mode == SCAN_MMAP:
+            yield from self._mmap_scan(where, self._segment_ranges(where))
+            return
+        if self.scan_mode == SCAN_NUMPY:
+            yield from self._numpy_scan(where)
+            return
+        predicate = self._compile_predicate(where) if where else None
+        for offset, row_data in self._scan_rows():
+            if row_data[0] != ROW_LIVE:
+                continue
+            if predicate is not None and not predicate(row_data, 0):
+                continue
+            yield offset, row_data
+
+    def _numpy_view(self, mode='r'):
+        rows = os.path.getsize(self.data_file) // self.row_size
+        if not rows:
+            return None
+        return np.memmap(self.data_file, dtype=self.numpy_dtype, mode=mode, shape=(rows,))
+
+    def _numpy_mask(self, part, where):
+        # условие считается булевой маской сразу по всему куску столбца
+        mask = part[NUMPY_FLAG_FIELD] == ROW_LIVE
+        if where:
+            mask &= self._numpy_condition(part, where)
+        return mask
+
+    def _numpy_condition(self, part, where):
+        if _is_compound(where):
+            conjunction, conditions = where
+            masks = [self._numpy_condition(part, condition) for condition in conditions]
+            combine = np.logical_and.reduce if conjunction == 'AND' else np.logical_or.reduce
+            return combine(masks)
+        col_name, op, val = where
+        # имя проверяется до обращения к полю: неизвестный столбец - та же ошибка, что и в остальных режимах
+        col = self.columns[self._get_column_index(col_name)]
+        values = part[col_name]
+        if col.type == 'INT':
+            bounds = _int_bounds(op, val)
+            if bounds is None:
+                return np.zeros(len(part), dtype=bool)
+            lo, hi = bounds
+            if lo == hi:
+                return values == np.uint64(lo)
+            return (values >= np.uint64(lo)) & (values <= np.uint64(hi))
+        if op == '=':
+            return values == self._raw_key(where)[1]
+        # порядок строк в UTF-16 не совпадает с порядком байт, поэтому такие сравнения идут по декодированным значениям;
+        # numpy обрезает нулевые байты в конце, их нужно вернуть до чётной длины
+        compare = _string_comparison(op, val)
+        return np.fromiter((compare(_decode_varchar(raw + b'\0' * (len(raw) % 2))) for raw in values.tolist()),
+                           dtype=bool, count=len(values))
+
+    def _numpy_scan(self, where=None):
+        view = self._numpy_view()
+        if view is None:
+            return
+        row_size = self.row_size
+        for start in range(0, len(view), NUMPY_CHUNK_ROWS):
+            part = view[start:start + NUMPY_CHUNK_ROWS]
+            mask = self._numpy_mask(part, where)
+            positions = np.flatnonzero(mask)
+            if not len(positions):
+                continue
+            # в байты собираются только прошедшие фильтр строки
+            raw = part[mask].tobytes()
+            for n, position in enumerate(positions.tolist()):
+                yield (start + position) * row_size, raw[n * row_size:(n + 1) * row_size]
+
+    def _numpy_delete(self, where, log_undo=True):
+        view = self._numpy_view('r+')
+        if view is None:
+            return
+        deleted = 0
+        for start in range(0, len(view), NUMPY_CHUNK_ROWS):
+            part = view[start:start + NUMPY_CHUNK_ROWS]
+            mask = self._numpy_mask(part, where)
+            positions = np.flatnonzero(mask)
+            if not len(positions):
+                continue
+            if log_undo:
+                self._log_undo(((positions + start) * self.row_size).tolist())
+            self._touch_dead_rows()
+            flags = part[NUMPY_FLAG_FIELD]
+            flags[mask] = ROW_DELETED
+            deleted += len(positions)
+            if self.segments.rows is not None:
+                self.segments.delete((positions + start).tolist())
+        view.flush()
+        del view
+        # файл изменён в обход буферного пула
+        self.buffer_pool.invalidate(self.data_file)
+        self.dead_rows += deleted
+
+    def _mmap_scan(self, where=None, ranges=None):
+        # файл отображается в память; поиск значения идёт через mmap.find на уровне C,
+        # а в bytes копируются только найденные строки. ranges - куски файла (start, end) по границам строк,
+        # None - весь файл. файл открывается один раз на все куски: проход до конца читает тот файл,
+        # который был на месте при его начале, даже если VACUUM тем временем заменил его новым
+        row_size = self.row_size
+        with open(self.data_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            size -= size % row_size
+            if not size:
+                return
+            if ranges is None:
+                ranges = [(0, size)]
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                predicate = self._compile_predicate(where) if where else None
+                key_condition = self._searchable_condition(where) if where else None
+                if key_condition is not None:
+                    col_offset, key = self._raw_key(key_condition)
+                for first, end in ranges:
+                    end = min(size, end)
+                    if not where:
+                        for pos in range(first, end, row_size):
+                            if mm[pos] == ROW_LIVE:
+                                yield pos, mm[pos:pos + row_size]
+                        continue
+                    if key_condition is None:
+                        for pos in range(first, end, row_size):
+                            if mm[pos] == ROW_LIVE and predicate(mm, pos):
+                                yield pos, mm[pos:pos + row_size]
+                        continue
+                    # ищем байты одного равенства, остальное условие проверяем только у найденных строк
+                    start = first + col_offset
                     while True:
-                        f.seek(offset)
-                        row_data = f.read(self.row_size)
-                        if not row_data:
+                        pos = mm.find(key, start, end)
+                        if pos < 0:
                             break
-                        if len(row_data) != self.row_size:
-                            print(f"Предупреждение: Неполная строка на смещении {offset}, пропускается")
-                            offset += self.row_size
+                        row_start = pos - col_offset
+                        misalignment = row_start % row_size
+                        if misalignment:
+                            # совпадение внутри чужого поля - продолжаем с того же столбца следующей строки
+                            start = row_start - misalignment + row_size + col_offset
                             continue
-                        row = self._parse_row(row_data)
-                        col_idx = self._get_column_index(col_name)
-                        col_type = self.columns[col_idx].type
-                        if col_type == 'INT':
-                            val = int(val)
-                        if not (op == '=' and row[col_idx] == val):
-                            new_data += row_data
-                        offset += self.row_size
-                with open(self.data_file, 'wb') as f:
-                    f.write(new_data)
-                for idx_file in self.index_files.values():
-                    open(idx_file, 'wb').close()
-                with open(self.data_file, 'rb') as f:
-                    offset = 0
-                    while True:
-                        f.seek(offset)
-                        row_data = f.read(self.row_size)
-                        if not row_data:
-                            break
-                        row = self._parse_row(row_data)
-                        for col, val in zip(self.columns, row):
-                            if col.type == 'INT':
-                                with open(self.index_files[col.name], 'ab') as idx_f:
-                                    idx_f.write(struct.pack('QQ', val, offset))
-                        offset += self.row_size
+                        if mm[row_start] == ROW_LIVE and predicate(mm, row_start):
+                            yield row_start, mm[row_start:row_start + row_size]
+                        start = pos + row_size
+
+    def _read_row(self, offset):
+        return self.buffer_pool.read(self.data_file, offset, self.row_size)
+
+    def _scan_rows(self):
+        # все слоты файла данных по порядку (вместе с удалёнными) через страницы буферного пула
+        row_size = self.row_size
+        offset = 0
+        tail = b''
+        # как и у прохода через mmap, строки, дописанные после его начала, не видны
+        limit = self._data_size()
+        for _, page in self.buffer_pool.scan(self.data_file):
+            data = tail + page if tail else page
+            end = min(len(data) - len(data) % row_size, limit - offset)
+            for pos in range(0, end, row_size):
+                yield offset, data[pos:pos + row_size]
+                offset += row_size
+            if offset >= limit:
+                return
+            tail = data[end:]
+        if tail:
+            print(f"Предупреждение: Неполная строка на смещении {offset}, пропускается")
+
+    def delete(self, where=None, commit_first=False):
+        # внутри транзакции и DELETE без условия помечает строки, а не обрезает файл, чтобы их можно было вернуть.
+        # commit_first - группа журнала фиксируется сразу после запроса (Database._autocommit): тогда запись DELETE
+        # фиксируется ещё до пометок, после сбоя восстановление повторит её, и before-image строк не пишется
+        if where or self.undo is not None:
+            hash_indexes = [index for index in self.indexes.values() if index.kind == INDEX_HASH]
+            vectorized = (self.scan_mode == SCAN_NUMPY and not hash_indexes
+                          and (not where or self._index_offsets(where) is None))
+            rows_to_delete = []
+            if not vectorized:
+                # удаляемые строки ищутся под блокировкой чтения вместе с SELECT; другой писатель
+                # до пометки их не изменит - писателей упорядочивает Database
+                with self.lock.read():
+                    rows_to_delete = list(self._matching_rows(where))
+            elif where:
+                # ошибка в условии должна всплыть до того, как запрос попадёт в журнал
+                self._compile_predicate(where)
+            commit_first = commit_first and self.wal is not None
+            with self.lock.write():
+                if commit_first:
+                    self._log_delete(where)
+                    self.wal.commit(checkpoint=False)
+                if vectorized:
+                    # флаги удаления проставляются маской прямо в отображённом файле
+                    self._numpy_delete(where, log_undo=not commit_first)
+                    self._changed()
+                elif rows_to_delete:
+                    if not commit_first:
+                        self._log_undo([offset for offset, _ in rows_to_delete])
+                    self._touch_dead_rows()
+                # строки не вырезаются из файла, а помечаются флагом удаления в первом байте слота
+                for offset, _ in rows_to_delete:
+                    self._mark_deleted(offset)
+                self.dead_rows += len(rows_to_delete)
+                if self.segments.rows is not None:
+                    self.segments.delete(offset // self.row_size for offset, _ in rows_to_delete)
+                # B+деревья хранят записи удалённых строк до VACUUM, хеш-индексы чистятся сразу
+                for index in hash_indexes:
+                    index.delete_many((index.key_of(row_data), offset) for offset, row_data in rows_to_delete)
+                if rows_to_delete:
+                    self._changed([row_data for _, row_data in rows_to_delete])
+                if not commit_first:
+                    self._log_delete(where)
+            # внутри транзакции VACUUM откладывается: он фиксирует журнал и переставляет строки
+            if (self.undo is None and self.vacuum_ratio is not None and self.row_count
+                    and self.dead_rows / self.row_count >= self.vacuum_ratio):
+                self.vacuum()
         else:
-            open(self.data_file, 'wb').close()
-            for idx_file in self.index_files.values():
-                open(idx_file, 'wb').close()
+            with self.lock.write():
+                self.version += 1
+                self._changed()
+                self._log_delete(None)
+                if self.wal is not None:
+                    # обрезку файла не отменить, поэтому запись о ней фиксируется до обрезки
+                    self.wal.commit()
+                self._touch_dead_rows()
+                self._truncate_data(0)
+                self.row_count = 0
+                self.dead_rows = 0
+                self.segments.clear()
+                for index in self.indexes.values():
+                    index.create()
+
+    def _log_delete(self, where):
+        # запись журнала - логическая: при восстановлении условие проверяется заново полным проходом
+        if self.wal is not None:
+            self.wal.log(WAL_DELETE, self.name, json.dumps(where).encode('utf-8'))
+
+    def _log_undo(self, offsets):
+        # вызывается до пометки строк: before-image ложится на диск раньше изменённых флагов
+        if self.wal is not None:
+            self.wal.log_undo(self.name, offsets)
+        if self.undo is not None:
+            self.undo.extend(offsets)
+
+    def rollback(self, size, offsets):
+        # отмена транзакции: строки, которые она пометила удалёнными, снова живые, а дописанные ею (файл
+        # длиннее size) отрезаются. индексы, счётчики и карта отрезков пересчитываются по файлу
+        with self.lock.write():
+            self.version += 1
+            self._touch_dead_rows()
+            for offset in offsets:
+                if offset < size:
+                    self._write_flag(offset, ROW_LIVE_FLAG)
+            self._truncate_data(size)
+            self.rebuild_indexes()
+            self._changed()
+
+    def vacuum(self):
+        if self.wal is not None:
+            # смещения в записях журнала после перезаписи файла теряют смысл, поэтому журнал сбрасывается
+            # контрольной точкой до сжатия и после него, а само сжатие при сбое повторяется
+            self.wal.checkpoint()
+            self.wal.log(WAL_VACUUM, self.name)
+            self.wal.commit()
+        # новые файлы, индексы и карта отрезков строятся рядом со старыми под блокировкой чтения: SELECT
+        # идут параллельно, а других писателей не пускает Database. блокировка записи берётся только на замену
+        with self.lock.read():
+            install = self._prepare_compact()
+        with self.lock.write():
+            # курсоры, которые читают через буферный пул, после замены прочли бы чужие строки - они дочитываются
+            # заранее. остальные держат открытыми старые файлы и продолжают читать их
+            for cursor in list(self.cursors):
+                if not cursor.pinned:
+                    cursor.drain()
+            self._touch_dead_rows()
+            install()
+            self.dead_rows = 0
+        if self.wal is not None:
+            self.wal.checkpoint()
+
+    def _compact(self):
+        # сжатие при восстановлении: читателей ещё нет, замена идёт сразу за построением
+        self._prepare_compact()()
+
+    def _prepare_compact(self):
+        # сжатие за один потоковый проход: живые строки переписываются во временный файл, по ним же строятся
+        # новые индексы с новыми смещениями. старые файлы не меняются; возвращается функция, которая их заменяет
+        tmp_file = self.data_file + '.tmp'
+        chunk_rows = max(1, VACUUM_CHUNK_SIZE // self.row_size)
+
+        def live_rows():
+            with open(self.data_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+                while True:
+                    chunk = src.read(chunk_rows * self.row_size)
+                    if not chunk:
+                        break
+                    live = [chunk[pos:pos + self.row_size] for pos in range(0, len(chunk) - self.row_size + 1,
+                                                                            self.row_size) if chunk[pos] == ROW_LIVE]
+                    dst.write(b''.join(live))
+                    yield from live
+
+        shadow = self._shadow_indexes(live_rows())
+
+        def install():
+            self.buffer_pool.invalidate(self.data_file)
+            os.replace(tmp_file, self.data_file)
+            self._install_indexes(*shadow)
+
+        return install
+
+    def _shadow_indexes(self, live_rows):
+        # по байтам живых строк в новом порядке строятся копии индексов во временных файлах и новая карта
+        # отрезков; байты могут быть старыми - ключи от места строки в файле не зависят. записи индексов, как
+        # у bulk_load, уходят во временные файлы и сортируются внешней сортировкой, а не копятся в памяти
+        segments = SegmentMap(self.segments.path, self.columns)
+        count = 0
+        spill_dir = tempfile.mkdtemp(prefix='vacuum_', dir=self.directory or None)
+        try:
+            files = {index_name: open(os.path.join(spill_dir, index_name), 'wb') for index_name in self.indexes}
+            try:
+                writers = [(files[index_name].write, index.key_of, _spill_packer(index))
+                           for index_name, index in self.indexes.items()]
+
+                def numbered():
+                    nonlocal count
+                    for row_data in live_rows:
+                        for write, key_of, pack in writers:
+                            write(pack(key_of(row_data), count * self.row_size))
+                        yield count, row_data
+                        count += 1
+
+                self._add_to_segments(numbered(), segments)
+            finally:
+                for f in files.values():
+                    f.close()
+            segments.rows = count
+            shadows = {}
+            for index_name, index in self.indexes.items():
+                shadow = shadows[index_name] = self._make_index(index_name, index.columns, index.kind)
+                shadow.path = index.path + '.tmp'
+                self._load_spilled_index(shadow, os.path.join(spill_dir, index_name), spill_dir)
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        return shadows, segments, count
+
+    def _install_indexes(self, shadows, segments, row_count):
+        # под блокировкой записи: копии индексов занимают место старых файлов
+        for index_name, shadow in shadows.items():
+            path = self.indexes[index_name].path
+            self.buffer_pool.invalidate(shadow.path)
+            self.buffer_pool.invalidate(path)
+            os.replace(shadow.path, path)
+            shadow.path = path
+            self.indexes[index_name] = shadow
+        self.segments._touch()
+        self.segments = segments
+        self.row_count = row_count
 
     def _parse_row(self, row_data):
-        row = []
+        return self._projection('*')(row_data)
+
+    def _projection(self, columns):
+        decode = self._projections.get(columns if columns == '*' else tuple(columns))
+        if decode is None:
+            decode = self._compile_projection(columns)
+        return decode
+
+    def _compile_projection(self, columns):
+        # для набора столбцов собирается один struct.Struct, который пропускает ненужные поля ('x')
+        # и за один вызов достаёт нужные; VARCHAR декодируются только для них
+        if columns == '*':
+            indices = list(range(len(self.columns)))
+        else:
+            indices = [self._get_column_index(col) for col in columns]
+        fields = sorted(set(indices))
+        fmt = '<'
         pos = 0
-        for col in self.columns:
-            if col.type == 'INT':
-                val = struct.unpack('Q', row_data[pos:pos + 8])[0]
-                pos += 8
-            elif 'VARCHAR' in col.type:
-                try:
-                    val_bytes = row_data[pos:pos + col.length * 2]
-                    val = val_bytes.decode('utf-16').rstrip('\0')
-                except UnicodeDecodeError as e:
-                    print(f"[Table._parse_row]: ошибка декодирования: {e}")
-                    val = ""
-                pos += col.length * 2
-            row.append(val)
-        return row
+        for i in fields:
+            col = self.columns[i]
+            if self.column_offsets[i] > pos:
+                fmt += f'{self.column_offsets[i] - pos}x'
+            width = self.column_widths[i]
+            fmt += 'Q' if col.type == 'INT' else f'{width}s'
+            pos = self.column_offsets[i] + width
+        unpack = struct.Struct(fmt).unpack_from
+        string_fields = [n for n, i in enumerate(fields) if self.columns[i].type != 'INT']
+        order = [fields.index(i) for i in indices]
+        reorder = order != list(range(len(fields)))
+        decode_string = self._string_decoder()
+
+        def decode(row_data):
+            values = list(unpack(row_data))
+            for n in string_fields:
+                values[n] = decode_string(values[n])
+            if reorder:
+                return [values[n] for n in order]
+            return values
+
+        self._projections[columns if columns == '*' else tuple(columns)] = decode
+        return decode
 
     def _get_column_index(self, col_name):
-        return [c.name for c in self.columns].index(col_name)
+        try:
+            return self.column_index[col_name]
+        except KeyError:
+            raise ValueError(f"Столбец '{col_name}' не существует в таблице '{self.name}'") from None
+
+
+class ColumnTable(Table):
+    # колоночное хранение (CREATE TABLE ... WITH (storage = column)): каждый столбец лежит в своём файле
+    # значений фиксированной ширины, а .dat хранит только флаги удаления, по байту на строку.
+    # строка с номером n собирается из n-х значений файлов; для индексов, журнала и DELETE её смещение
+    # по-прежнему n * row_size
+    storage = STORAGE_COLUMN
+
+    def __init__(self, name, columns, *args, directory='', **kwargs):
+        self.column_files = [os.path.join(directory, f"{name}.{col.name}.col") for col in columns]
+        super().__init__(name, columns, *args, directory=directory, **kwargs)
+        # проходы по столбцам свои, режимы mmap/numpy и параллельный проход рассчитаны на строки целиком
+        self.scan_mode = SCAN_MMAP
+
+    def _data_files(self):
+        return [self.data_file] + self.column_files
+
+    def _data_size(self):
+        return self.buffer_pool.size(self.data_file) * self.row_size
+
+    def _write_rows(self, offset, data):
+        first = offset // self.row_size
+        self.buffer_pool.write(self.data_file, first, data[::self.row_size])
+        for path, col_offset, width in zip(self.column_files, self.column_offsets, self.column_widths):
+            values = b''.join(data[pos:pos + width] for pos in range(col_offset, len(data), self.row_size))
+            self.buffer_pool.write(path, first * width, values)
+
+    def _write_flag(self, offset, flag):
+        self.buffer_pool.write(self.data_file, offset // self.row_size, flag)
+
+    def _truncate_data(self, size):
+        rows = size // self.row_size
+        for path, width in zip(self._data_files(), [1] + self.column_widths):
+            self.buffer_pool.invalidate(path)
+            with open(path, 'ab') as f:
+                f.truncate(rows * width)
+
+    def _is_live(self, offset):
+        return self.buffer_pool.read(self.data_file, offset // self.row_size, 1) == ROW_LIVE_FLAG
+
+    def _read_row(self, offset):
+        row = offset // self.row_size
+        return self.buffer_pool.read(self.data_file, row, 1) + b''.join(
+            self.buffer_pool.read(path, row * width, width) for path, width in zip(self.column_files, self.column_widths))
+
+    def _use_parallel_scan(self):
+        return False
+
+    def _column_chunks(self, col_indices, candidates=None):
+        # флаги и файлы нужных столбцов читаются синхронно кусками по COLUMN_CHUNK_ROWS строк:
+        # (номер первой строки, флаги, {номер столбца: сырые значения}). candidates - номера отрезков карты,
+        # куски без них пропускаются не читая
+        total = self.buffer_pool.size(self.data_file)
+        files = {i: open(self.column_files[i], 'rb') for i in col_indices}
+        try:
+            with open(self.data_file, 'rb') as flags_file:
+                for first in range(0, total, COLUMN_CHUNK_ROWS):
+                    count = min(COLUMN_CHUNK_ROWS, total - first)
+                    if candidates is not None and candidates.isdisjoint(
+                            range(first // SEGMENT_ROWS, (first + count - 1) // SEGMENT_ROWS + 1)):
+                        continue
+                    flags_file.seek(first)
+                    flags = flags_file.read(count)
+                    chunks = {}
+                    for i, f in files.items():
+                        f.seek(first * self.column_widths[i])
+                        chunks[i] = f.read(len(flags) * self.column_widths[i])
+                    yield first, flags, chunks
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _column_values(self, i, raw):
+        # INT распаковываются одним вызовом, VARCHAR остаются сырыми байтами до сравнения или вывода
+        if self.columns[i].type == 'INT':
+            return struct.unpack(f'<{len(raw) // 8}Q', raw)
+        width = self.column_widths[i]
+        return [raw[pos:pos + width] for pos in range(0, len(raw), width)]
+
+    def _compile_column_predicate(self, where):
+        # то же, что _compile_predicate, но по значениям столбцов куска: (значения по номеру столбца, номер строки)
+        if _is_compound(where):
+            conjunction, conditions = where
+            predicates = [self._compile_column_predicate(condition) for condition in conditions]
+            if conjunction == 'AND':
+                return lambda values, n: all(predicate(values, n) for predicate in predicates)
+            return lambda values, n: any(predicate(values, n) for predicate in predicates)
+        col_name, op, val = where
+        i = self._get_column_index(col_name)
+        if self.columns[i].type == 'INT':
+            bounds = _int_bounds(op, val)
+            if bounds is None:
+                return lambda values, n: False
+            lo, hi = bounds
+            return lambda values, n: lo <= values[i][n] <= hi
+        if op == '=':
+            _, key = self._raw_key(where)
+            return lambda values, n: values[i][n] == key
+        compare = _string_comparison(op, val)
+        return lambda values, n: compare(_decode_varchar(values[i][n]))
+
+    def _matching_chunks(self, where, col_indices):
+        # (номер первой строки куска, номера подходящих строк в куске, сырые куски столбцов col_indices);
+        # с диска читаются только флаги, столбцы условия и col_indices
+        predicate = self._compile_column_predicate(where) if where else None
+        where_indices = {self._get_column_index(col_name) for col_name in _where_columns(where)} if where else set()
+        candidates = self._segment_candidates(where) if where else None
+        for first, flags, chunks in self._column_chunks(sorted(where_indices.union(col_indices)), candidates):
+            if predicate is None:
+                if ROW_DELETED_FLAG in flags:
+                    hits = [n for n in range(len(flags)) if flags[n] == ROW_LIVE]
+                else:
+                    hits = range(len(flags))
+            else:
+                values = {i: self._column_values(i, chunks[i]) for i in where_indices}
+                hits = [n for n in range(len(flags)) if flags[n] == ROW_LIVE and predicate(values, n)]
+            if hits:
+                yield first, hits, chunks
+
+    def _iter_rows(self, columns, where):
+        if self._snapshot() is not None:
+            # зафиксированное состояние собирается из строк целиком, как у строкового хранения
+            yield from super()._iter_rows(columns, where)
+            return
+        offsets = self._index_offsets(where) if where else None
+        if offsets is not None:
+            decode = self._projection(columns)
+            for _, row_data in self._fetch_rows(offsets, where):
+                yield decode(row_data)
+            return
+        indices = list(range(len(self.columns))) if columns == '*' else list(map(self._get_column_index, columns))
+        for first, hits, chunks in self._matching_chunks(where, indices):
+            if not indices:
+                # COUNT(*) и подобное: нужно только число подходящих строк
+                yield from ([] for _ in hits)
+                continue
+            output = {}
+            for i in set(indices):
+                values = self._column_values(i, chunks[i])
+                values = [values[n] for n in hits]
+                output[i] = values if self.columns[i].type == 'INT' else list(map(_decode_varchar, values))
+            yield from map(list, zip(*(output[i] for i in indices)))
+
+    def _scan_matching(self, where=None):
+        # строки целиком (для DELETE и построения индексов) собираются только для подходящих строк
+        indices = range(len(self.columns))
+        for first, hits, chunks in self._matching_chunks(where, indices):
+            fields = [(chunks[i], self.column_widths[i]) for i in indices]
+            for n in hits:
+                yield (first + n) * self.row_size, ROW_LIVE_FLAG + b''.join(
+                    raw[n * width:(n + 1) * width] for raw, width in fields)
+
+    def _prepare_compact(self):
+        # каждый файл столбца сжимается во временный файл своим потоковым проходом по маске живых строк,
+        # при замене файл флагов идёт последним. файл, длина которого уже соответствует числу живых строк,
+        # сжат прерванным VACUUM и пропускается - тогда индексы перестраиваются по новым файлам
+        with open(self.data_file, 'rb') as f:
+            flags = f.read()
+        live_count = flags.count(ROW_LIVE_FLAG)
+        compacted = []
+        for path, width in zip(self.column_files, self.column_widths):
+            if os.path.getsize(path) != len(flags) * width:
+                continue
+            chunk_rows = max(1, VACUUM_CHUNK_SIZE // width)
+            with open(path, 'rb') as src, open(path + '.tmp', 'wb') as dst:
+                for first in range(0, len(flags), chunk_rows):
+                    chunk = src.read(chunk_rows * width)
+                    dst.write(b''.join(chunk[n * width:(n + 1) * width]
+                                       for n in range(len(chunk) // width) if flags[first + n] == ROW_LIVE))
+            compacted.append(path)
+        with open(self.data_file + '.tmp', 'wb') as f:
+            f.write(ROW_LIVE_FLAG * live_count)
+        shadow = None
+        if len(compacted) == len(self.column_files):
+            shadow = self._shadow_indexes(row_data for _, row_data in self._scan_matching(None))
+
+        def install():
+            for path in compacted:
+                self.buffer_pool.invalidate(path)
+                os.replace(path + '.tmp', path)
+            self.buffer_pool.invalidate(self.data_file)
+            os.replace(self.data_file + '.tmp', self.data_file)
+            if shadow is None:
+                self.rebuild_indexes()
+            else:
+                self._install_indexes(*shadow)
+
+        return install
+
+
+class HeapTable(Table):
+    # строковая таблица с компактными VARCHAR (CREATE TABLE ... WITH (storage = heap)): значения пишутся
+    # в файл кучи .heap подряд в UTF-8, а в строке остаётся ссылка фиксированного размера HEAP_SLOT
+    # (смещение, длина). строка становится короче, а VARCHAR(255) со значением "Bob" занимает 3 байта вместо 510
+    storage = STORAGE_HEAP
+    inline_strings = False
+
+    def __init__(self, name, columns, *args, directory='', **kwargs):
+        self.heap_file = os.path.join(directory, f"{name}.heap")
+        super().__init__(name, columns, *args, directory=directory, **kwargs)
+        # numpy-проход сравнивает значения прямо в строках, а здесь в строках только ссылки
+        if self.scan_mode == SCAN_NUMPY:
+            self.scan_mode = SCAN_MMAP
+
+    def _column_width(self, col):
+        return 8 if col.type == 'INT' else HEAP_SLOT.size
+
+    def _varchar_key(self, col, val):
+        # значение обрезается так же, как в строке с UTF-16 (_stored_varchar), иначе одно и то же
+        # VARCHAR(n) находилось бы по-разному в зависимости от хранения
+        return _stored_varchar(col, val).encode('utf-8')
+
+    def _string_bytes(self, slot):
+        offset, length = HEAP_SLOT.unpack(slot)
+        return self.buffer_pool.read(self.heap_file, offset, length) if length else b''
+
+    def _string_equals(self, key):
+        # длина сравнивается по ссылке, и куча читается только для значений той же длины;
+        # одинаковые значения из одной пачки вставки делят ссылку, поэтому ответ запоминается по ссылке.
+        # запоминаются только ссылки той же длины и не больше HEAP_EQUALS_MEMO, чтобы память прохода не росла с таблицей
+        length = len(key)
+        string_bytes = self._string_bytes
+        results = {}
+
+        def equals(slot):
+            if HEAP_SLOT.unpack(slot)[1] != length:
+                return False
+            result = results.get(slot)
+            if result is None:
+                if len(results) >= HEAP_EQUALS_MEMO:
+                    results.clear()
+                result = results[slot] = string_bytes(slot) == key
+            return result
+
+        return equals
+
+    def _string_decoder(self):
+        string_bytes = self._string_bytes
+        return lambda slot: string_bytes(slot).decode('utf-8')
+
+    def _data_files(self):
+        return [self.data_file, self.heap_file]
+
+    def _truncate_data(self, size):
+        super()._truncate_data(size)
+        if not size:
+            with open(self.heap_file, 'ab') as f:
+                f.truncate(0)
+
+    def _encode_rows(self, rows):
+        # значения всех строк пачки дописываются в кучу одной записью, повторяющиеся значения - один раз
+        self._heap_values = []
+        self._heap_slots = {}
+        self._heap_end = self.buffer_pool.size(self.heap_file)
+        first = self._heap_end
+        try:
+            buffer = super()._encode_rows(rows)
+            self._write_heap(first, b''.join(self._heap_values))
+        finally:
+            self._heap_values = self._heap_slots = None
+        return buffer
+
+    def _encode_row(self, values):
+        fields = []
+        for col, val in zip(self.columns, values):
+            if col.type == 'INT':
+                fields.append(int(val))
+                continue
+            data = self._varchar_key(col, val)
+            if len(data) > HEAP_MAX_VALUE:
+                raise ValueError(f"Значение столбца '{col.name}' длиннее {HEAP_MAX_VALUE} байт в UTF-8")
+            slot = self._heap_slots.get(data)
+            if slot is None:
+                slot = self._heap_slots[data] = HEAP_SLOT.pack(self._heap_end, len(data))
+                self._heap_values.append(data)
+                self._heap_end += len(data)
+            fields.append(slot)
+        return self.row_struct.pack(ROW_LIVE, *fields)
+
+    def _write_heap(self, offset, data):
+        if not data:
+            return
+        if self.wal is not None:
+            self.wal.log(WAL_HEAP, self.name, INT_STRUCT.pack(offset) + data)
+        self.buffer_pool.write(self.heap_file, offset, data)
+
+    def _prepare_compact(self):
+        # живые строки и их значения переписываются в новые файлы данных и кучи. оба временных файла
+        # дописываются полностью и только потом заменяют старые: сначала куча, затем данные. если прерванный
+        # VACUUM успел заменить кучу (её временного файла уже нет), остаётся заменить файл данных
+        data_tmp = self.data_file + '.tmp'
+        heap_tmp = self.heap_file + '.tmp'
+        if os.path.exists(data_tmp) and not os.path.exists(heap_tmp):
+            def finish():
+                self._replace_data(data_tmp)
+                self.rebuild_indexes()
+
+            return finish
+        string_offsets = [offset for col, offset in zip(self.columns, self.column_offsets) if col.type != 'INT']
+
+        def live_rows():
+            # старая ссылка -> новая: общие значения остаются общими
+            moved = {}
+            heap_end = 0
+            with open(heap_tmp, 'wb') as heap_dst, open(data_tmp, 'wb') as data_dst:
+                for _, row_data in self._scan_matching(None):
+                    row = bytearray(row_data)
+                    for col_offset in string_offsets:
+                        slot = row_data[col_offset:col_offset + HEAP_SLOT.size]
+                        new_slot = moved.get(slot)
+                        if new_slot is None:
+                            value = self._string_bytes(slot)
+                            new_slot = moved[slot] = HEAP_SLOT.pack(heap_end, len(value))
+                            heap_dst.write(value)
+                            heap_end += len(value)
+                        row[col_offset:col_offset + HEAP_SLOT.size] = new_slot
+                    data_dst.write(row)
+                    # индексы и карта отрезков получают строку со старыми ссылками: значения до замены
+                    # читаются из старой кучи
+                    yield row_data
+                heap_dst.flush()
+                os.fsync(heap_dst.fileno())
+                data_dst.flush()
+                os.fsync(data_dst.fileno())
+
+        shadow = self._shadow_indexes(live_rows())
+
+        def install():
+            self.buffer_pool.invalidate(self.heap_file)
+            os.replace(heap_tmp, self.heap_file)
+            self._replace_data(data_tmp)
+            self._install_indexes(*shadow)
+
+        return install
+
+    def _replace_data(self, data_tmp):
+        self.buffer_pool.invalidate(self.heap_file)
+        self.buffer_pool.invalidate(self.data_file)
+        os.replace(data_tmp, self.data_file)
+
+
+class CompressedTable(Table):
+    # сжатое хранение (CREATE TABLE ... WITH (storage = compressed, compression = zlib | lzma)): строки
+    # группируются в блоки по block_rows, каждый блок сжимается целиком и пишется в файл .blk после заголовка
+    # (длина сжатых данных, число строк, min/max каждого INT-столбца). .dat хранит только флаги удаления,
+    # как у ColumnTable, поэтому DELETE не трогает сжатые блоки. заполнен не до конца только последний блок,
+    # и новые строки дописываются в него пересжатием
+    storage = STORAGE_COMPRESSED
+
+    def __init__(self, name, columns, *args, directory='', compression=DEFAULT_COMPRESSION, **kwargs):
+        self.block_file = os.path.join(directory, f"{name}.blk")
+        int_columns = [i for i, col in enumerate(columns) if col.type == 'INT']
+        # номер INT-столбца -> место его (min, max) в зоне блока
+        self.zone_columns = {i: 2 * n for n, i in enumerate(int_columns)}
+        self.block_header = struct.Struct('<II' + 'QQ' * len(int_columns))
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Неизвестный способ сжатия '{compression}'")
+        self.compression = compression
+        # блоки: (смещение заголовка, длина сжатых данных, число строк, зона)
+        self.blocks = []
+        # кэш распакованных блоков общий для читающих потоков
+        self._block_cache = OrderedDict()
+        self._block_lock = threading.Lock()
+        super().__init__(name, columns, *args, directory=directory, **kwargs)
+        self.scan_mode = SCAN_MMAP
+        if not kwargs.get('create', True):
+            with open(self.schema_file) as f:
+                self.compression = json.load(f).get('compression', DEFAULT_COMPRESSION)
+            self._load_blocks()
+
+    @property
+    def block_rows(self):
+        return max(1, BLOCK_SIZE // self.row_size)
+
+    def _schema(self):
+        schema = super()._schema()
+        schema['compression'] = self.compression
+        return schema
+
+    def _load_blocks(self):
+        # каталог блоков восстанавливается проходом по заголовкам; блок, оборванный сбоем, отбрасывается
+        self.blocks = []
+        self._block_cache.clear()
+        header = self.block_header
+        size = os.path.getsize(self.block_file) if os.path.exists(self.block_file) else 0
+        pos = 0
+        with open(self.block_file, 'ab+') as f:
+            while pos + header.size <= size:
+                f.seek(pos)
+                length, rows, *zone = header.unpack(f.read(header.size))
+                if pos + header.size + length > size:
+                    break
+                self.blocks.append((pos, length, rows, tuple(zone)))
+                pos += header.size + length
+
+    def _data_files(self):
+        return [self.data_file, self.block_file]
+
+    def _data_size(self):
+        return self.buffer_pool.size(self.data_file) * self.row_size
+
+    def _write_rows(self, offset, data):
+        first = offset // self.row_size
+        self.buffer_pool.write(self.data_file, first, data[::self.row_size])
+        self._rewrite_blocks(first, data)
+
+    def _write_flag(self, offset, flag):
+        self.buffer_pool.write(self.data_file, offset // self.row_size, flag)
+
+    def _truncate_data(self, size):
+        rows = size // self.row_size
+        self.buffer_pool.invalidate(self.data_file)
+        with open(self.data_file, 'ab') as f:
+            f.truncate(rows)
+        if rows:
+            self._rewrite_blocks(rows, b'')
+            return
+        self.buffer_pool.invalidate(self.block_file)
+        open(self.block_file, 'wb').close()
+        self.blocks = []
+        self._block_cache.clear()
+
+    def _rewrite_blocks(self, first, data):
+        # блоки, начиная с того, в который попадает строка first, пишутся заново: строки этого блока до first
+        # и затем data. повтор с теми же аргументами (журнал при восстановлении) даёт тот же файл
+        block_no, skip = divmod(first, self.block_rows)
+        if block_no < len(self.blocks):
+            if block_no < len(self.blocks) - 1 or skip < self.blocks[block_no][2]:
+                # переписываются строки, которые курсор мог уже увидеть, - прочитанный им каталог блоков
+                # устаревает. дописывание в последний неполный блок сохраняет его строки, а его сжатые данные
+                # проход читает заранее (_scan_matching), так что открытые курсоры это не задевает
+                self.version += 1
+            pos = self.blocks[block_no][0]
+            if skip:
+                data = self._block_data(block_no)[:skip * self.row_size] + data
+        elif self.blocks:
+            last_pos, last_length, _, _ = self.blocks[-1]
+            pos = last_pos + self.block_header.size + last_length
+        else:
+            pos = 0
+        del self.blocks[block_no:]
+        self._block_cache.clear()
+        packed, blocks = self._pack_blocks(data, pos)
+        self.buffer_pool.write(self.block_file, pos, packed)
+        self.blocks.extend(blocks)
+        if blocks:
+            # несжатые строки последнего блока остаются в кэше: следующая вставка дописывает их без распаковки
+            with self._block_lock:
+                self._block_cache[len(self.blocks) - 1] = bytes(data[(len(blocks) - 1) * self.block_rows
+                                                                     * self.row_size:])
+        end = pos + len(packed)
+        if self.buffer_pool.size(self.block_file) > end:
+            self.buffer_pool.invalidate(self.block_file)
+            with open(self.block_file, 'ab') as f:
+                f.truncate(end)
+
+    def _pack_blocks(self, data, pos):
+        # строки режутся на блоки по block_rows, у каждого блока считается зона по INT-столбцам
+        compress = COMPRESSIONS[self.compression][0]
+        step = self.block_rows * self.row_size
+        parts = []
+        blocks = []
+        for start in range(0, len(data), step):
+            chunk = data[start:start + step]
+            zone = []
+            if self.zone_columns:
+                rows = list(self.row_struct.iter_unpack(chunk))
+                for i in self.zone_columns:
+                    values = [row[i + 1] for row in rows]
+                    zone += [min(values), max(values)]
+            payload = compress(chunk)
+            rows_count = len(chunk) // self.row_size
+            parts.append(self.block_header.pack(len(payload), rows_count, *zone))
+            parts.append(payload)
+            blocks.append((pos, len(payload), rows_count, tuple(zone)))
+            pos += self.block_header.size + len(payload)
+        return b''.join(parts), blocks
+
+    def _block_data(self, block_no):
+        with self._block_lock:
+            data = self._block_cache.get(block_no)
+            if data is not None:
+                self._block_cache.move_to_end(block_no)
+                return data
+        pos, length, _, _ = self.blocks[block_no]
+        data = COMPRESSIONS[self.compression][1](
+            self.buffer_pool.read(self.block_file, pos + self.block_header.size, length))
+        with self._block_lock:
+            self._block_cache[block_no] = data
+            if len(self._block_cache) > BLOCK_CACHE_SIZE:
+                self._block_cache.popitem(last=False)
+        return data
+
+    def _is_live(self, offset):
+        return self.buffer_pool.read(self.data_file, offset // self.row_size, 1) == ROW_LIVE_FLAG
+
+    def _read_row(self, offset):
+        row = offset // self.row_size
+        block_no, n = divmod(row, self.block_rows)
+        pos = n * self.row_size
+        return self.buffer_pool.read(self.data_file, row, 1) + self._block_data(block_no)[pos + 1:pos + self.row_size]
+
+    def _use_parallel_scan(self):
+        return False
+
+    def _zone_check(self, where):
+        # функция зона блока -> может ли в блоке найтись строка под условием. отсекаются только условия
+        # на INT-столбцы, по остальным блок приходится читать
+        if _is_compound(where):
+            conjunction, conditions = where
+            checks = [self._zone_check(condition) for condition in conditions]
+            if conjunction == 'AND':
+                return lambda zone: all(check(zone) for check in checks)
+            return lambda zone: any(check(zone) for check in checks)
+        col_name, op, val = where
+        i = self._get_column_index(col_name)
+        if i not in self.zone_columns:
+            return lambda zone: True
+        bounds = _int_bounds(op, val)
+        if bounds is None:
+            return lambda zone: False
+        lo, hi = bounds
+        z = self.zone_columns[i]
+        return lambda zone: zone[z] <= hi and zone[z + 1] >= lo
+
+    def _matching_rows(self, where, snapshot=None):
+        # индекс выгоден, пока его строки лежат в меньшем числе блоков, чем пропускает карта зон:
+        # каждый блок распаковывается целиком, поэтому считаются блоки, а не строки
+        offsets = self._index_offsets(where) if where else None
+        if offsets is not None:
+            offsets = sorted(offsets)
+            check = self._zone_check(where)
+            zone_blocks = sum(1 for block in self.blocks if check(block[3]))
+            if len({offset // self.row_size // self.block_rows for offset in offsets}) <= zone_blocks:
+                yield from self._fetch_rows(_with_undone(offsets, snapshot), where, snapshot)
+                return
+        yield from self._scan_visible(where, snapshot)
+
+    def _scan_matching(self, where=None):
+        # блоки, исключённые картой зон или целиком удалённые, не читаются и не распаковываются
+        predicate = self._compile_predicate(where) if where else None
+        check = self._zone_check(where) if where else None
+        candidates = self._segment_candidates(where) if where else None
+        decompress = COMPRESSIONS[self.compression][1]
+        row_size = self.row_size
+        with open(self.data_file, 'rb') as flags_file, open(self.block_file, 'rb') as block_file:
+            # блоки, дописанные после начала прохода, не видны
+            blocks = list(self.blocks)
+            # последний неполный блок вставки переписывают на месте, в том числе между пачками потокового
+            # курсора, поэтому его сжатые данные читаются сразу, пока они соответствуют каталогу
+            tail = None
+            if blocks and blocks[-1][2] < self.block_rows:
+                block_file.seek(blocks[-1][0] + self.block_header.size)
+                tail = block_file.read(blocks[-1][1])
+            for block_no, (pos, length, rows, zone) in enumerate(blocks):
+                if check is not None and not check(zone):
+                    continue
+                first = block_no * self.block_rows
+                if candidates is not None and candidates.isdisjoint(
+                        range(first // SEGMENT_ROWS, (first + rows - 1) // SEGMENT_ROWS + 1)):
+                    continue
+                flags_file.seek(first)
+                flags = flags_file.read(rows)
+                if ROW_LIVE_FLAG not in flags:
+                    continue
+                if tail is not None and block_no == len(blocks) - 1:
+                    data = decompress(tail)
+                else:
+                    block_file.seek(pos + self.block_header.size)
+                    data = decompress(block_file.read(length))
+                for n in range(len(flags)):
+                    if flags[n] != ROW_LIVE:
+                        continue
+                    row_start = n * row_size
+                    if predicate is None or predicate(data, row_start):
+                        yield (first + n) * row_size, ROW_LIVE_FLAG + data[row_start + 1:row_start + row_size]
+
+    def _prepare_compact(self):
+        # живые строки пересжимаются в новые блоки. как у HeapTable, оба временных файла дописываются
+        # полностью, затем заменяется файл блоков и только потом флаги; если прерванный VACUUM уже заменил
+        # блоки, остаётся заменить флаги
+        data_tmp = self.data_file + '.tmp'
+        block_tmp = self.block_file + '.tmp'
+        if os.path.exists(data_tmp) and not os.path.exists(block_tmp):
+            def finish():
+                self._replace_data(data_tmp)
+                self.rebuild_indexes()
+
+            return finish
+
+        def live_rows():
+            source = (row_data for _, row_data in self._scan_matching(None))
+            live = 0
+            pos = 0
+            with open(block_tmp, 'wb') as block_dst:
+                while True:
+                    rows = list(itertools.islice(source, self.block_rows))
+                    if not rows:
+                        break
+                    packed, _ = self._pack_blocks(b''.join(rows), pos)
+                    block_dst.write(packed)
+                    pos += len(packed)
+                    live += len(rows)
+                    yield from rows
+                block_dst.flush()
+                os.fsync(block_dst.fileno())
+            with open(data_tmp, 'wb') as f:
+                f.write(ROW_LIVE_FLAG * live)
+                f.flush()
+                os.fsync(f.fileno())
+
+        shadow = self._shadow_indexes(live_rows())
+
+        def install():
+            self.buffer_pool.invalidate(self.block_file)
+            os.replace(block_tmp, self.block_file)
+            self._replace_data(data_tmp)
+            self._install_indexes(*shadow)
+
+        return install
+
+    def _replace_data(self, data_tmp):
+        self.buffer_pool.invalidate(self.block_file)
+        self.buffer_pool.invalidate(self.data_file)
+        os.replace(data_tmp, self.data_file)
+        self._load_blocks()
+
+
+# класс таблицы по способу хранения из CREATE TABLE ... WITH (storage = ...)
+TABLE_STORAGES = {STORAGE_ROW: Table, STORAGE_COLUMN: ColumnTable, STORAGE_HEAP: HeapTable,
+                  STORAGE_COMPRESSED: CompressedTable}
+
+
+# таблицы, открытые в процессе-обработчике параллельного прохода
+_partition_tables = {}
+
+
+def _scan_partition(spec, where, columns, start, end):
+    # выполняется в отдельном процессе: проход по байтам [start, end) файла данных.
+    # columns=None - вернуть (смещение, байты строки), иначе уже спроецированные строки
+    name, directory, column_spec, storage = spec
+    key = (name, directory, tuple(column_spec), storage)
+    table = _partition_tables.get(key)
+    if table is None:
+        table = TABLE_STORAGES[storage](name, [Column(col_name, col_type) for col_name, col_type in column_spec],
+                                        create=False, directory=directory)
+        _partition_tables[key] = table
+    # файлы меняются основным процессом между вызовами, закэшированные здесь страницы устаревают
+    for path in table._data_files():
+        table.buffer_pool.invalidate(path)
+    rows = table._mmap_scan(where, [(start, end)])
+    if columns is None:
+        return list(rows)
+    decode = table._projection(columns)
+    return [decode(row_data) for _, row_data in rows]
+
+
+def _resolve_column(tables, ref):
+    # 'таблица.столбец' или имя столбца, которое есть ровно в одной из таблиц соединения -> (таблица, столбец)
+    table_name, dot, col_name = ref.rpartition('.')
+    if dot:
+        if table_name not in tables:
+            raise ValueError(f"Таблица '{table_name}' не участвует в запросе")
+        tables[table_name]._get_column_index(col_name)
+        return table_name, col_name
+    owners = [name for name, table in tables.items() if col_name in table.column_index]
+    if not owners:
+        raise ValueError(f"Столбец '{col_name}' не существует")
+    if len(owners) > 1:
+        raise ValueError(f"Столбец '{col_name}' есть в нескольких таблицах, укажите таблицу")
+    return owners[0], col_name
+
+
+def _rename_where(where, rename):
+    if _is_compound(where):
+        conjunction, conditions = where
+        return conjunction, [_rename_where(condition, rename) for condition in conditions]
+    col_name, op, val = where
+    return rename(col_name), op, val
+
+
+def _spill_packer(index):
+    # (ключ, смещение) -> запись индекса во временном файле для _load_spilled_index: у B+дерева big-endian,
+    # и порядок байт совпадает с порядком ключей; у хеш-индекса (хеш, смещение)
+    if index.kind == INDEX_BTREE:
+        return lambda key, offset, pack=index.entry_struct.pack: pack(*key, offset)
+    return HashIndex.ENTRY.pack
+
+
+def _external_sort(path, record_size, directory, key=None):
+    # записи фиксированной длины из файла по возрастанию key (без key - по байтам): куски по EXTERNAL_SORT_RUN
+    # записей сортируются в памяти и пишутся прогонами, которые затем сливаются одним проходом
+    runs = []
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(EXTERNAL_SORT_RUN * record_size)
+            if not data:
+                break
+            records = [data[pos:pos + record_size] for pos in range(0, len(data), record_size)]
+            records.sort(key=key)
+            if not runs and len(data) < EXTERNAL_SORT_RUN * record_size:
+                # всё уместилось в один кусок
+                yield from records
+                return
+            run_path = os.path.join(directory, f'{os.path.basename(path)}.run{len(runs)}')
+            with open(run_path, 'wb') as run:
+                run.write(b''.join(records))
+            runs.append(run_path)
+    yield from heapq.merge(*(_read_records(run_path, record_size) for run_path in runs), key=key)
+
+
+def _read_records(path, record_size):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(VACUUM_CHUNK_SIZE - VACUUM_CHUNK_SIZE % record_size)
+            if not data:
+                return
+            for pos in range(0, len(data), record_size):
+                yield data[pos:pos + record_size]
+
+
+def _csv_rows(table, path, header=True, delimiter=','):
+    # строки CSV-файла в порядке столбцов таблицы. заголовок (как у дампов backup_table) сопоставляется
+    # со столбцами по именам, без заголовка значения идут в порядке столбцов
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        order = None
+        if header:
+            names = [name.strip() for name in next(reader, [])]
+            if not names:
+                return
+            if sorted(names) != sorted(col.name for col in table.columns):
+                raise ValueError(f"Заголовок CSV {names} не совпадает со столбцами таблицы '{table.name}'")
+            order = [names.index(col.name) for col in table.columns]
+        for values in reader:
+            if not values:
+                continue
+            if len(values) != len(table.columns):
+                raise ValueError(f"Строка {reader.line_num} файла '{path}': ожидалось значений: "
+                                 f"{len(table.columns)}, получено: {len(values)}")
+            yield values if order is None else [values[i] for i in order]
+
+
+def _hash_join(build, probe, memory_budget, directory, depth=0):
+    # хеш-соединение по первому значению строк: build-сторона ложится в словарь ключ -> строки,
+    # probe-сторона проходит по нему потоком; пары отдаются как (строка probe, строка build)
+    buckets = {}
+    used = 0
+    build = iter(build)
+    for row in build:
+        buckets.setdefault(row[0], []).append(row)
+        used += sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+        if used > memory_budget and depth < JOIN_SPILL_MAX_DEPTH:
+            rest = itertools.chain(itertools.chain.from_iterable(buckets.values()), build)
+            buckets = None
+            yield from _spilled_join(rest, probe, memory_budget, directory, depth)
+            return
+    for row in probe:
+        for match in buckets.get(row[0], ()):
+            yield row, match
+
+
+def _spilled_join(build, probe, memory_budget, directory, depth):
+    # обе стороны раскладываются по одинаковым разделам по хешу ключа (на каждом уровне свой),
+    # и каждая пара разделов соединяется отдельно - в памяти одновременно только один раздел build-стороны
+    spill_dir = tempfile.mkdtemp(prefix='join_', dir=directory or None)
+    try:
+        paths = []
+        for side, rows in (('build', build), ('probe', probe)):
+            files = [open(os.path.join(spill_dir, f'{side}_{n}.json'), 'w', encoding='utf-8')
+                     for n in range(JOIN_SPILL_PARTITIONS)]
+            try:
+                for row in rows:
+                    files[hash((depth, row[0])) % JOIN_SPILL_PARTITIONS].write(json.dumps(row) + '\n')
+            finally:
+                for f in files:
+                    f.close()
+            paths.append([f.name for f in files])
+        for build_path, probe_path in zip(*paths):
+            with open(build_path, encoding='utf-8') as build_file, open(probe_path, encoding='utf-8') as probe_file:
+                yield from _hash_join(map(json.loads, build_file), map(json.loads, probe_file), memory_budget,
+                                      directory, depth + 1)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def _with_undone(offsets, snapshot):
+    # кандидаты из индекса по условию WHERE для чтения в зафиксированном состоянии: хеш-индексы теряют записи
+    # строк сразу при DELETE, поэтому к ним добавляются все строки, помеченные транзакцией (условие проверит
+    # _fetch_rows); B+деревья отдают такие строки сами, и они не повторяются
+    if snapshot is None:
+        return offsets
+    offsets = list(offsets)
+    return offsets + sorted(snapshot[1].difference(offsets))
+
+
+def _is_compound(where):
+    # составное условие - ('AND' | 'OR', [условия]), простое - (столбец, оператор, значение)
+    return len(where) == 2
+
+
+def _where_columns(where):
+    if _is_compound(where):
+        return set().union(*map(_where_columns, where[1]))
+    return {where[0]}
+
+
+def _equality_condition(where):
+    # простое равенство, по сырым байтам которого можно искать строки-кандидаты
+    if not _is_compound(where):
+        return where if where[1] == '=' else None
+    if where[0] == 'AND':
+        return next((condition for condition in where[1]
+                     if not _is_compound(condition) and condition[1] == '='), None)
+    return None
+
+
+def _int_bounds(op, val):
+    # условие на INT-столбец как отрезок [lo, hi] беззнаковых значений; None - условию ничего не удовлетворяет
+    if op == 'BETWEEN':
+        lo, hi = int(val[0]), int(val[1])
+    else:
+        val = int(val)
+        lo, hi = {
+            '=': (val, val),
+            '<': (0, val - 1),
+            '<=': (0, val),
+            '>': (val + 1, MAX_INT),
+            '>=': (val, MAX_INT),
+        }[op]
+    lo, hi = max(lo, 0), min(hi, MAX_INT)
+    if lo > hi:
+        return None
+    return lo, hi
+
+
+def _string_comparison(op, val):
+    if op == 'BETWEEN':
+        lo, hi = str(val[0]), str(val[1])
+        return lambda s: lo <= s <= hi
+    compare = COMPARISONS[op]
+    val = str(val)
+    return lambda s: compare(s, val)
+
+
+def _stored_varchar(col, val):
+    # значение VARCHAR(n) в том виде, в каком его хранит строка: UTF-16 с BOM в 2n байтах, то есть первые
+    # n - 1 единиц UTF-16; разрезанная суррогатная пара отбрасывается
+    return str(val).encode('utf-16')[:col.length * 2].decode('utf-16', 'ignore')
+
+
+def _decode_varchar(val_bytes):
+    try:
+        return val_bytes.decode('utf-16').rstrip('\0')
+    except UnicodeDecodeError as e:
+        print(f"[Table._parse_row]: ошибка декодирования: {e}")
+        return ""
+
+
+@contextmanager
+def _reading(tables):
+    # блокировки чтения нескольких таблиц берутся в порядке имён
+    with ExitStack() as stack:
+        for table in sorted(tables, key=lambda table: table.name):
+            stack.enter_context(table.lock.read())
+        yield
+
+
+class CursorSnapshot:
+    # строки потокового курсора достаются пачками под блокировкой чтения, между пачками таблицы свободны
+    # для писателей. дописанные позже строки курсору не видны: проходы и выборка по индексу ограничены
+    # размером данных на момент первого чтения. pinned - проход держит открытыми файлы, с которых начал
+    # (mmap, numpy, файлы столбцов и блоков), и VACUUM не мешает ему дочитать старые файлы; остальные
+    # курсоры VACUUM дочитывает в память перед заменой. если смещения строк потеряли смысл (DELETE
+    # без условия, DROP, ROLLBACK), продолжить чтение нельзя
+    def __init__(self, tables, rows, pinned):
+        # создаётся под блокировкой чтения всех таблиц
+        self.tables = tables
+        self.rows = rows
+        self.pinned = pinned
+        self.versions = [table.version for table in tables]
+        self.buffer = deque()
+        for table in tables:
+            table.cursors.add(self)
+        # первая пачка читается сразу: проход открывает свои файлы до того, как их сможет заменить VACUUM
+        self._read_chunk()
+
+    def _read_chunk(self):
+        chunk = list(itertools.islice(self.rows, CURSOR_CHUNK_ROWS))
+        self.buffer.extend(chunk)
+        if len(chunk) < CURSOR_CHUNK_ROWS:
+            self._finish()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.buffer and self.rows is not None:
+            with _reading(self.tables):
+                # пока курсор ждал блокировку, его мог дочитать VACUUM
+                if self.rows is not None:
+                    if [table.version for table in self.tables] != self.versions:
+                        raise ValueError("Таблица изменена во время чтения курсора")
+                    self._read_chunk()
+        if not self.buffer:
+            raise StopIteration
+        return self.buffer.popleft()
+
+    def drain(self):
+        # вызывает VACUUM под блокировкой записи, пока смещения старых строк ещё верны
+        if self.rows is not None:
+            self.buffer.extend(self.rows)
+            self._finish()
+
+    def _finish(self):
+        rows, self.rows = self.rows, None
+        if hasattr(rows, 'close'):
+            rows.close()
+        for table in self.tables:
+            table.cursors.discard(self)
+
+    def close(self):
+        # досрочное закрытие освобождает отображение файла у незавершённого прохода
+        if self.rows is not None:
+            with _reading(self.tables):
+                if self.rows is not None:
+                    self._finish()
+        self.buffer.clear()
+
+
+class Cursor:
+    # результат SELECT, который отдаёт строки по требованию и не держит всю выборку в памяти
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self.arraysize = 1
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=None):
+        return list(itertools.islice(self._rows, size or self.arraysize))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return self._rows
+
+    def close(self):
+        # досрочное закрытие освобождает отображение файла у незавершённого прохода
+        if hasattr(self._rows, 'close'):
+            self._rows.close()
+        self._rows = iter(())
+
+
+class PreparedStatement:
+    # разобранный запрос; значения на месте '?' подставляются при каждом выполнении без повторного разбора
+    def __init__(self, database, kind, args, sql=None):
+        self.database = database
+        self.kind = kind
+        self.args = args
+        self.sql = sql
+        self.param_count = _count_parameters(args)
+
+    def execute(self, params=(), stream=False):
+        if len(params) != self.param_count:
+            raise ValueError(f"Ожидалось параметров: {self.param_count}, передано: {len(params)}")
+        args = _bind_parameters(self.args, iter(params)) if self.param_count else self.args
+        if self.kind == 'SELECT' and not stream and self.database.result_cache is not None:
+            # ключ кэша результатов - текст запроса с '?' и значения параметров
+            return self.database._select(args, stream, (self.sql, tuple(params)))
+        return self.database._run(self.kind, args, stream)
+
+
+def _point_condition(table, where):
+    # (столбец, байты значения) для запроса, результат которого зависит только от строк с этим значением столбца;
+    # байты - как у _raw_key, с той же обрезкой по длине столбца, что и при записи. None - от любой строки таблицы
+    condition = _equality_condition(where) if where else None
+    if condition is None:
+        return None
+    try:
+        return condition[0], table._raw_key(condition)[1]
+    except (TypeError, ValueError, struct.error):
+        return None
+
+
+def _count_parameters(value):
+    if value is PARAMETER:
+        return 1
+    if isinstance(value, (tuple, list)):
+        return sum(_count_parameters(item) for item in value)
+    return 0
+
+
+def _bind_parameters(value, params):
+    # параметры подставляются в порядке обхода, который совпадает с порядком '?' в тексте запроса
+    if value is PARAMETER:
+        return next(params)
+    if isinstance(value, tuple):
+        return tuple(_bind_parameters(item, params) for item in value)
+    if isinstance(value, list):
+        return [_bind_parameters(item, params) for item in value]
+    return value
+
+
+class Catalog(dict):
+    # таблицы базы по имени. таблицы, найденные на диске при открытии базы, открываются при первом обращении;
+    # items()/values() перечисляют только уже открытые таблицы, все имена - names()
+    def __init__(self, database, on_disk=()):
+        super().__init__()
+        self.database = database
+        self.on_disk = set(on_disk)
+        # открытие таблицы идёт под своей блокировкой, а не под writer: иначе SELECT из другого потока
+        # ждал бы конца чужой транзакции, которая держит writer от BEGIN до COMMIT
+        self.lock = threading.RLock()
+
+    def __missing__(self, table_name):
+        # пока поток ждал блокировку, таблицу мог открыть или удалить другой
+        with self.lock:
+            if dict.__contains__(self, table_name):
+                return dict.__getitem__(self, table_name)
+            if table_name not in self.on_disk:
+                raise KeyError(table_name)
+            return self.database._open_table(table_name)
+
+    def __contains__(self, table_name):
+        return dict.__contains__(self, table_name) or table_name in self.on_disk
+
+    def get(self, table_name, default=None):
+        return self[table_name] if table_name in self else default
+
+    def pop(self, table_name, *default):
+        with self.lock:
+            self.on_disk.discard(table_name)
+            return super().pop(table_name, *default)
+
+    def items(self):
+        # копия: другой поток может открыть таблицу, пока по списку идёт цикл
+        with self.lock:
+            return list(dict.items(self))
+
+    def values(self):
+        with self.lock:
+            return list(dict.values(self))
+
+    def is_open(self, table_name):
+        return dict.__contains__(self, table_name)
+
+    def names(self):
+        with self.lock:
+            return sorted(self.on_disk.union(self.keys()))
 
 
 class Database:
-    def __init__(self):
-        self.tables = {}
+    def __init__(self, path=None, vacuum_ratio=None, buffer_pool_size=DEFAULT_BUFFER_POOL_SIZE, scan_mode=SCAN_MMAP,
+                 workers=1, statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE, wal_file=None, group_commit=1,
+                 join_memory=DEFAULT_JOIN_MEMORY, result_cache_size=0):
+        # path - каталог базы: таблицы из него находятся по файлам схем без чтения данных.
+        # без path файлы пишутся в текущий каталог, и существующие таблицы не подхватываются
+        self.directory = path or ''
+        # базой можно пользоваться из нескольких потоков: SELECT идут параллельно под блокировками чтения таблиц,
+        # а изменяющие запросы выполняются по одному под writer. BEGIN держит writer до COMMIT, так что
+        # транзакция принадлежит начавшему её потоку, а писатели из других потоков ждут её конца.
+        # SELECT из других потоков видят таблицы, изменённые транзакцией, в состоянии до неё (Table._snapshot)
+        self.writer = threading.RLock()
+        on_disk = ()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            on_disk = [file_name[:-len(SCHEMA_SUFFIX)] for file_name in os.listdir(path)
+                       if file_name.endswith(SCHEMA_SUFFIX)]
+        self.tables = Catalog(self, on_disk)
+        self.vacuum_ratio = vacuum_ratio
+        self.scan_mode = scan_mode
+        # один буферный пул на все таблицы базы; счётчики попаданий - в buffer_pool.stats()
+        self.buffer_pool = BufferPool(buffer_pool_size)
+        # workers > 1 - полный проход без индекса делится между процессами
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        # LRU разобранных SELECT/INSERT/DELETE: ключ - текст запроса с литералами, заменёнными на '?'
+        self.statement_cache = OrderedDict()
+        self.statement_cache_size = statement_cache_size
+        self._statement_cache_lock = threading.Lock()
+        self.join_memory = join_memory
+        # result_cache_size > 0 - результаты SELECT кэшируются в LRU с таким бюджетом памяти в байтах;
+        # INSERT/DELETE сбрасывают записи изменённых таблиц, счётчики - в result_cache.stats()
+        self.result_cache = ResultCache(result_cache_size) if result_cache_size else None
+        # с журналом (wal_file) INSERT/DELETE сначала попадают в журнал; вне BEGIN ... COMMIT записи
+        # group_commit подряд идущих запросов фиксируются одним fsync
+        self.wal = None
+        self.group_commit = group_commit
+        self.in_transaction = False
+        # таблицы, изменённые открытой транзакцией: имя -> размер данных до первого изменения
+        self._transaction = {}
+        self._uncommitted = 0
+        if wal_file is not None:
+            wal_file = os.path.join(self.directory, wal_file)
+            if os.path.exists(wal_file):
+                self._recover(wal_file)
+            self.wal = WriteAheadLog(wal_file, self.tables, self.buffer_pool, lock=self.tables.lock)
+            for table in self.tables.values():
+                table.wal = self.wal
+            self.wal.checkpoint()
+
+    def close(self):
+        with self.writer:
+            if self.in_transaction:
+                # незафиксированная транзакция при закрытии отменяется
+                self._rollback()
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+                for table in self.tables.values():
+                    table.executor = None
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
+                for table in self.tables.values():
+                    table.wal = None
+            # счётчики строк открытых таблиц сохраняются в их схемах
+            for table in self.tables.values():
+                table._write_schema()
+            self.buffer_pool.close()
+
+    def _open_table(self, table_name, open_indexes=True):
+        with open(os.path.join(self.directory, table_name + SCHEMA_SUFFIX)) as f:
+            schema = json.load(f)
+        columns = [Column(col['name'], col['type']) for col in schema['columns']]
+        table = TABLE_STORAGES[schema.get('storage', STORAGE_ROW)](
+            table_name, columns, self.vacuum_ratio, self.buffer_pool, self.scan_mode, create=False,
+            executor=self.executor, workers=self.workers, directory=self.directory)
+        self._watch(table)
+        if open_indexes:
+            table.open_indexes()
+        if self.wal is None:
+            self.tables[table_name] = table
+            return table
+        # таблица, открытая после контрольной точки, записывает в журнал своё исходное состояние. под блокировкой
+        # журнала (она же блокировка каталога) таблица попадает либо в список идущей контрольной точки,
+        # либо в журнал уже после неё
+        table.wal = self.wal
+        with self.wal.lock:
+            self.tables[table_name] = table
+            self.wal.log_state(table_name, table._data_size(), table.dead_rows)
+        return table
+
+    def _watch(self, table):
+        if self.result_cache is not None:
+            table.on_change = self.result_cache.invalidate
+
+    def _recover(self, wal_file):
+        # таблицы открываются в состоянии последней контрольной точки, затем повторяются зафиксированные записи
+        # журнала; индексы изменённых таблиц перестраиваются по файлу данных
+        touched = set()
+        for kind, table_name, payload in WriteAheadLog.records(wal_file):
+            if kind == WAL_CHECKPOINT:
+                for name, (size, dead_rows) in json.loads(payload).items():
+                    if self.tables.is_open(name):
+                        table = self.tables[name]
+                    elif os.path.exists(os.path.join(self.directory, name + SCHEMA_SUFFIX)):
+                        table = self._open_table(name, open_indexes=False)
+                    else:
+                        # таблица удалена после контрольной точки
+                        continue
+                    if table._data_size() > size:
+                        # строки, дописанные после контрольной точки без фиксации, отбрасываются
+                        table._truncate_data(size)
+                        touched.add(name)
+                    # короче точки файл бывает только после VACUUM, прерванного уже после замены файла;
+                    # дополнять его нельзя - сжатие повторит запись VACUUM следом за точкой
+                    table.row_count = table._data_size() // table.row_size
+                    table.dead_rows = dead_rows
+                continue
+            if not self.tables.is_open(table_name):
+                continue
+            table = self.tables[table_name]
+            touched.add(table_name)
+            if kind == WAL_INSERT:
+                table._write_rows(INT_STRUCT.unpack_from(payload)[0], payload[INT_STRUCT.size:])
+            elif kind == WAL_DELETE:
+                where = json.loads(payload)
+                if where:
+                    for offset, _ in list(table._scan_matching(where)):
+                        table._mark_deleted(offset)
+                else:
+                    table._truncate_data(0)
+            elif kind == WAL_HEAP:
+                table._write_heap(INT_STRUCT.unpack_from(payload)[0], payload[INT_STRUCT.size:])
+            elif kind == WAL_VACUUM:
+                table._compact()
+            elif kind == WAL_UNDO:
+                # пометки удаления незафиксированной группы снимаются; строки за концом файла уже отрезаны
+                size = table._data_size()
+                for (offset,) in INT_STRUCT.iter_unpack(payload):
+                    if offset < size:
+                        table._write_flag(offset, ROW_LIVE_FLAG)
+        for table_name, table in self.tables.items():
+            if table_name in touched:
+                table.rebuild_indexes()
+                table._save_dead_rows()
+            else:
+                table.open_indexes()
+
+    def _autocommit(self):
+        if self.wal is None or self.in_transaction:
+            return
+        self._uncommitted += 1
+        if self._uncommitted >= self.group_commit:
+            self.wal.commit()
+            self._uncommitted = 0
+
+    def execute(self, sql, stream=False):
+        # stream=True - SELECT возвращает курсор, который читает таблицу по мере fetchone/fetchmany
+        sql = sql.strip()
+        if not sql.startswith(CACHED_STATEMENTS):
+            kind, args = parse_statement(sql)
+            return self._run(kind, args, stream)
+        # литералы вынимаются из текста, и запросы одной формы разбираются один раз
+        shape = LITERAL_PATTERN.sub('?', sql)
+        with self._statement_cache_lock:
+            statement = self.statement_cache.get(shape)
+            if statement is not None:
+                self.statement_cache.move_to_end(shape)
+        if statement is None:
+            statement = self.prepare(shape)
+            if self.statement_cache_size:
+                with self._statement_cache_lock:
+                    self.statement_cache[shape] = statement
+                    if len(self.statement_cache) > self.statement_cache_size:
+                        self.statement_cache.popitem(last=False)
+        literals = [literal.strip("'\"") for literal in LITERAL_PATTERN.findall(sql)]
+        return statement.execute(literals, stream)
 
-    def execute(self, sql):
+    def prepare(self, sql):
+        # запрос с '?' на месте значений -> PreparedStatement, который выполняется через execute(params)
         sql = sql.strip()
-        if sql.startswith('CREATE TABLE'):
-            table_name, columns = parse_create_table(sql)
+        kind, args = parse_statement(sql)
+        return PreparedStatement(self, kind, args, sql)
+
+    def _table(self, table_name):
+        table = self.tables.get(table_name)
+        if table is None:
+            raise ValueError(f"Таблица '{table_name}' не существует")
+        return table
+
+    def _run(self, kind, args, stream=False):
+        if kind == 'SELECT':
+            return self._select(args, stream)
+        with self.writer:
+            self._modify(kind, args)
+
+    def _select(self, args, stream, cache_key=None):
+        table_name, columns, where, limit, offset, group_by, join = args
+        if cache_key is not None:
+            rows = self.result_cache.get(cache_key)
+            if rows is not None:
+                return rows
+        tables = {name: self._table(name) for name in [table_name] + ([join[0]] if join else [])}
+        with _reading(tables.values()):
+            if cache_key is not None:
+                # счётчики изменений снимаются под блокировкой чтения: если таблица изменится до put,
+                # результат не попадёт в кэш
+                snapshot = self.result_cache.snapshot(list(tables))
+            if join is None:
+                rows = tables[table_name].iter_select(columns, where, None if limit is None else int(limit),
+                                                      int(offset), group_by)
+            else:
+                if group_by or (columns != '*' and any(not isinstance(col, str) for col in columns)):
+                    raise ValueError("Агрегаты и GROUP BY в запросах с JOIN не поддерживаются")
+                rows = self._join(table_name, join, columns, where)
+                if offset or limit is not None:
+                    rows = itertools.islice(rows, int(offset), None if limit is None else int(offset) + int(limit))
+            if not stream:
+                rows = list(rows)
+                # пока таблицу меняет открытая транзакция, результат зависит от потока и после COMMIT
+                # или ROLLBACK устаревает без сброса кэша - такие результаты не кэшируются
+                if cache_key is not None and all(table.committed is None for table in tables.values()):
+                    self.result_cache.put(cache_key, rows, list(tables),
+                                          None if join else _point_condition(tables[table_name], where), snapshot)
+                return rows
+            pinned = join is None and tables[table_name]._pins_snapshot(where)
+            return Cursor(CursorSnapshot(list(tables.values()), rows, pinned))
+
+    def _modify(self, kind, args):
+        if kind == 'INSERT':
+            table_name, rows = args
+            self._track(self._table(table_name)).insert_many(rows)
+            self._autocommit()
+        elif kind == 'DELETE':
+            table_name, where = args
+            # запрос, после которого _autocommit фиксирует группу, может зафиксировать её ещё до пометок строк
+            commit_first = not self.in_transaction and self._uncommitted + 1 >= self.group_commit
+            self._track(self._table(table_name)).delete(where, commit_first)
+            self._autocommit()
+        elif kind == 'BEGIN':
+            if self.in_transaction:
+                raise ValueError("Транзакция уже начата")
+            if self.wal is not None:
+                # записи предыдущих запросов, ждущие групповой фиксации, не должны попасть в транзакцию
+                self.wal.commit()
+            self.in_transaction = True
+            # writer остаётся за потоком транзакции до COMMIT или ROLLBACK
+            self.writer.acquire()
+        elif kind == 'COMMIT':
+            if not self.in_transaction:
+                raise ValueError("Нет начатой транзакции")
+            if self.wal is not None:
+                self.wal.commit()
+            self._end_transaction()
+        elif kind == 'ROLLBACK':
+            if not self.in_transaction:
+                raise ValueError("Нет начатой транзакции")
+            self._rollback()
+        elif self.in_transaction:
+            # DDL, VACUUM и COPY фиксируют журнал контрольной точкой и не откатываются
+            raise ValueError(f"{kind} нельзя выполнять внутри транзакции")
+        elif kind == 'CREATE TABLE':
+            table_name, columns, options = args
             if table_name in self.tables:
                 raise ValueError(f"Таблица '{table_name}' уже существует")
-            self.tables[table_name] = Table(table_name, columns)
-        elif sql.startswith('INSERT INTO'):
-            table_name, values = parse_insert(sql)
-            if table_name not in self.tables:
-                raise ValueError(f"Таблица '{table_name}' не существует")
-            self.tables[table_name].insert(values)
-        elif sql.startswith('SELECT'):
-            table_name, columns, where = parse_select(sql)
-            if table_name not in self.tables:
-                raise ValueError(f"Таблица '{table_name}' не существует")
-            return self.tables[table_name].select(columns, where)
-        elif sql.startswith('DELETE FROM'):
-            table_name, where = parse_delete(sql)
-            if table_name not in self.tables:
-                raise ValueError(f"Таблица '{table_name}' не существует")
-            self.tables[table_name].delete(where)
+            unknown = set(options) - {'storage', 'compression'}
+            if unknown:
+                raise ValueError(f"Неизвестный параметр таблицы '{unknown.pop()}'")
+            storage = options.get('storage', STORAGE_ROW)
+            if storage not in TABLE_STORAGES:
+                raise ValueError(f"Неизвестный способ хранения '{storage}'")
+            extra = {}
+            if 'compression' in options:
+                if storage != STORAGE_COMPRESSED:
+                    raise ValueError("Параметр compression допустим только для storage = compressed")
+                extra['compression'] = options['compression']
+            table = TABLE_STORAGES[storage](table_name, columns, self.vacuum_ratio, self.buffer_pool, self.scan_mode,
+                                            executor=self.executor, workers=self.workers, directory=self.directory,
+                                            **extra)
+            self.tables[table_name] = table
+            self._watch(table)
+            if self.wal is not None:
+                # новая таблица попадает в список таблиц контрольной точки
+                table.wal = self.wal
+                self.wal.checkpoint()
+        elif kind == 'CREATE INDEX':
+            index_name, table_name, columns = args
+            self._table(table_name).create_index(index_name, columns)
+        elif kind == 'VACUUM':
+            self._table(args).vacuum()
+        elif kind == 'COPY':
+            table_name, file_name, options = args
+            table = self._table(table_name)
+            unknown = set(options) - {'header', 'delimiter'}
+            if unknown:
+                raise ValueError(f"Неизвестный параметр COPY '{unknown.pop()}'")
+            header = options.get('header', 'true').lower()
+            if header not in ('true', 'false'):
+                raise ValueError("Параметр header принимает значения true или false")
+            delimiter = options.get('delimiter', ',')
+            if len(delimiter) != 1:
+                raise ValueError("Разделитель COPY должен быть одним символом")
+            table.bulk_load(_csv_rows(table, file_name, header == 'true', delimiter))
+        elif kind == 'DROP TABLE':
+            self._table(args).drop()
+            self.tables.pop(args)
+            if self.wal is not None:
+                self.wal.checkpoint()
+
+    def _track(self, table):
+        # первое изменение таблицы в транзакции запоминает размер её данных: до него ROLLBACK отрежет файл,
+        # и до него же видят таблицу читатели из других потоков
+        if self.in_transaction and table.name not in self._transaction:
+            with table.lock.write():
+                size = self._transaction[table.name] = table._data_size()
+                table.undo = []
+                table.committed = (size, threading.get_ident())
+        return table
+
+    def _rollback(self):
+        # таблицы возвращаются в состояние до BEGIN, затем журнал забывает записи транзакции
+        for table_name, size in self._transaction.items():
+            table = self.tables[table_name]
+            table.rollback(size, table.undo)
+        if self.wal is not None:
+            self.wal.rollback()
+        self._end_transaction()
+
+    def _end_transaction(self):
+        for table_name in self._transaction:
+            table = self.tables[table_name]
+            # читатели видят строки транзакции с того же момента, что и журнал
+            with table.lock.write():
+                table.undo = None
+                table.committed = None
+        self._transaction = {}
+        self.in_transaction = False
+        self._uncommitted = 0
+        self.writer.release()
+
+    def _join(self, outer_name, join, columns, where):
+        # SELECT ... FROM outer JOIN inner ON a.x = b.y: условия WHERE по одной таблице проталкиваются в её
+        # проход, затем соединение по индексу внутренней таблицы (index nested loop) или хешем
+        inner_name, left, right = join
+        if inner_name == outer_name:
+            raise ValueError("Соединение таблицы с самой собой не поддерживается")
+        tables = {outer_name: self._table(outer_name), inner_name: self._table(inner_name)}
+        (left_table, left_col), (right_table, right_col) = (_resolve_column(tables, left),
+                                                            _resolve_column(tables, right))
+        if left_table == right_table:
+            raise ValueError("Условие ON должно связывать столбцы двух таблиц")
+        keys = {left_table: left_col, right_table: right_col}
+        # ключи сравниваются по декодированным значениям, поэтому VARCHAR разной длины соединяются между собой
+        key_types = {'INT' if tables[name].columns[tables[name]._get_column_index(col_name)].type == 'INT'
+                     else 'VARCHAR' for name, col_name in keys.items()}
+        if len(key_types) > 1:
+            raise ValueError("Столбцы условия ON должны быть одного типа")
+
+        if columns == '*':
+            refs = [(name, col.name) for name in (outer_name, inner_name) for col in tables[name].columns]
         else:
-            raise ValueError("Неизвестный SQL-запрос")
+            refs = [_resolve_column(tables, col) for col in columns]
+        conditions = {outer_name: [], inner_name: []}
+        if where:
+            for condition in (where[1] if _is_compound(where) and where[0] == 'AND' else [where]):
+                owners = {_resolve_column(tables, col_name)[0] for col_name in _where_columns(condition)}
+                if len(owners) > 1:
+                    raise ValueError("Каждое условие WHERE в запросе с JOIN должно относиться к одной таблице")
+                conditions[owners.pop()].append(
+                    _rename_where(condition, lambda col_name: _resolve_column(tables, col_name)[1]))
+        wheres = {name: None if not parts else parts[0] if len(parts) == 1 else ('AND', parts)
+                  for name, parts in conditions.items()}
+        # каждая сторона проецируется на ключ соединения (первым) и свои выводимые столбцы
+        needed = {name: list(dict.fromkeys([keys[name]] + [col_name for owner, col_name in refs if owner == name]))
+                  for name in tables}
+
+        # внешняя сторона - FROM, внутренняя - JOIN; если B+дерево есть только у FROM, стороны меняются
+        outer, inner = tables[outer_name], tables[inner_name]
+        btree = inner._btree_for(keys[inner_name])
+        if btree is None and outer._btree_for(keys[outer_name]) is not None:
+            outer, inner = inner, outer
+            btree = inner._btree_for(keys[inner.name])
+        if btree is not None:
+            decode = inner._projection(needed[inner.name])
+            snapshot = inner._snapshot()
+            pairs = ((row, decode(row_data))
+                     for row in outer._iter_rows(needed[outer.name], wheres[outer.name])
+                     for _, row_data in inner._fetch_rows(btree.search((row[0],)), wheres[inner.name], snapshot))
+        else:
+            # хеш-таблица строится по меньшей стороне
+            if outer.row_count - outer.dead_rows < inner.row_count - inner.dead_rows:
+                outer, inner = inner, outer
+            pairs = _hash_join(inner._iter_rows(needed[inner.name], wheres[inner.name]),
+                               outer._iter_rows(needed[outer.name], wheres[outer.name]),
+                               self.join_memory, self.directory)
+        side = {outer.name: 0, inner.name: 1}
+        positions = [(side[name], needed[name].index(col_name)) for name, col_name in refs]
+        for pair in pairs:
+            yield [pair[n][i] for n, i in positions]
+
+    def executemany(self, sql, rows):
+        # пакетная вставка: INSERT INTO t VALUES (?, ?, ...) и последовательность строк значений
+        match = re.match(r'INSERT INTO (\w+) VALUES \(([?,\s]+)\)$', sql.strip())
+        if not match:
+            raise ValueError("executemany поддерживает только INSERT INTO ... VALUES (?, ...)")
+        with self.writer:
+            self._track(self._table(match.group(1))).insert_many(rows)
+            self._autocommit()
+
+
+# запросы, которые кэшируются по форме; литералы в них - строки в кавычках и числа вне идентификаторов
+CACHED_STATEMENTS = ('SELECT', 'INSERT INTO', 'DELETE FROM')
+LITERAL_PATTERN = re.compile(r"""'[^']*'|"[^"]*"|(?<![\w.])-?\d+(?![\w.])""")
+# агрегат в списке столбцов SELECT: COUNT(*), SUM(col), MIN(col), MAX(col), AVG(col)
+AGGREGATE_PATTERN = re.compile(r'(COUNT|SUM|MIN|MAX|AVG)\((\*|\w+)\)$')
+# место параметра '?' в разобранном запросе
+PARAMETER = type('Parameter', (), {'__repr__': lambda self: '?'})()
+
+
+def parse_statement(sql):
+    # текст запроса -> (вид запроса, аргументы разбора)
+    if sql.startswith('SELECT'):
+        return 'SELECT', parse_select(sql)
+    if sql.startswith('INSERT INTO'):
+        return 'INSERT', parse_insert(sql)
+    if sql.startswith('DELETE FROM'):
+        return 'DELETE', parse_delete(sql)
+    if sql.startswith('CREATE TABLE'):
+        return 'CREATE TABLE', parse_create_table(sql)
+    if sql.startswith('CREATE INDEX'):
+        return 'CREATE INDEX', parse_create_index(sql)
+    if sql.startswith('VACUUM'):
+        return 'VACUUM', parse_vacuum(sql)
+    if sql.startswith('DROP TABLE'):
+        return 'DROP TABLE', parse_drop_table(sql)
+    if sql.startswith('COPY'):
+        return 'COPY', parse_copy(sql)
+    if sql in ('BEGIN', 'COMMIT', 'ROLLBACK'):
+        return sql, None
+    raise ValueError("Неизвестный SQL-запрос")
 
 
 def parse_create_table(sql):
+    # необязательный хвост WITH (параметр = значение, ...) задаёт параметры хранения таблицы
+    options = {}
+    options_match = re.search(r' WITH \(([^()]*)\)$', sql)
+    if options_match:
+        sql = sql[:options_match.start()]
+        for option in options_match.group(1).split(','):
+            key, sep, value = option.partition('=')
+            if not sep:
+                raise ValueError("неверный синтаксис параметров CREATE TABLE")
+            options[key.strip()] = value.strip()
     match = re.match(r'CREATE TABLE (\w+) \((.+)\)', sql)
     if match:
         table_name = match.group(1)
@@ -250,49 +3891,154 @@ def parse_create_table(sql):
             type = parts[1]
             length = int(parts[2][1:-1]) if type == 'VARCHAR' else None
             columns.append(Column(name, type))
-        return table_name, columns
+        return table_name, columns, options
     raise ValueError("неверный синтаксис CREATE TABLE")
 
 
+def parse_create_index(sql):
+    match = re.match(r'CREATE INDEX (\w+) ON (\w+) \((.+)\)$', sql)
+    if match:
+        columns = [col.strip() for col in match.group(3).split(',')]
+        return match.group(1), match.group(2), columns
+    raise ValueError("неверный синтаксис CREATE INDEX")
+
+
 def parse_select(sql):
-    pattern = r'SELECT (.+) FROM (\w+)( WHERE (.+))?'
+    pattern = (r'SELECT (.+) FROM (\w+)(?: JOIN (\w+) ON ([\w.]+) = ([\w.]+))?(?: WHERE (.+?))?'
+               r'(?: GROUP BY (.+?))?(?: LIMIT (\d+|\?)(?: OFFSET (\d+|\?))?)?$')
     match = re.match(pattern, sql)
     if match:
         columns_str = match.group(1)
         table_name = match.group(2)
-        where_str = match.group(4)
+        # соединение -> (внутренняя таблица, левый столбец ON, правый столбец ON)
+        join = match.group(3, 4, 5) if match.group(3) else None
+        where_str = match.group(6)
+        group_by = [col.strip() for col in match.group(7).split(',')] if match.group(7) else None
+        limit = _parse_value(match.group(8)) if match.group(8) is not None else None
+        offset = _parse_value(match.group(9)) if match.group(9) is not None else 0
 
         if columns_str.strip() == '*':
             columns = '*'
         else:
-            columns = [col.strip() for col in columns_str.split(',')]
-
-        if where_str:
-            where_match = re.match(r'(\w+) = (.+)', where_str)
-            if where_match:
-                col_name = where_match.group(1)
-                value = where_match.group(2).strip("'\"")
-                where = (col_name, '=', value)
-            else:
-                raise ValueError("неверный синтаксис оператора WHERE")
-        else:
-            where = None
+            # агрегат -> (функция, столбец или '*'), обычный столбец остаётся именем
+            columns = []
+            for col in columns_str.split(','):
+                aggregate = AGGREGATE_PATTERN.match(col.strip())
+                columns.append((aggregate.group(1), aggregate.group(2)) if aggregate else col.strip())
+
+        where = parse_where(where_str) if where_str else None
 
-        return table_name, columns, where
+        return table_name, columns, where, limit, offset, group_by, join
     raise ValueError("неверный синтаксис SELECT")
 
 
+WHERE_TOKEN_PATTERN = re.compile(r"""\s*('[^']*'|"[^"]*"|<=|>=|[()<>=]|[^\s()<>=]+)""")
+COMPARISON_OPERATORS = ('=', '<', '<=', '>', '>=')
+
+
+def parse_where(where_str):
+    # условия вида col = v, col < v, col <= v, col > v, col >= v, col BETWEEN a AND b,
+    # соединённые AND/OR (AND связывает сильнее) и скобками.
+    # простое условие -> (столбец, оператор, значение), составное -> ('AND' | 'OR', [условия])
+    tokens = []
+    pos = 0
+    while where_str[pos:].strip():
+        token_match = WHERE_TOKEN_PATTERN.match(where_str, pos)
+        tokens.append(token_match.group(1))
+        pos = token_match.end()
+    where, pos = _parse_disjunction(tokens, 0)
+    if pos != len(tokens):
+        raise ValueError("неверный синтаксис оператора WHERE")
+    return where
+
+
+def _parse_disjunction(tokens, pos):
+    conditions = []
+    while True:
+        condition, pos = _parse_conjunction(tokens, pos)
+        conditions.append(condition)
+        if pos < len(tokens) and tokens[pos] == 'OR':
+            pos += 1
+            continue
+        break
+    return (conditions[0] if len(conditions) == 1 else ('OR', conditions)), pos
+
+
+def _parse_conjunction(tokens, pos):
+    conditions = []
+    while True:
+        condition, pos = _parse_condition(tokens, pos)
+        conditions.append(condition)
+        if pos < len(tokens) and tokens[pos] == 'AND':
+            pos += 1
+            continue
+        break
+    return (conditions[0] if len(conditions) == 1 else ('AND', conditions)), pos
+
+
+def _parse_condition(tokens, pos):
+    if pos >= len(tokens):
+        raise ValueError("неверный синтаксис оператора WHERE")
+    if tokens[pos] == '(':
+        condition, pos = _parse_disjunction(tokens, pos + 1)
+        if pos >= len(tokens) or tokens[pos] != ')':
+            raise ValueError("неверный синтаксис оператора WHERE: нет закрывающей скобки")
+        return condition, pos + 1
+    # столбец - имя или таблица.имя (в запросах с JOIN)
+    if pos + 2 >= len(tokens) or not re.match(r'\w+(?:\.\w+)?$', tokens[pos]):
+        raise ValueError("неверный синтаксис оператора WHERE")
+    col_name, op = tokens[pos], tokens[pos + 1]
+    if op == 'BETWEEN':
+        if pos + 4 >= len(tokens) or tokens[pos + 3] != 'AND':
+            raise ValueError("неверный синтаксис BETWEEN")
+        return (col_name, 'BETWEEN', (_parse_value(tokens[pos + 2]), _parse_value(tokens[pos + 4]))), pos + 5
+    if op not in COMPARISON_OPERATORS:
+        raise ValueError(f"неподдерживаемый оператор '{op}'")
+    return (col_name, op, _parse_value(tokens[pos + 2])), pos + 3
+
+
+def _parse_value(token):
+    if token == '?':
+        return PARAMETER
+    return token.strip("'\"")
+
+
+# параметр COPY ... WITH (...): значение в кавычках может содержать запятую
+COPY_OPTION_PATTERN = re.compile(r"""\s*(\w+)\s*=\s*('[^']*'|[^,'\s]+)\s*(?:,|$)""")
+INSERT_ROW_PATTERN = re.compile(r"""\s*\(((?:'[^']*'|"[^"]*"|[^()'"])*)\)\s*(,|$)""")
+INSERT_VALUE_PATTERN = re.compile(r"""\s*('[^']*'|"[^"]*"|[^,]*?)\s*(,|$)""")
+
+
 def parse_insert(sql):
-    pattern = r'INSERT INTO (\w+) VALUES \((.+)\)'
+    # INSERT INTO t VALUES (...), (...), ... -> имя таблицы и список строк значений
+    pattern = r'INSERT INTO (\w+) VALUES (\(.+\))$'
     match = re.match(pattern, sql)
     if match:
         table_name = match.group(1)
-        values_str = match.group(2)
-        values = [val.strip().strip("'\"") for val in values_str.split(',')]
-        return table_name, values
+        rows_str = match.group(2)
+        rows = []
+        pos = 0
+        while pos < len(rows_str):
+            row_match = INSERT_ROW_PATTERN.match(rows_str, pos)
+            if not row_match:
+                raise ValueError("неверный синтаксис INSERT")
+            rows.append(parse_values(row_match.group(1)))
+            pos = row_match.end()
+        return table_name, rows
     raise ValueError("неверный синтаксис INSERT")
 
 
+def parse_values(values_str):
+    values = []
+    pos = 0
+    while True:
+        value_match = INSERT_VALUE_PATTERN.match(values_str, pos)
+        values.append(_parse_value(value_match.group(1)))
+        if not value_match.group(2):
+            return values
+        pos = value_match.end()
+
+
 def parse_delete(sql):
     pattern = r'DELETE FROM (\w+)( WHERE (.+))?'
     match = re.match(pattern, sql)
@@ -300,21 +4046,43 @@ def parse_delete(sql):
         table_name = match.group(1)
         where_str = match.group(3)
 
-        if where_str:
-            where_match = re.match(r'(\w+) = (.+)', where_str)
-            if where_match:
-                col_name = where_match.group(1)
-                value = where_match.group(2).strip("'\"")
-                where = (col_name, '=', value)
-            else:
-                raise ValueError("неверный синтаксис WHERE")
-        else:
-            where = None
+        where = parse_where(where_str) if where_str else None
 
         return table_name, where
     raise ValueError("yеверный синтаксис DELETE")
 
 
+def parse_drop_table(sql):
+    match = re.match(r'DROP TABLE (\w+)$', sql)
+    if match:
+        return match.group(1)
+    raise ValueError("неверный синтаксис DROP TABLE")
+
+
+def parse_copy(sql):
+    # COPY t FROM 'file.csv' [WITH (header = true | false, delimiter = ';')]
+    match = re.match(r"COPY (\w+) FROM '([^']+)'(?: WITH \(([^()]*)\))?$", sql)
+    if not match:
+        raise ValueError("неверный синтаксис COPY")
+    options = {}
+    text = match.group(3) or ''
+    pos = 0
+    while pos < len(text):
+        option = COPY_OPTION_PATTERN.match(text, pos)
+        if not option:
+            raise ValueError("неверный синтаксис параметров COPY")
+        options[option.group(1)] = option.group(2).strip("'")
+        pos = option.end()
+    return match.group(1), match.group(2), options
+
+
+def parse_vacuum(sql):
+    match = re.match(r'VACUUM (\w+)$', sql)
+    if match:
+        return match.group(1)
+    raise ValueError("неверный синтаксис VACUUM")
+
+
 if __name__ == "__main__":
     db = Database()
 
@@ -331,4 +4099,5 @@ if __name__ == "__main__":
     print("Имя с id=3:", db.execute("SELECT name FROM users WHERE id = 3"))
 
     db.execute("DELETE FROM users WHERE id = 1")
-    print("После удаления поля с id=1:", db.execute("SELECT * FROM users"))
\ No newline at end of file
+    print("После удаления поля с id=1:", db.execute("SELECT * FROM users"))
+    print("Буферный пул:", db.buffer_pool.stats())
\ No newline at end of file
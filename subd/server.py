@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import functools
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from mainSUBD import Database
+
+# кадр протокола: длина тела (4 байта, big-endian) и тело - JSON в UTF-8.
+# запрос: {"sql": ..., "params": [...]} или {"sql": "INSERT INTO t VALUES (?, ...)", "many": [[...], ...]},
+# ответ: {"rows": [...]} (null для запросов без результата) или {"error": "..."}.
+# ответы на запросы одного соединения идут в порядке запросов
+FRAME_HEADER = struct.Struct('>I')
+# кадр длиннее считается мусором, и соединение закрывается
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5440
+# сколько принятых, но ещё не выполненных запросов соединения сервер держит в очереди; дальше он перестаёт
+# читать сокет, и клиент упирается в заполненный буфер TCP
+PIPELINE_DEPTH = 256
+# сколько секунд открытая транзакция может ждать следующего запроса; дальше она откатывается, а соединение
+# закрывается, чтобы забытая транзакция не держала писателей базы
+DEFAULT_TRANSACTION_TIMEOUT = 60
+
+
+async def read_frame(reader):
+    # следующий кадр из потока или None, если собеседник закрыл соединение между кадрами
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise
+        return None
+    size = FRAME_HEADER.unpack(header)[0]
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Кадр длиной {size} байт превышает допустимые {MAX_FRAME_SIZE}")
+    return json.loads(await reader.readexactly(size))
+
+
+def encode_frame(message):
+    body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+class Server:
+    # TCP-сервер над одной базой: все соединения делят её буферный пул и кэш запросов.
+    # сокеты обслуживает цикл asyncio, а сами запросы, читающие файлы, выполняются в пуле потоков.
+    # запросы одного соединения выполняются строго по очереди, а читаются из сокета, не дожидаясь
+    # ответов на предыдущие (конвейер); запросы разных соединений идут параллельно
+    def __init__(self, database, host=DEFAULT_HOST, port=DEFAULT_PORT, threads=None,
+                 transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT):
+        self.database = database
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(threads)
+        # изменяющие запросы вне транзакций выполняет один поток: пока чужая транзакция держит писателей базы,
+        # её ждёт только он, а потоки пула остаются свободны для SELECT
+        self.write_executor = ThreadPoolExecutor(1)
+        # None - транзакция ждёт запросов сколько угодно
+        self.transaction_timeout = transaction_timeout
+        # запросы с параметрами разбираются один раз на текст запроса; при statement_cache_size=0 кэш выключен,
+        # как и в самой базе
+        if database.statement_cache_size:
+            self._prepare = functools.lru_cache(maxsize=database.statement_cache_size)(database.prepare)
+        else:
+            self._prepare = database.prepare
+        self.server = None
+        self.connections = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        # при port=0 система выбирает свободный порт
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.executor.shutdown()
+        self.write_executor.shutdown()
+
+    async def _serve_connection(self, reader, writer):
+        self.connections += 1
+        queue = asyncio.Queue(PIPELINE_DEPTH)
+        responder = asyncio.create_task(self._respond(queue, writer))
+        try:
+            while True:
+                try:
+                    request = await read_frame(reader)
+                except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                await queue.put(request)
+        finally:
+            # запросы, принятые до закрытия, выполняются, и ответы на них отправляются
+            await queue.put(None)
+            await responder
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.connections -= 1
+
+    async def _respond(self, queue, writer):
+        loop = asyncio.get_running_loop()
+        broken = False
+        # BEGIN держит блокировку писателей базы за потоком, который его выполнил, поэтому запросы
+        # соединения от BEGIN до COMMIT или ROLLBACK выполняются в отдельном потоке этого соединения
+        transaction = None
+        while True:
+            if transaction is None or broken:
+                request = await queue.get()
+            else:
+                try:
+                    request = await asyncio.wait_for(queue.get(), self.transaction_timeout)
+                except asyncio.TimeoutError:
+                    # клиент молчит посреди транзакции: она откатывается, а соединение закрывается, чтобы
+                    # следующие запросы клиента не выполнились вне транзакции, которую он считает открытой
+                    await self._rollback(transaction)
+                    transaction = None
+                    broken = True
+                    writer.close()
+                    continue
+            if request is None:
+                break
+            if broken:
+                # клиент пропал: оставшиеся запросы только вынимаются из очереди, чтобы чтение не встало
+                continue
+            statement = request.get('sql') if isinstance(request, dict) else None
+            statement = statement.strip() if isinstance(statement, str) else None
+            if statement == 'BEGIN' and transaction is None:
+                transaction = ThreadPoolExecutor(1)
+            if transaction is not None:
+                executor = transaction
+            elif statement is not None and 'many' not in request and statement.startswith('SELECT'):
+                executor = self.executor
+            else:
+                executor = self.write_executor
+            response = await loop.run_in_executor(executor, self._execute, request)
+            if statement in ('COMMIT', 'ROLLBACK') and transaction is not None and 'error' not in response:
+                transaction.shutdown()
+                transaction = None
+            writer.write(encode_frame(response))
+            # пока в очереди есть запросы, ответы копятся в буфере и уходят в сокет пачкой
+            if queue.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    broken = True
+        if transaction is not None:
+            # транзакция оборванного соединения откатывается
+            await self._rollback(transaction)
+
+    async def _rollback(self, transaction):
+        await asyncio.get_running_loop().run_in_executor(transaction, self._execute, {'sql': 'ROLLBACK'})
+        transaction.shutdown()
+
+    def _execute(self, request):
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get('sql'), str):
+                raise ValueError("Запрос должен содержать строку sql")
+            sql = request['sql']
+            if sql.strip().startswith('COPY'):
+                # COPY читает файл по пути на машине сервера - клиенту это дало бы доступ к любому файлу,
+                # который может прочитать процесс сервера
+                raise ValueError("COPY по сети не выполняется: загрузите файл на сервере или через executemany")
+            if 'many' in request:
+                self.database.executemany(sql, request['many'])
+                return {'rows': None}
+            if 'params' in request:
+                rows = self._prepare(sql).execute(request['params'])
+            else:
+                rows = self.database.execute(sql)
+            return {'rows': rows}
+        except Exception as e:
+            # ошибка запроса возвращается клиенту, соединение остаётся открытым
+            return {'error': str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"}
+
+
+async def serve(path, host=DEFAULT_HOST, port=DEFAULT_PORT, threads=None, wal_file=None, result_cache_size=0,
+                transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT):
+    database = Database(path, wal_file=wal_file, result_cache_size=result_cache_size)
+    server = await Server(database, host, port, threads, transaction_timeout).start()
+    print(f"Сервер слушает {host}:{server.port}, база: {path}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+        database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TCP-сервер базы mainSUBD")
+    parser.add_argument('path', help="каталог базы")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--threads', type=int, default=None, help="потоков для выполнения запросов")
+    parser.add_argument('--wal', default=None, help="файл журнала упреждающей записи в каталоге базы")
+    parser.add_argument('--result-cache', type=int, default=0, help="байт памяти под кэш результатов SELECT")
+    parser.add_argument('--transaction-timeout', type=float, default=DEFAULT_TRANSACTION_TIMEOUT,
+                        help="секунд бездействия, после которых открытая транзакция откатывается")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.path, args.host, args.port, args.threads, args.wal, args.result_cache,
+                          args.transaction_timeout))
+    except KeyboardInterrupt:
+        pass
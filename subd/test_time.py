@@ -1,17 +1,25 @@
 import matplotlib.pyplot as plt
 import time
 import os
+from contextlib import closing
 from timeit import timeit
 from mainSUBD import Database, Column
 
 
-def create_table_with_records(db, table_name, columns, N):
-    columns_def = ', '.join(
-        f"{col.name} {col.type}" + (f"({col.length})" if col.type == 'VARCHAR' else '')
-        for col in columns
-    )
+def create_table_with_records(db, table_name, columns, N, batch=False):
+    columns_def = ', '.join(f"{col.name} {col.type}" for col in columns)
     db.execute(f"CREATE TABLE {table_name} ({columns_def})")
 
+    if batch:
+        # все строки уходят одной пачкой через executemany
+        placeholders = ', '.join('?' for _ in columns)
+        if 'id' in [col.name for col in columns]:
+            rows = [(i, f"Data_{i}") for i in range(N)]
+        else:
+            rows = [(f"Data_{i}",) for i in range(N)]
+        db.executemany(f"INSERT INTO {table_name} VALUES ({placeholders})", rows)
+        return
+
     for i in range(N):
         if 'id' in [col.name for col in columns]:
             db.execute(f"INSERT INTO {table_name} VALUES ({i}, 'Data_{i}')")
@@ -19,20 +27,20 @@ def create_table_with_records(db, table_name, columns, N):
             db.execute(f"INSERT INTO {table_name} VALUES ('Data_{i}')")
 
 
-def measure_insert(db, table_name, columns, N):
-    start = time.time()
-    create_table_with_records(db, table_name, columns, N)
-    end = time.time()
-    # удаляем файлы после замеров
-    if os.path.exists(f"{table_name}.dat"):
-        os.remove(f"{table_name}.dat")
-    if os.path.exists(f"{table_name}.schema.json"):
-        os.remove(f"{table_name}.schema.json")
-    for col in columns:
-        if col.type == 'INT':
-            idx_file = f"{table_name}_{col.name}.idx"
-            if os.path.exists(idx_file):
-                os.remove(idx_file)
+def remove_table_files(table_name):
+    for file_name in [f"{table_name}.dat", f"{table_name}.schema.json", f"{table_name}.seg",
+                      f"{table_name}_id.idx", f"{table_name}_idx_data.hidx"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+def measure_insert(table_name, columns, N, batch=False):
+    with closing(Database()) as db:
+        start = time.time()
+        create_table_with_records(db, table_name, columns, N, batch)
+        end = time.time()
+    # удаляем файлы после замеров, когда база уже закрыта
+    remove_table_files(table_name)
     return end - start
 
 
@@ -52,66 +60,88 @@ def measure_delete(db, table_name, where_condition):
 
 
 N_values = [1000, 5000, 10000]
+# для точечной выборки по индексу берём N до миллиона, время должно оставаться почти постоянным
+index_N_values = [1000, 10000, 100000, 1000000]
 
 insert_times_with_index = []
 insert_times_without_index = []
+insert_times_batch = []
 select_times_with_index = []
 select_times_without_index = []
 delete_times_with_index = []
 delete_times_without_index = []
-
-columns_with_int = [Column('id', 'INT'), Column('data', 'VARCHAR')]
-columns_without_int = [Column('data', 'VARCHAR')]
-
-for N in N_values:
-    # замеряем insert
-    db = Database()
-    time_with = measure_insert(db, "table_with_index", columns_with_int, N)
-    insert_times_with_index.append(time_with)
-
-    db = Database()
-    time_without = measure_insert(db, "table_without_index", columns_without_int, N)
-    insert_times_without_index.append(time_without)
-    # замеряем select
-    db = Database()
-    create_table_with_records(db, "table_a", columns_with_int, N)
-    select_time_with = measure_select(db, "table_a", ('id', '=', N // 2), repeats=1000)
-    select_times_with_index.append(select_time_with)
-
-    db = Database()
-    create_table_with_records(db, "table_b", columns_without_int, N)
-    select_time_without = measure_select(db, "table_b", ('data', '=', f"Data_{N // 2}"), repeats=1000)
-    select_times_without_index.append(select_time_without)
-
-    # замеряем delete
-    db = Database()
-    create_table_with_records(db, "table_a", columns_with_int, N)
-    delete_time_with = measure_delete(db, "table_a", ('id', '=', N // 2))
-    delete_times_with_index.append(delete_time_with)
-
-    db = Database()
-    create_table_with_records(db, "table_b", columns_without_int, N)
-    delete_time_without = measure_delete(db, "table_b", ('data', '=', f"Data_{N // 2}"))
-    delete_times_without_index.append(delete_time_without)
-
-plt.figure(figsize=(12, 8))
-plt.subplot(3, 1, 1)
+select_times_index_scaling = []
+select_times_hash_index = []
+
+columns_with_int = [Column('id', 'INT'), Column('data', 'VARCHAR(20)')]
+columns_without_int = [Column('data', 'VARCHAR(20)')]
+
+try:
+    for N in N_values:
+        # замеряем insert
+        insert_times_with_index.append(measure_insert("table_with_index", columns_with_int, N))
+        insert_times_without_index.append(measure_insert("table_without_index", columns_without_int, N))
+        insert_times_batch.append(measure_insert("table_with_index", columns_with_int, N, batch=True))
+
+        # замеряем select
+        with closing(Database()) as db:
+            create_table_with_records(db, "table_a", columns_with_int, N)
+            select_time_with = measure_select(db, "table_a", ('id', '=', N // 2), repeats=1000)
+            select_times_with_index.append(select_time_with)
+
+            create_table_with_records(db, "table_b", columns_without_int, N)
+            select_time_without = measure_select(db, "table_b", ('data', '=', f"Data_{N // 2}"), repeats=1000)
+            select_times_without_index.append(select_time_without)
+
+            # тот же поиск по VARCHAR, но с хеш-индексом
+            db.execute("CREATE INDEX idx_data ON table_b (data)")
+            select_time_hash = measure_select(db, "table_b", ('data', '=', f"Data_{N // 2}"), repeats=1000)
+            select_times_hash_index.append(select_time_hash)
+        remove_table_files("table_a")
+        remove_table_files("table_b")
+
+        # замеряем delete
+        with closing(Database()) as db:
+            create_table_with_records(db, "table_a", columns_with_int, N)
+            delete_time_with = measure_delete(db, "table_a", ('id', '=', N // 2))
+            delete_times_with_index.append(delete_time_with)
+
+            create_table_with_records(db, "table_b", columns_without_int, N)
+            delete_time_without = measure_delete(db, "table_b", ('data', '=', f"Data_{N // 2}"))
+            delete_times_without_index.append(delete_time_without)
+        remove_table_files("table_a")
+        remove_table_files("table_b")
+
+    for N in index_N_values:
+        with closing(Database()) as db:
+            create_table_with_records(db, "table_c", columns_with_int, N, batch=True)
+            select_times_index_scaling.append(measure_select(db, "table_c", ('id', '=', N // 2), repeats=1000))
+        remove_table_files("table_c")
+finally:
+    # удаляем созданные файлы и после упавшего замера; базы к этому моменту закрыты
+    for table_name in ["table_a", "table_b", "table_c", "table_with_index", "table_without_index"]:
+        remove_table_files(table_name)
+
+plt.figure(figsize=(12, 10))
+plt.subplot(4, 1, 1)
 plt.plot(N_values, insert_times_with_index, label='С индексом')
 plt.plot(N_values, insert_times_without_index, label='Без индекса')
+plt.plot(N_values, insert_times_batch, label='Пакетная вставка (executemany)')
 plt.title('Время вставки vs N')
 plt.xlabel('N (количество записей)')
 plt.ylabel('Время (с)')
 plt.legend()
 
-plt.subplot(3, 1, 2)
+plt.subplot(4, 1, 2)
 plt.plot(N_values, select_times_with_index, label='С индексом')
 plt.plot(N_values, select_times_without_index, label='Без индекса')
+plt.plot(N_values, select_times_hash_index, label='Хеш-индекс по VARCHAR')
 plt.title('Время выборки vs N')
 plt.xlabel('N (количество записей)')
 plt.ylabel('Время (с)')
 plt.legend()
 
-plt.subplot(3, 1, 3)
+plt.subplot(4, 1, 3)
 plt.plot(N_values, delete_times_with_index, label='С индексом')
 plt.plot(N_values, delete_times_without_index, label='Без индекса')
 plt.title('Время удаления vs N')
@@ -119,14 +149,14 @@ plt.xlabel('N (количество записей)')
 plt.ylabel('Время (с)')
 plt.legend()
 
+plt.subplot(4, 1, 4)
+plt.plot(index_N_values, select_times_index_scaling, marker='o', label='Поиск по B+дереву')
+plt.xscale('log')
+plt.title('Время выборки по индексу vs N')
+plt.xlabel('N (количество записей)')
+plt.ylabel('Время (с)')
+plt.legend()
+
 plt.tight_layout()
 plt.show()
 
-# удаляем созданные файлы
-for table_name in ["table_a", "table_b", "table_with_index", "table_without_index"]:
-    if os.path.exists(f"{table_name}.dat"):
-        os.remove(f"{table_name}.dat")
-    if os.path.exists(f"{table_name}.schema.json"):
-        os.remove(f"{table_name}.schema.json")
-    if os.path.exists(f"{table_name}_id.idx"):
-        os.remove(f"{table_name}_id.idx")
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+# движок лежит в subd и импортируется тестами как mainSUBD
+SUBD = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'subd')
+sys.path.insert(0, SUBD)
+
+STORAGES = ['row', 'column', 'heap', 'compressed']
+
+
+def run_and_crash(directory, *parts, **options):
+    # код выполняется в отдельном процессе над базой Database(directory, **options), который завершается
+    # через os._exit без закрытия базы и журнала
+    code = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {SUBD!r})
+        from mainSUBD import Database
+        db = Database({directory!r}, **{options!r})
+    """) + ''.join(map(textwrap.dedent, parts)) + "\nos._exit(0)\n"
+    subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,83 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES
+from mainSUBD import Database
+
+
+class TestAggregates(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(self.tmp.name)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def create(self, table, storage):
+        self.db.execute(f"CREATE TABLE {table} (id INT, city VARCHAR(8), score INT) WITH (storage = {storage})")
+        rows = [(i, f"c{i % 4}", (i * 37) % 101) for i in range(500)]
+        self.db.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", rows)
+        return rows
+
+    @staticmethod
+    def groups(rows, key):
+        result = {}
+        for row in rows:
+            result.setdefault(key(row), []).append(row[2])
+        return result
+
+    def test_group_by(self):
+        """Тест GROUP BY с COUNT, SUM, AVG, MIN и MAX по строковому и целому столбцам"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                # удалённые строки в группы не попадают
+                rows = [row for row in self.create(table, storage) if row[0] % 5]
+                for i in range(0, 500, 5):
+                    self.db.execute(f"DELETE FROM {table} WHERE id = {i}")
+                result = self.db.execute(f"SELECT city, COUNT(*), SUM(score), AVG(score), MIN(score), MAX(id)"
+                                         f" FROM {table} GROUP BY city")
+                expected = [[city, len(scores), sum(scores), sum(scores) / len(scores), min(scores),
+                             max(row[0] for row in rows if row[1] == city)]
+                            for city, scores in self.groups(rows, lambda row: row[1]).items()]
+                self.assertEqual(sorted(result), sorted(expected))
+                # группы по INT-столбцу с условием
+                result = self.db.execute(f"SELECT SUM(score), score FROM {table} WHERE city = 'c1' GROUP BY score")
+                expected = [[sum(scores), score] for score, scores in
+                            self.groups([row for row in rows if row[1] == 'c1'], lambda row: row[2]).items()]
+                self.assertEqual(sorted(result), sorted(expected))
+                # без GROUP BY по пустой выборке - одна строка
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*), SUM(score), AVG(score) FROM {table}"
+                                                 f" WHERE city = 'none'"), [[0, None, None]])
+                self.assertEqual(self.db.execute(f"SELECT city FROM {table} WHERE id < 0 GROUP BY city"), [])
+
+    def test_errors(self):
+        """Тест ошибок: столбец вне GROUP BY и SUM по VARCHAR"""
+        self.create('t', 'row')
+        for sql in ["SELECT city, id FROM t GROUP BY city", "SELECT SUM(city) FROM t", "SELECT AVG(*) FROM t"]:
+            with self.assertRaises(ValueError):
+                self.db.execute(sql)
+
+    def test_index_only_min_max(self):
+        """Тест: MIN/MAX по INT-столбцу и COUNT(*) берутся из B+дерева без прохода и пропускают удалённые строки"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                rows = self.create(table, storage)
+                self.db.execute(f"DELETE FROM {table} WHERE id >= 495 OR score <= 1")
+                rows = [row for row in rows if row[0] < 495 and row[2] > 1]
+                target = self.db.tables[table]
+                with mock.patch.object(target, '_iter_rows', side_effect=AssertionError("проход по таблице")):
+                    self.assertEqual(self.db.execute(f"SELECT MIN(score), MAX(score), MAX(id), COUNT(*) FROM {table}"),
+                                     [[min(row[2] for row in rows), max(row[2] for row in rows), 494, len(rows)]])
+                    self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE score BETWEEN 10 AND 20"),
+                                     [[sum(1 for row in rows if 10 <= row[2] <= 20)]])
+                # MIN/MAX с условием считаются проходом
+                self.assertEqual(self.db.execute(f"SELECT MIN(id) FROM {table} WHERE id > 100"),
+                                 [[min(row[0] for row in rows if row[0] > 100)]])
+
+
+if __name__ == '__main__':
+    unittest.main()
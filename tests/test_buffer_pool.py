@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import PAGE_SIZE, BufferPool, Database
+
+
+class TestBufferPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pool = BufferPool(capacity=2 * PAGE_SIZE)
+        self.addCleanup(self.pool.close)
+        self.path = os.path.join(self.tmp.name, 'data.dat')
+        # четыре страницы, каждая заполнена своим байтом
+        self.data = b''.join(bytes([n]) * PAGE_SIZE for n in range(4))
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def file_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_hits_and_eviction(self):
+        """Тест счётчиков попаданий и промахов и вытеснения давно не использованной страницы при заполнении пула"""
+        self.assertEqual(self.pool.get_page(self.path, 0), self.data[:PAGE_SIZE])
+        self.pool.get_page(self.path, 1)
+        self.pool.get_page(self.path, 0)
+        self.assertEqual(self.pool.stats()['hits'], 1)
+        self.assertEqual(self.pool.stats()['misses'], 2)
+        # страница 1 использована раньше страницы 0 и вытесняется первой
+        self.pool.get_page(self.path, 2)
+        self.assertEqual(list(self.pool.pages), [(self.path, 0), (self.path, 2)])
+        self.pool.get_page(self.path, 0)
+        self.pool.get_page(self.path, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['pages']), (2, 4, 2, 2))
+        self.assertEqual(stats['hit_rate'], 2 / 6)
+        # за концом файла страниц нет, и они не кэшируются
+        self.assertEqual(self.pool.get_page(self.path, 4), b'')
+        self.assertEqual(self.pool.stats()['pages'], 2)
+
+    def test_write_through(self):
+        """Тест: запись сразу попадает в файл и обновляет закэшированные страницы, в том числе на стыке страниц"""
+        self.pool.get_page(self.path, 0)
+        self.pool.get_page(self.path, 1)
+        offset = PAGE_SIZE - 3
+        self.pool.write(self.path, offset, b'abcdef')
+        expected = self.data[:offset] + b'abcdef' + self.data[offset + 6:]
+        self.assertEqual(self.file_bytes(), expected)
+        self.assertEqual(self.pool.get_page(self.path, 0), expected[:PAGE_SIZE])
+        self.assertEqual(self.pool.get_page(self.path, 1), expected[PAGE_SIZE:2 * PAGE_SIZE])
+        # чтение через границу страниц, в том числе из страницы, которой нет в кэше
+        self.assertEqual(self.pool.read(self.path, offset, 6), b'abcdef')
+        self.assertEqual(self.pool.read(self.path, PAGE_SIZE - 1, PAGE_SIZE + 2),
+                         expected[PAGE_SIZE - 1:2 * PAGE_SIZE + 1])
+        # запись через несколько страниц и дописывание в конец файла
+        self.pool.write(self.path, PAGE_SIZE // 2, b'x' * (2 * PAGE_SIZE))
+        expected = expected[:PAGE_SIZE // 2] + b'x' * (2 * PAGE_SIZE) + expected[PAGE_SIZE // 2 + 2 * PAGE_SIZE:]
+        self.assertEqual(self.pool.append(self.path, b'tail'), 4 * PAGE_SIZE)
+        expected += b'tail'
+        self.assertEqual(self.file_bytes(), expected)
+        self.assertEqual(self.pool.read(self.path, 0, len(expected)), expected)
+        self.assertEqual(self.pool.size(self.path), len(expected))
+
+    def test_close(self):
+        """Тест: close закрывает дескрипторы, а пул после него продолжает работать"""
+        self.pool.read(self.path, 0, 10)
+        files = list(self.pool._files.values())
+        self.pool.close()
+        self.assertEqual(self.pool._files, {})
+        self.assertTrue(all(f.closed for f in files))
+        self.assertEqual(self.pool.read(self.path, PAGE_SIZE, 3), bytes([1]) * 3)
+        self.pool.close()
+
+    def test_database_close(self):
+        """Тест: закрытие базы закрывает дескрипторы файлов данных и индексов в пуле буферов"""
+        db = Database(self.tmp.name)
+        self.addCleanup(db.close)
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+                db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, f"n{i % 10}") for i in range(100)])
+                db.execute(f"SELECT id FROM {table} WHERE name = 'n3'")
+        files = list(db.buffer_pool._files.values())
+        self.assertTrue(files)
+        db.close()
+        self.assertEqual(db.buffer_pool._files, {})
+        self.assertTrue(all(f.closed for f in files))
+        reopened = Database(self.tmp.name)
+        self.addCleanup(reopened.close)
+        for storage in STORAGES:
+            self.assertEqual(reopened.execute(f"SELECT COUNT(*) FROM t_{storage} WHERE name = 'n3'"), [[10]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from helpers import STORAGES, run_and_crash
+from mainSUBD import Database
+
+
+class TestCopy(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(os.path.join(self.tmp.name, 'db'), wal_file='db.wal')
+        self.addCleanup(self.db.close)
+
+    def write_csv(self, lines):
+        path = os.path.join(self.tmp.name, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def create(self, table, storage):
+        self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(10)) WITH (storage = {storage})")
+        self.db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+
+    def test_copy_with_header(self):
+        """Тест COPY с заголовком: столбцы сопоставляются по именам, индексы строятся по загруженным строкам"""
+        path = self.write_csv(['name,id'] + [f"имя{i % 5},{i}" for i in range(2000)])
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.create(table, storage)
+                self.db.execute(f"COPY {table} FROM '{path}'")
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table}"), [[2000]])
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table} WHERE id = 1234"), [[1234, 'имя4']])
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE id BETWEEN 10 AND 12"),
+                                 [[10], [11], [12]])
+                self.assertEqual(sorted(self.db.execute(f"SELECT id FROM {table} WHERE name = 'имя2'")),
+                                 [[i] for i in range(2000) if i % 5 == 2])
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table} LIMIT 2"), [[0, 'имя0'], [1, 'имя1']])
+
+    def test_copy_into_existing_rows(self):
+        """Тест COPY в непустую таблицу: мало строк - обычная вставка, много - перестроение индексов"""
+        self.create('t', 'row')
+        self.db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(100)])
+        small = self.write_csv(['100;n100', '101;n101'])
+        self.db.execute(f"COPY t FROM '{small}' WITH (header = false, delimiter = ';')")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM t"), [[102]])
+        large = self.write_csv([f"{i},n{i}" for i in range(102, 2000)])
+        self.db.execute(f"COPY t FROM '{large}' WITH (header = false)")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM t"), [[2000]])
+        for i in (0, 99, 101, 102, 1999):
+            self.assertEqual(self.db.execute(f"SELECT name FROM t WHERE id = {i}"), [[f"n{i}"]])
+            self.assertEqual(self.db.execute(f"SELECT id FROM t WHERE name = 'n{i}'"), [[i]])
+        self.assertEqual(self.db.execute("SELECT id FROM t WHERE id > 1996"), [[1997], [1998], [1999]])
+
+    def test_failed_copy(self):
+        """Тест COPY со строкой, которую нельзя загрузить: таблица остаётся прежней"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.create(table, storage)
+                self.db.execute(f"INSERT INTO {table} VALUES (1, 'один')")
+                path = self.write_csv(['id,name', '2,два', 'три,три'])
+                with self.assertRaises(ValueError):
+                    self.db.execute(f"COPY {table} FROM '{path}'")
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table}"), [[1, 'один']])
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE id = 2"), [])
+                path = self.write_csv(['id,name', '2'])
+                with self.assertRaises(ValueError):
+                    self.db.execute(f"COPY {table} FROM '{path}'")
+                path = self.write_csv(['id,title', '2,два'])
+                with self.assertRaises(ValueError):
+                    self.db.execute(f"COPY {table} FROM '{path}'")
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table}"), [[1]])
+
+    def test_bulk_load(self):
+        """Тест Table.bulk_load: число загруженных строк и выборка по загруженным данным"""
+        self.create('t', 'compressed')
+        table = self.db.tables['t']
+        self.assertEqual(table.bulk_load((i, f"n{i % 3}") for i in range(5000)), 5000)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM t WHERE name = 'n1'"), [[1667]])
+        self.assertEqual(self.db.execute("SELECT MIN(id), MAX(id) FROM t"), [[0, 4999]])
+
+    def test_copy_survives_crash(self):
+        """Тест: строки COPY зафиксированы контрольной точкой и видны после сбоя"""
+        path = self.write_csv(['id,name'] + [f"{i},n{i}" for i in range(1000)])
+        directory = os.path.join(self.tmp.name, 'crash')
+        run_and_crash(directory, f"""
+            db.execute("CREATE TABLE t (id INT, name VARCHAR(10))")
+            db.execute("COPY t FROM '{path}'")
+        """, wal_file='db.wal')
+        db = Database(directory, wal_file='db.wal')
+        self.addCleanup(db.close)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t"), [[1000]])
+        self.assertEqual(db.execute("SELECT name FROM t WHERE id = 999"), [['n999']])
+
+
+if __name__ == '__main__':
+    unittest.main()
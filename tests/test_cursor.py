@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES
+from mainSUBD import CURSOR_CHUNK_ROWS, STORAGE_COLUMN, Database
+
+ROWS = 3 * CURSOR_CHUNK_ROWS + 10
+
+
+class TestCursor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(self.tmp.name)
+        self.addCleanup(self.db.close)
+
+    def create(self, table, storage):
+        self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+        self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, f"n{i % 10}") for i in range(ROWS)])
+        return [[i, f"n{i % 10}"] for i in range(ROWS)]
+
+    def count_reads(self, table):
+        # список, в который попадает каждая строка, отданная проходом по таблице (у колоночного хранения - кусок)
+        name = '_column_chunks' if table.storage == STORAGE_COLUMN else '_scan_matching'
+        scan = getattr(table, name)
+        reads = []
+
+        def counting(*args, **kwargs):
+            for item in scan(*args, **kwargs):
+                reads.append(item)
+                yield item
+
+        patcher = mock.patch.object(table, name, counting)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return reads
+
+    def test_limit_offset(self):
+        """Тест LIMIT и OFFSET у выборки из одной таблицы, с условием и без"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                expected = self.create(table, storage)
+                n3 = [[row[0]] for row in expected if row[1] == 'n3']
+                for sql, rows in [(f"SELECT * FROM {table} LIMIT 5", expected[:5]),
+                                  (f"SELECT * FROM {table} LIMIT 5 OFFSET 1500", expected[1500:1505]),
+                                  (f"SELECT id FROM {table} WHERE name = 'n3' LIMIT 3 OFFSET 2", n3[2:5]),
+                                  (f"SELECT * FROM {table} LIMIT 0", []),
+                                  (f"SELECT * FROM {table} LIMIT 100 OFFSET {ROWS - 4}", expected[-4:]),
+                                  (f"SELECT * FROM {table} LIMIT 10 OFFSET {ROWS}", [])]:
+                    self.assertEqual(self.db.execute(sql), rows, sql)
+                statement = self.db.prepare(f"SELECT id FROM {table} WHERE name = ? LIMIT ? OFFSET ?")
+                self.assertEqual(statement.execute(['n3', 2, 10]), n3[10:12])
+
+    @mock.patch('mainSUBD.COLUMN_CHUNK_ROWS', 256)
+    def test_limit_stops_reading(self):
+        """Тест: проход по таблице прекращается, как только набраны OFFSET + LIMIT строк"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                expected = self.create(table, storage)
+                reads = self.count_reads(self.db.tables[table])
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table} LIMIT 5 OFFSET 10"), expected[10:15])
+                if storage == STORAGE_COLUMN:
+                    self.assertEqual(len(reads), 1)
+                else:
+                    self.assertEqual(len(reads), 15)
+                reads.clear()
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE name = 'n7' LIMIT 20"),
+                                 [[i] for i in range(7, 200, 10)])
+                self.assertEqual(len(reads), 1 if storage == STORAGE_COLUMN else 20)
+                reads.clear()
+                # потоковый курсор без LIMIT читает таблицу кусками по мере fetchmany
+                cursor = self.db.execute(f"SELECT id FROM {table}", stream=True)
+                self.assertEqual(cursor.fetchmany(3), [[0], [1], [2]])
+                self.assertLess(len(reads), ROWS // 2)
+                cursor.close()
+
+    def test_inserts_during_stream(self):
+        """Тест: потоковый курсор дочитывает свои строки, пока в таблицу дописываются новые"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                expected = self.create(table, storage)
+                version = self.db.tables[table].version
+                full = self.db.execute(f"SELECT * FROM {table}", stream=True)
+                by_name = self.db.execute(f"SELECT id FROM {table} WHERE name = 'n3'", stream=True)
+                head = full.fetchmany(10)
+                # у сжатого хранения новые строки пересжимаются вместе с последним неполным блоком
+                for i in range(ROWS, ROWS + 50):
+                    self.db.execute(f"INSERT INTO {table} VALUES ({i}, 'n{i % 10}')")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, 'x') for i in range(10000, 12000)])
+                self.assertEqual(self.db.tables[table].version, version)
+                self.assertEqual(head + full.fetchall(), expected)
+                self.assertEqual(by_name.fetchall(), [[row[0]] for row in expected if row[1] == 'n3'])
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table}"), [[ROWS + 2050]])
+
+    def test_rollback_during_stream(self):
+        """Тест: курсор, строки которого отменил ROLLBACK, сообщает об этом вместо чтения чужих строк"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.create(table, storage)
+                self.db.execute("BEGIN")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, 'x') for i in range(ROWS, 2 * ROWS)])
+                cursor = self.db.execute(f"SELECT * FROM {table} WHERE name = 'x'", stream=True)
+                cursor.fetchmany(10)
+                self.db.execute("ROLLBACK")
+                with self.assertRaises(ValueError):
+                    cursor.fetchall()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES, run_and_crash
+from mainSUBD import Database, Table
+
+
+class TestDeadRows(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_counts(self, db, expected_ids):
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t"), [[len(expected_ids)]])
+        self.assertEqual(sorted(row[0] for row in db.execute("SELECT id FROM t")), expected_ids)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t WHERE id = 1"), [[int(1 in expected_ids)]])
+        self.assertEqual(db.execute("SELECT MIN(id) FROM t"), [[expected_ids[0]]])
+
+    def test_reopen_after_delete(self):
+        """Тест COUNT(*) после DELETE и открытия базы, закрытой без close()"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                directory = os.path.join(self.tmp.name, storage)
+                run_and_crash(directory, f"""
+                    db.execute("CREATE TABLE t (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                    for i in range(3):
+                        db.execute(f"INSERT INTO t VALUES ({{i}}, 'n{{i}}')")
+                    db.execute("DELETE FROM t WHERE id = 0")
+                """)
+                db = Database(directory)
+                self.assert_counts(db, [1, 2])
+                db.close()
+
+    def test_interrupted_delete(self):
+        """Тест: сбой посреди DELETE не оставляет устаревший счётчик удалённых строк"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                directory = os.path.join(self.tmp.name, storage)
+                # процесс падает после пометки первой из двух строк
+                run_and_crash(directory, f"""
+                    db.execute("CREATE TABLE t (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                    for i in range(4):
+                        db.execute(f"INSERT INTO t VALUES ({{i}}, 'n{{i % 2}}')")
+                    table = db.tables['t']
+                    mark_deleted = table._mark_deleted
+                    def crash_after_first(offset):
+                        mark_deleted(offset)
+                        os._exit(0)
+                    table._mark_deleted = crash_after_first
+                    db.execute("DELETE FROM t WHERE name = 'n0'")
+                """)
+                db = Database(directory)
+                self.assert_counts(db, [1, 2, 3])
+                db.close()
+
+    def test_schema_written_once(self):
+        """Тест: серия DELETE переписывает схему один раз, а счётчик сохраняется при закрытии"""
+        db = Database(self.tmp.name)
+        db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+        db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+        with mock.patch.object(Table, '_save_schema', autospec=True, side_effect=Table._save_schema) as save:
+            for i in range(5):
+                db.execute(f"DELETE FROM t WHERE id = {i}")
+        self.assertEqual(save.call_count, 1)
+        db.close()
+        db = Database(self.tmp.name)
+        self.assertEqual(db.tables['t']._dead_rows, 5)
+        self.assert_counts(db, [5, 6, 7, 8, 9])
+        db.close()
+
+    def test_reopen_after_vacuum(self):
+        """Тест счётчиков после VACUUM и открытия базы без close()"""
+        directory = os.path.join(self.tmp.name, 'vacuum')
+        run_and_crash(directory, """
+            db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+            db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+            db.execute("DELETE FROM t WHERE id < 5")
+            db.execute("VACUUM t")
+            db.execute("DELETE FROM t WHERE id = 5")
+        """)
+        db = Database(directory)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t"), [[4]])
+        self.assertEqual(db.tables['t'].dead_rows, 1)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
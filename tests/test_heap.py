@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import Database, HEAP_MAX_VALUE
+
+
+class TestHeap(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(self.tmp.name)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_long_values(self):
+        """Тест значений VARCHAR у границы длины ссылки на кучу и ошибки для более длинных"""
+        self.db.execute("CREATE TABLE t (id INT, text VARCHAR(30000)) WITH (storage = heap)")
+        # 21845 символов по 3 байта - ровно HEAP_MAX_VALUE байт
+        longest = '€' * (HEAP_MAX_VALUE // 3)
+        self.db.executemany("INSERT INTO t VALUES (?, ?)", [(1, longest), (2, 'a' * 30000)])
+        with self.assertRaises(ValueError):
+            self.db.executemany("INSERT INTO t VALUES (?, ?)", [(3, 'short'), (4, longest + 'é')])
+        with self.assertRaises(ValueError):
+            self.db.execute(f"INSERT INTO t VALUES (5, '{'€' * 30000}')")
+        # пачка с длинным значением не вставлена целиком
+        self.assertEqual(self.db.execute("SELECT id FROM t"), [[1], [2]])
+        self.assertEqual(self.db.execute(f"SELECT id FROM t WHERE text = '{longest}'"), [[1]])
+        # VARCHAR(n) хранит n - 1 символ, как и строковая таблица
+        self.assertEqual(self.db.execute("SELECT text FROM t WHERE id = 2"), [['a' * 29999]])
+
+    def test_truncation_matches_row_storage(self):
+        """Тест: длинное значение обрезается и находится по равенству и индексу одинаково при любом хранении"""
+        results = {}
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(4)) WITH (storage = {storage})")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(1, 'abcdef'), (2, 'abc'), (3, 'ab€x')])
+                queries = [f"SELECT * FROM {table}", f"SELECT id FROM {table} WHERE name = 'abcz'",
+                           f"SELECT id FROM {table} WHERE name = 'ab€'"]
+                before = [self.db.execute(sql) for sql in queries]
+                self.db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+                self.assertEqual([self.db.execute(sql) for sql in queries], before)
+                results[storage] = before
+        for storage in STORAGES:
+            self.assertEqual(results[storage], results['row'], storage)
+        self.assertEqual(results['row'][0], [[1, 'abc'], [2, 'abc'], [3, 'ab€']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import random
+import tempfile
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import HASH_BUCKET_FILL, HASH_INITIAL_BUCKETS, BPlusTree, BufferPool, Database, HashIndex
+
+
+class TestBPlusTree(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'tree.idx')
+
+    def test_insert_and_split(self):
+        """Тест вставки по одной записи: листья и корень делятся, порядок записей сохраняется"""
+        tree = BPlusTree(self.path)
+        tree.create()
+        keys = list(range(5 * tree.leaf_cap))
+        random.Random(1).shuffle(keys)
+        for key in keys:
+            tree.insert((key % 1000,), key)
+        self.assertGreater(tree.num_pages, 6)
+        self.assertEqual(tree.num_entries, len(keys))
+        expected = sorted((key % 1000, key) for key in keys)
+        self.assertEqual(list(tree), expected)
+        self.assertEqual(list(tree.iter_reverse()), expected[::-1])
+        # повторяющийся ключ - смещения всех его строк
+        self.assertEqual(list(tree.search((7,))), [key for key in sorted(keys) if key % 1000 == 7])
+        self.assertEqual(list(tree.search((5000,))), [])
+
+        # дерево читается заново из файла
+        reopened = BPlusTree(self.path)
+        reopened.open()
+        self.assertEqual(list(reopened), expected)
+
+    def test_range(self):
+        """Тест диапазонов B+дерева, в том числе через границы листьев"""
+        tree = BPlusTree(self.path)
+        keys = range(0, 4 * tree.leaf_cap, 2)
+        tree.bulk_load((key, key * 10) for key in keys)
+        for lo, hi in [(0, 0), (1, 1), (3, 9), (tree.leaf_cap - 3, 2 * tree.leaf_cap + 5), (keys[-1] - 7, 2 ** 64 - 1)]:
+            with self.subTest(lo=lo, hi=hi):
+                self.assertEqual(list(tree.range(lo, hi)),
+                                 [key * 10 for key in keys if lo <= key <= hi])
+
+    def test_composite_key(self):
+        """Тест составного ключа: поиск по префиксу из первых столбцов"""
+        tree = BPlusTree(self.path, key_width=2, buffer_pool=BufferPool())
+        tree.create()
+        tree.insert_many([((a, b), a * 100 + b) for a in range(50) for b in range(20)])
+        self.assertEqual(list(tree.search((3,))), [300 + b for b in range(20)])
+        self.assertEqual(list(tree.search((3, 4))), [304])
+        self.assertEqual(list(tree.range(48, 100)), [a * 100 + b for a in (48, 49) for b in range(20)])
+
+
+class TestHashIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'hash.hidx')
+
+    def test_insert_grow_and_delete(self):
+        """Тест хеш-индекса: рост числа корзин, совпадающие ключи и удаление записей"""
+        index = HashIndex(self.path)
+        index.create()
+        count = HASH_INITIAL_BUCKETS * HASH_BUCKET_FILL * 2
+        entries = [(HashIndex.hash_key(f"k{n % 300}".encode()), n) for n in range(count)]
+        for start in range(0, len(entries), 1000):
+            index.insert_many(entries[start:start + 1000])
+        self.assertGreater(index.num_buckets, HASH_INITIAL_BUCKETS)
+        self.assertEqual(index.num_entries, len(entries))
+        key = HashIndex.hash_key(b"k5")
+        self.assertEqual(sorted(index.search(key)), [n for n in range(len(entries)) if n % 300 == 5])
+
+        deleted = [(key_hash, n) for key_hash, n in entries if n % 2 == 0]
+        index.delete_many(deleted)
+        self.assertEqual(index.num_entries, len(entries) - len(deleted))
+        self.assertEqual(sorted(index.search(key)), [n for n in range(len(entries)) if n % 300 == 5 and n % 2])
+        self.assertEqual(sorted(index), sorted(entry for entry in entries if entry[1] % 2))
+        # удаление отсутствующей записи ничего не меняет
+        index.delete_many([(key, 10 ** 9)])
+        self.assertEqual(index.num_entries, len(entries) - len(deleted))
+
+        reopened = HashIndex(self.path)
+        reopened.open()
+        self.assertEqual(sorted(reopened.search(key)), [n for n in range(len(entries)) if n % 300 == 5 and n % 2])
+
+
+class TestTableIndexes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(self.tmp.name)
+        self.addCleanup(self.db.close)
+
+    def test_range_queries(self):
+        """Тест выборок по B+дереву INT-столбца: результаты совпадают с фильтром по всем строкам"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, score INT, name VARCHAR(8)) WITH (storage = {storage})")
+                rows = [(i, (i * 37) % 1000, f"n{i % 7}") for i in range(3000)]
+                random.Random(2).shuffle(rows)
+                # небольшие пачки идут вставкой в дерево, а не его перестроением
+                for start in range(0, len(rows), 100):
+                    self.db.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", rows[start:start + 100])
+                for where, check in [("score = 111", lambda row: row[1] == 111),
+                                     ("score BETWEEN 100 AND 130", lambda row: 100 <= row[1] <= 130),
+                                     ("score < 5", lambda row: row[1] < 5),
+                                     ("score >= 995", lambda row: row[1] >= 995),
+                                     ("id > 2990 AND score < 500", lambda row: row[0] > 2990 and row[1] < 500)]:
+                    self.assertEqual(sorted(self.db.execute(f"SELECT id, score FROM {table} WHERE {where}")),
+                                     sorted([row[0], row[1]] for row in rows if check(row)), where)
+                self.assertEqual(self.db.execute(f"SELECT MIN(score), MAX(id) FROM {table}"), [[0, 2999]])
+
+    def test_hash_index_with_deletes(self):
+        """Тест хеш-индекса VARCHAR-столбца после удалений и повторных вставок"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                self.db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, f"n{i % 10}") for i in range(1000)])
+                self.db.execute(f"DELETE FROM {table} WHERE name = 'n3'")
+                self.db.execute(f"DELETE FROM {table} WHERE id < 100")
+                self.db.execute(f"INSERT INTO {table} VALUES (5000, 'n3')")
+                index = self.db.tables[table].indexes[f"{table}_name"]
+                # хеш-индекс чистится сразу при DELETE
+                self.assertEqual(index.num_entries, 900 - 90 + 1)
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE name = 'n3'"), [[5000]])
+                self.assertEqual(sorted(self.db.execute(f"SELECT id FROM {table} WHERE name = 'n4'")),
+                                 [[i] for i in range(100, 1000) if i % 10 == 4])
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE name = 'n0'"), [[90]])
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE name = 'missing'"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import Database
+
+QUERIES = [
+    "SELECT COUNT(*) FROM t",
+    "SELECT id FROM t",
+    "SELECT id FROM t WHERE id = 3",
+    "SELECT id FROM t WHERE id >= 8",
+    "SELECT id FROM t WHERE name = 'n5'",
+    "SELECT id FROM t WHERE name = 'n3' OR id = 100",
+    "SELECT MIN(id), MAX(id) FROM t",
+    "SELECT COUNT(*) FROM t WHERE id < 5",
+    "SELECT u.id FROM u JOIN t ON u.id = t.id",
+]
+
+
+class TestIsolation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(self.tmp.name, wal_file='db.wal', result_cache_size=1 << 20)
+        self.addCleanup(self.db.close)
+
+    def read(self):
+        # запросы выполняются в другом потоке, чем транзакция
+        results = []
+        reader = threading.Thread(target=lambda: results.extend(self.db.execute(sql) for sql in QUERIES))
+        reader.start()
+        reader.join(10)
+        self.assertFalse(reader.is_alive())
+        return results
+
+    def create(self, storage):
+        self.db.execute(f"CREATE TABLE t (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+        self.db.execute("CREATE INDEX t_name ON t (name)")
+        self.db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+        self.db.execute("CREATE TABLE u (id INT)")
+        self.db.executemany("INSERT INTO u VALUES (?)", [(i,) for i in (3, 5, 100)])
+
+    def change(self):
+        self.db.execute("BEGIN")
+        self.db.execute("DELETE FROM t WHERE id = 3")
+        self.db.execute("DELETE FROM t WHERE name = 'n5'")
+        self.db.execute("DELETE FROM t WHERE id > 8")
+        self.db.execute("INSERT INTO t VALUES (100, 'n5')")
+
+    def test_readers_see_committed_rows(self):
+        """Тест: другой поток не видит незафиксированных изменений транзакции до COMMIT и видит после"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                self.create(storage)
+                before = [self.db.execute(sql) for sql in QUERIES]
+                self.assertEqual(before[0], [[10]])
+                self.change()
+                changed = [self.db.execute(sql) for sql in QUERIES]
+                self.assertEqual(changed[0], [[8]])
+                self.assertEqual(changed[4], [[100]])
+                self.assertEqual(self.read(), before)
+                self.db.execute("COMMIT")
+                self.assertEqual(self.read(), changed)
+                self.db.execute("DROP TABLE t")
+                self.db.execute("DROP TABLE u")
+
+    def test_rollback(self):
+        """Тест: после ROLLBACK другой поток видит то же, что и до транзакции"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                self.create(storage)
+                before = [self.db.execute(sql) for sql in QUERIES]
+                self.change()
+                self.assertEqual(self.read(), before)
+                self.db.execute("ROLLBACK")
+                self.assertEqual(self.read(), before)
+                self.assertEqual([self.db.execute(sql) for sql in QUERIES], before)
+                self.db.execute("DROP TABLE t")
+                self.db.execute("DROP TABLE u")
+
+    def test_stream_during_transaction(self):
+        """Тест: потоковый курсор другого потока дочитывает зафиксированные строки после COMMIT"""
+        self.create('row')
+        self.change()
+        cursors = []
+        reader = threading.Thread(target=lambda: cursors.append(self.db.execute("SELECT id FROM t", stream=True)))
+        reader.start()
+        reader.join(10)
+        self.db.execute("COMMIT")
+        self.assertEqual(cursors[0].fetchall(), [[i] for i in range(10)])
+
+    def test_open_table_during_transaction(self):
+        """Тест: SELECT другого потока по ещё не открытой таблице не ждёт конца чужой транзакции"""
+        self.create('row')
+        self.db.close()
+        # после закрытия журнал не нужен; без него таблицы не открываются восстановлением
+        os.remove(os.path.join(self.tmp.name, 'db.wal'))
+        self.db = Database(self.tmp.name, wal_file='db.wal')
+        self.addCleanup(self.db.close)
+        self.db.execute("BEGIN")
+        self.db.execute("INSERT INTO u VALUES (7)")
+        self.assertFalse(self.db.tables.is_open('t'))
+        self.assertEqual(self.read()[0], [[10]])
+        self.db.execute("INSERT INTO t VALUES (11, 'n11')")
+        self.db.execute("COMMIT")
+        self.assertEqual(self.read()[0], [[11]])
+        self.db.close()
+        reopened = Database(self.tmp.name, wal_file='db.wal')
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.execute("SELECT id FROM u"), [[3], [5], [100], [7]])
+        self.assertEqual(reopened.execute("SELECT COUNT(*) FROM t"), [[11]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES
+import mainSUBD
+from mainSUBD import Database
+
+
+class TestJoin(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def open(self, **options):
+        db = Database(self.tmp.name, **options)
+        self.addCleanup(db.close)
+        return db
+
+    def create(self, db, storage):
+        # users.city ссылается на cities.code, orders.user_id - на users.id
+        db.execute(f"CREATE TABLE users (id INT, name VARCHAR(10), city VARCHAR(10)) WITH (storage = {storage})")
+        db.execute(f"CREATE TABLE orders (order_id INT, user_id INT, total INT) WITH (storage = {storage})")
+        db.execute(f"CREATE TABLE cities (code VARCHAR(6), region VARCHAR(8)) WITH (storage = {storage})")
+        users = [(i, f"u{i}", f"c{i % 7}") for i in range(300)]
+        orders = [(n, (n * 13) % 350, n % 50) for n in range(1000)]
+        cities = [(f"c{n}", f"r{n % 3}") for n in range(5)]
+        db.executemany("INSERT INTO users VALUES (?, ?, ?)", users)
+        db.executemany("INSERT INTO orders VALUES (?, ?, ?)", orders)
+        db.executemany("INSERT INTO cities VALUES (?, ?)", cities)
+        return users, orders, cities
+
+    def test_index_nested_loop(self):
+        """Тест соединения по INT-столбцу через B+дерево внутренней таблицы"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                db = Database(f"{self.tmp.name}/{storage}")
+                self.addCleanup(db.close)
+                users, orders, _ = self.create(db, storage)
+                rows = db.execute("SELECT users.name, orders.order_id FROM orders JOIN users ON orders.user_id = users.id"
+                                  " WHERE total < 5")
+                self.assertEqual(sorted(rows), sorted([f"u{user[0]}", order[0]] for order in orders for user in users
+                                                      if order[1] == user[0] and order[2] < 5))
+                # условие на каждую сторону проталкивается в её проход
+                rows = db.execute("SELECT order_id, name FROM orders JOIN users ON user_id = id"
+                                  " WHERE id BETWEEN 10 AND 12 AND total >= 40")
+                self.assertEqual(sorted(rows), sorted([order[0], f"u{order[1]}"] for order in orders
+                                                      if 10 <= order[1] <= 12 and order[2] >= 40))
+
+    def test_hash_join(self):
+        """Тест соединения по VARCHAR-столбцам хешем в памяти"""
+        db = self.open()
+        users, _, cities = self.create(db, 'row')
+        rows = db.execute("SELECT users.id, cities.region FROM users JOIN cities ON users.city = cities.code")
+        regions = dict(cities)
+        self.assertEqual(sorted(rows), sorted([user[0], regions[user[2]]] for user in users if user[2] in regions))
+        self.assertEqual(len(db.execute("SELECT * FROM users JOIN cities ON city = code LIMIT 7")), 7)
+
+    def test_spilled_hash_join(self):
+        """Тест хеш-соединения, которое не уместилось в память и разложено по файлам-разделам"""
+        db = self.open(join_memory=4096)
+        users, _, cities = self.create(db, 'heap')
+        # хеш-таблица строится по меньшей стороне: после дополнения cities это users, и её строки не влезают в 4 КБ
+        db.executemany("INSERT INTO cities VALUES (?, ?)", [(f"x{n}", 'extra') for n in range(1000)])
+        with mock.patch.object(mainSUBD, '_spilled_join', wraps=mainSUBD._spilled_join) as spilled:
+            rows = db.execute("SELECT id, region FROM users JOIN cities ON city = code WHERE region = 'r1'")
+        self.assertTrue(spilled.called)
+        self.assertEqual(sorted(rows), sorted([user[0], 'r1'] for user in users if user[2] in ('c1', 'c4')))
+
+    def test_varchar_of_different_length(self):
+        """Тест соединения VARCHAR-столбцов разной длины и ошибки для столбцов разных типов"""
+        db = self.open()
+        users, _, cities = self.create(db, 'row')
+        rows = db.execute("SELECT code, region FROM cities JOIN users ON cities.code = users.city WHERE id < 10")
+        regions = dict(cities)
+        self.assertEqual(sorted(rows), sorted([user[2], regions[user[2]]] for user in users[:10] if user[2] in regions))
+        with self.assertRaises(ValueError):
+            db.execute("SELECT * FROM users JOIN orders ON users.name = orders.order_id")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import Database, SEGMENT_ROWS, np
+
+
+@unittest.skipIf(np is None, "numpy не установлен")
+class TestNumpyScan(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(self.tmp.name, scan_mode='numpy')
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_select_delete_count(self):
+        """Тест SELECT, DELETE и COUNT в режиме scan_mode='numpy' против тех же запросов на списке строк"""
+        rows = [[i, f"n{i % 13}", i % 100] for i in range(2 * SEGMENT_ROWS + 500)]
+        checks = [("name = 'n4'", lambda r: r[1] == 'n4'),
+                  ("name >= 'n7' AND score < 10", lambda r: r[1] >= 'n7' and r[2] < 10),
+                  ("name = 'n1' OR name = 'n2'", lambda r: r[1] in ('n1', 'n2')),
+                  ("score BETWEEN 5 AND 6 OR name = 'missing'", lambda r: 5 <= r[2] <= 6)]
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8), score INT)"
+                                f" WITH (storage = {storage})")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", rows)
+                live = list(rows)
+                # удаление без индекса ставит флаги маской по отображённому файлу
+                for where, check in [("name = 'n3'", lambda r: r[1] == 'n3'),
+                                     ("name > 'n8' OR id < 100", lambda r: r[1] > 'n8' or r[0] < 100)]:
+                    self.db.execute(f"DELETE FROM {table} WHERE {where}")
+                    live = [row for row in live if not check(row)]
+                    for query, match in checks:
+                        self.assertEqual(sorted(self.db.execute(f"SELECT * FROM {table} WHERE {query}")),
+                                         [row for row in live if match(row)], query)
+                        self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE {query}"),
+                                         [[sum(1 for row in live if match(row))]], query)
+                    self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table}"), [[len(live)]])
+                target = self.db.tables[table]
+                self.assertEqual(target.dead_rows, len(rows) - len(live))
+                # карта отрезков знает о строках, удалённых маской
+                self.assertEqual(target.segments.live, [sum(1 for row in live if row[0] // SEGMENT_ROWS == n)
+                                                        for n in range(3)])
+                self.db.execute(f"DELETE FROM {table} WHERE score >= 0")
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table} WHERE name = 'n4'"), [])
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table}"), [[0]])
+
+    def test_unknown_column(self):
+        """Тест: неизвестный столбец в WHERE - та же ошибка ValueError, что и без numpy"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+                for sql in [f"SELECT * FROM {table} WHERE missing = 'x'",
+                            f"SELECT COUNT(*) FROM {table} WHERE name = 'n1' OR missing = 1",
+                            f"DELETE FROM {table} WHERE missing = 'x'"]:
+                    with self.assertRaisesRegex(ValueError, "Столбец 'missing' не существует"):
+                        self.db.execute(sql)
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table}"), [[10]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES
+import mainSUBD
+from mainSUBD import Database
+
+
+class TestParallelScan(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # параллельный проход включается уже на маленьких таблицах
+        patcher = mock.patch.object(mainSUBD, 'PARALLEL_SCAN_MIN_ROWS', 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open(self, name, workers):
+        db = Database(f"{self.tmp.name}/{name}", workers=workers)
+        self.addCleanup(db.close)
+        return db
+
+    def fill(self, db, storage):
+        db.execute(f"CREATE TABLE t (id INT, name VARCHAR(8), score INT) WITH (storage = {storage})")
+        db.executemany("INSERT INTO t VALUES (?, ?, ?)", [(i, f"n{i % 30}", i % 7) for i in range(3000)])
+        db.execute("DELETE FROM t WHERE score = 3")
+
+    def test_same_rows_as_serial_scan(self):
+        """Тест: проход по процессам (workers=) возвращает те же строки в том же порядке, что и обычный"""
+        queries = ["SELECT * FROM t",
+                   "SELECT name, id FROM t WHERE score = 5",
+                   "SELECT id FROM t WHERE name = 'n7' OR score = 0",
+                   "SELECT COUNT(*), SUM(score) FROM t WHERE name >= 'n2'",
+                   "SELECT id FROM t WHERE id BETWEEN 100 AND 110"]
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                serial = self.open(f"serial_{storage}", 1)
+                parallel = self.open(f"parallel_{storage}", 3)
+                self.fill(serial, storage)
+                self.fill(parallel, storage)
+                for sql in queries:
+                    self.assertEqual(parallel.execute(sql), serial.execute(sql), sql)
+
+    def test_partitions_go_to_workers(self):
+        """Тест: полный проход режется на куски по числу процессов, а выборка по B+дереву идёт без них"""
+        db = self.open('db', 3)
+        self.fill(db, 'row')
+        with mock.patch.object(db.executor, 'submit', wraps=db.executor.submit) as submit:
+            rows = db.execute("SELECT id FROM t WHERE name = 'n1'")
+        self.assertEqual(submit.call_count, 3)
+        self.assertEqual(rows, [[i] for i in range(1, 3000, 30) if i % 7 != 3])
+        with mock.patch.object(db.executor, 'submit', wraps=db.executor.submit) as submit:
+            self.assertEqual(db.execute("SELECT name FROM t WHERE id = 8"), [['n8']])
+        submit.assert_not_called()
+        # процессы видят строки, изменённые после их первого прохода
+        db.execute("DELETE FROM t WHERE id < 2900")
+        db.execute("INSERT INTO t VALUES (5000, 'n1', 1)")
+        self.assertEqual(db.execute("SELECT id FROM t WHERE name = 'n1'"), [[2911], [2941], [5000]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import tempfile
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import Database, PARAMETER, parse_insert, parse_where
+
+
+class TestParseWhere(unittest.TestCase):
+    def test_precedence(self):
+        """Тест: AND связывает сильнее OR, скобки меняют порядок"""
+        self.assertEqual(parse_where("a = 1 OR b BETWEEN 2 AND 3 AND c = 'x'"),
+                         ('OR', [('a', '=', '1'), ('AND', [('b', 'BETWEEN', ('2', '3')), ('c', '=', 'x')])]))
+        self.assertEqual(parse_where("(a = 1 OR a = 2) AND c >= 5"),
+                         ('AND', [('OR', [('a', '=', '1'), ('a', '=', '2')]), ('c', '>=', '5')]))
+        self.assertEqual(parse_where("a < 1 OR a > 2 OR a <= 3"),
+                         ('OR', [('a', '<', '1'), ('a', '>', '2'), ('a', '<=', '3')]))
+        self.assertEqual(parse_where("((a = 1))"), ('a', '=', '1'))
+
+    def test_values(self):
+        """Тест: AND и OR внутри строки в кавычках остаются частью значения, ? в BETWEEN - параметры"""
+        self.assertEqual(parse_where("name = 'a OR b' AND t.city = \"x AND y\""),
+                         ('AND', [('name', '=', 'a OR b'), ('t.city', '=', 'x AND y')]))
+        self.assertEqual(parse_where("id BETWEEN ? AND ? OR id=?"),
+                         ('OR', [('id', 'BETWEEN', (PARAMETER, PARAMETER)), ('id', '=', PARAMETER)]))
+
+    def test_errors(self):
+        """Тест ошибок разбора: незакрытая скобка, неполный BETWEEN, висящий OR, неизвестный оператор"""
+        for where in ["(a = 1", "a = 1)", "a BETWEEN 1 OR 2", "a BETWEEN 1", "a = 1 OR", "a = 1 AND OR b = 2",
+                      "a LIKE 1", ""]:
+            with self.subTest(where=where):
+                with self.assertRaises(ValueError):
+                    parse_where(where)
+
+
+class TestParseInsert(unittest.TestCase):
+    def test_rows(self):
+        """Тест: запятые, скобки и кавычки внутри строковых значений не разбивают строки INSERT"""
+        self.assertEqual(parse_insert("INSERT INTO t VALUES (1, 'a, (b)'), (2,'c)'),(3, \"x'y\")"),
+                         ('t', [['1', 'a, (b)'], ['2', 'c)'], ['3', "x'y"]]))
+        self.assertEqual(parse_insert("INSERT INTO t VALUES (1, ?) , (?, '?,?')"),
+                         ('t', [['1', PARAMETER], [PARAMETER, '?,?']]))
+        self.assertEqual(parse_insert("INSERT INTO t VALUES ('')"), ('t', [['']]))
+
+    def test_errors(self):
+        """Тест ошибок разбора INSERT: висящая запятая, строки без запятой, незакрытая скобка или кавычка"""
+        for sql in ["INSERT INTO t VALUES (1, 'a'),", "INSERT INTO t VALUES (1, 'a') (2, 'b')",
+                    "INSERT INTO t VALUES (1, 'a'", "INSERT INTO t VALUES (1, 'a)", "INSERT INTO t VALUES 1, 2"]:
+            with self.subTest(sql=sql):
+                with self.assertRaises(ValueError):
+                    parse_insert(sql)
+
+
+class TestInsert(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(self.tmp.name)
+        self.addCleanup(self.db.close)
+
+    def test_multi_row_and_executemany(self):
+        """Тест вставки нескольких строк одним INSERT и через executemany, в том числе неудачной пачки"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                self.db.execute(f"INSERT INTO {table} VALUES (1, 'a, (b)'), (2, 'c)'),(3, \"x'y\")")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", ((i, f"n{i}") for i in range(4, 7)))
+                self.db.executemany(f"INSERT INTO {table} VALUES (?,?)", [])
+                expected = [[1, 'a, (b)'], [2, 'c)'], [3, "x'y"], [4, 'n4'], [5, 'n5'], [6, 'n6']]
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table}"), expected)
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE name = 'a, (b)'"), [[1]])
+                # строка с неверным числом значений - не вставляется вся пачка
+                with self.assertRaises(ValueError):
+                    self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(7, 'ok'), (8,)])
+                with self.assertRaises(ValueError):
+                    self.db.execute(f"INSERT INTO {table} VALUES (7, 'ok'), (8)")
+                for sql in [f"INSERT INTO {table} VALUES (1, 'a')", f"DELETE FROM {table} WHERE id = ?"]:
+                    with self.assertRaises(ValueError):
+                        self.db.executemany(sql, [(1,)])
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table}"), expected)
+
+
+class TestOrBetween(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(self.tmp.name)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_queries(self):
+        """Тест выполнения OR и BETWEEN по индексам и полным проходом"""
+        rows = [(i, f"n{i % 10}") for i in range(200)]
+        checks = [("id BETWEEN 10 AND 14", lambda r: 10 <= r[0] <= 14),
+                  ("id BETWEEN 14 AND 10", lambda r: False),
+                  ("id = 3 OR name = 'n5'", lambda r: r[0] == 3 or r[1] == 'n5'),
+                  ("name = 'n1' AND (id < 30 OR id BETWEEN 150 AND 170)",
+                   lambda r: r[1] == 'n1' and (r[0] < 30 or 150 <= r[0] <= 170)),
+                  ("id > 190 OR id < 5 OR name = 'missing'", lambda r: r[0] > 190 or r[0] < 5),
+                  ("name BETWEEN 'n2' AND 'n3' AND id < 40", lambda r: 'n2' <= r[1] <= 'n3' and r[0] < 40)]
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                self.db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", rows)
+                for where, check in checks:
+                    self.assertEqual(sorted(self.db.execute(f"SELECT * FROM {table} WHERE {where}")),
+                                     [list(row) for row in rows if check(row)], where)
+                # строка, подходящая под обе части OR, возвращается один раз
+                self.assertEqual(self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE id = 5 OR name = 'n5'"), [[20]])
+                statement = self.db.prepare(f"SELECT id FROM {table} WHERE id BETWEEN ? AND ? OR id = ?")
+                self.assertEqual(statement.execute([1, 2, 100]), [[1], [2], [100]])
+
+
+class TestStatementCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def open(self, **options):
+        db = Database(self.tmp.name, **options)
+        self.addCleanup(db.close)
+        db.execute("CREATE TABLE t1 (id INT, col2 INT, name VARCHAR(8))")
+        db.executemany("INSERT INTO t1 VALUES (?, ?, ?)", [(1, 3, 'a1?b'), (2, 5, 'x9'), (3, 5, '7')])
+        db.statement_cache.clear()
+        return db
+
+    def test_shapes(self):
+        """Тест: цифры в именах остаются в форме запроса, а числа (и отрицательные) и строки в кавычках заменяются"""
+        db = self.open()
+        self.assertEqual(db.execute("SELECT id FROM t1 WHERE col2 > -3"), [[1], [2], [3]])
+        self.assertEqual(db.execute("SELECT id FROM t1 WHERE col2 > 4"), [[2], [3]])
+        self.assertEqual(db.execute("SELECT id FROM t1 WHERE name = 'a1?b'"), [[1]])
+        self.assertEqual(db.execute('SELECT id FROM t1 WHERE name = "7"'), [[3]])
+        self.assertEqual(db.execute("SELECT id FROM t1 WHERE name = '5' OR col2 = 12"), [])
+        self.assertEqual(list(db.statement_cache), ["SELECT id FROM t1 WHERE col2 > ?",
+                                                    "SELECT id FROM t1 WHERE name = ?",
+                                                    "SELECT id FROM t1 WHERE name = ? OR col2 = ?"])
+
+    def test_eviction(self):
+        """Тест вытеснения давно не использованных форм и отключения кэша statement_cache_size=0"""
+        db = self.open(statement_cache_size=2)
+        queries = ["SELECT id FROM t1 WHERE col2 = 5", "SELECT name FROM t1 WHERE id = 1",
+                   "SELECT col2 FROM t1 WHERE id = 2"]
+        db.execute(queries[0])
+        db.execute(queries[1])
+        # обращение переносит форму в конец очереди вытеснения
+        db.execute(queries[0].replace('5', '3'))
+        db.execute(queries[2])
+        self.assertEqual(list(db.statement_cache), ["SELECT id FROM t1 WHERE col2 = ?",
+                                                    "SELECT col2 FROM t1 WHERE id = ?"])
+        db.close()
+        db = Database(self.tmp.name, statement_cache_size=0)
+        self.addCleanup(db.close)
+        self.assertEqual([db.execute(sql) for sql in queries], [[[2], [3]], [['a1?b']], [[5]]])
+        self.assertEqual(len(db.statement_cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from helpers import STORAGES
+from mainSUBD import Database
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(self.tmp.name, result_cache_size=1 << 20)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_full_length_varchar(self):
+        """Тест сброса кэша по значению VARCHAR полной длины столбца"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(5)) WITH (storage = {storage})")
+                self.db.execute(f"INSERT INTO {table} VALUES (1, 'abcde')")
+                query = f"SELECT id FROM {table} WHERE name = 'abcde'"
+                self.assertEqual(self.db.execute(query), [[1]])
+                self.db.execute(f"INSERT INTO {table} VALUES (2, 'abcde')")
+                self.assertEqual(self.db.execute(query), [[1], [2]])
+                self.db.execute(f"DELETE FROM {table} WHERE id = 1")
+                self.assertEqual(self.db.execute(query), [[2]])
+
+    def test_unrelated_change_keeps_entry(self):
+        """Тест: изменение строк с другим значением не сбрасывает точечный запрос"""
+        self.db.execute("CREATE TABLE u (id INT, name VARCHAR(10))")
+        self.db.executemany("INSERT INTO u VALUES (?, ?)", [(i, f"n{i}") for i in range(100)])
+        query = "SELECT name FROM u WHERE id = 5"
+        self.assertEqual(self.db.execute(query), [['n5']])
+        self.db.execute("INSERT INTO u VALUES (500, 'x')")
+        hits = self.db.result_cache.stats()['hits']
+        self.assertEqual(self.db.execute(query), [['n5']])
+        self.assertEqual(self.db.result_cache.stats()['hits'], hits + 1)
+        self.db.execute("INSERT INTO u VALUES (5, 'y')")
+        self.assertEqual(self.db.execute(query), [['n5'], ['y']])
+
+    def test_full_table_queries(self):
+        """Тест сброса запросов без точечного условия при любом изменении таблицы"""
+        self.db.execute("CREATE TABLE u (id INT, name VARCHAR(10))")
+        self.db.executemany("INSERT INTO u VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM u"), [[10]])
+        self.db.execute("DELETE FROM u WHERE id = 3")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM u"), [[9]])
+        self.db.execute("VACUUM u")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM u WHERE id < 5"), [[4]])
+        self.db.execute("DELETE FROM u")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM u"), [[0]])
+
+    def test_prepared_statement(self):
+        """Тест кэша результатов подготовленного запроса с параметрами"""
+        self.db.execute("CREATE TABLE u (id INT, name VARCHAR(10))")
+        self.db.executemany("INSERT INTO u VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+        statement = self.db.prepare("SELECT name FROM u WHERE id = ?")
+        self.assertEqual(statement.execute([6]), [['n6']])
+        self.assertEqual(statement.execute([7]), [['n7']])
+        self.db.execute("DELETE FROM u WHERE id = 6")
+        self.assertEqual(statement.execute([6]), [])
+        self.assertEqual(statement.execute([7]), [['n7']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+
+from helpers import SUBD  # noqa: F401 - путь к mainSUBD
+from mainSUBD import PAGE_SIZE, SCAN_BUFFERED, SCAN_MMAP, SCAN_NUMPY, Database, np
+
+SCAN_MODES = [SCAN_MMAP, SCAN_BUFFERED] + ([SCAN_NUMPY] if np is not None else [])
+# строка (name VARCHAR(3), id INT): флаг, 6 байт name, 8 байт id. старшие байты такого id вместе с флагом
+# следующей строки (ROW_LIVE = 0) дают FF FE 61 00 62 00 - хранимые байты name = 'ab' через границу строк
+TRAP = int.from_bytes(b'\0\0\0\xff\xfe\x61\x00\x62', 'little')
+
+
+class TestScanModes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_match_across_rows(self):
+        """Тест: байты значения на стыке двух строк не находятся ни в одном режиме прохода, в том числе
+        когда строки пересекают границы страниц"""
+        rows = [('ab' if i % 500 == 7 else f"n{i % 10}", TRAP + i if i % 3 else i) for i in range(3000)]
+        self.assertGreater(len(rows) * 15, 4 * PAGE_SIZE)
+        for scan_mode in SCAN_MODES:
+            with self.subTest(scan_mode=scan_mode):
+                db = Database(self.tmp.name, scan_mode=scan_mode)
+                self.addCleanup(db.close)
+                table = f"t_{scan_mode}"
+                db.execute(f"CREATE TABLE {table} (name VARCHAR(3), id INT)")
+                db.executemany(f"INSERT INTO {table} VALUES (?, ?)", rows)
+                expected = [[row[1]] for row in rows if row[0] == 'ab']
+                self.assertEqual(db.execute(f"SELECT id FROM {table} WHERE name = 'ab'"), expected)
+                self.assertEqual(db.execute(f"SELECT COUNT(*) FROM {table} WHERE name = 'ab'"), [[len(expected)]])
+                self.assertEqual(db.execute(f"SELECT COUNT(*) FROM {table} WHERE name = 'n4'"), [[300]])
+                db.execute(f"DELETE FROM {table} WHERE name = 'ab'")
+                self.assertEqual(db.execute(f"SELECT COUNT(*) FROM {table}"), [[len(rows) - len(expected)]])
+                self.assertEqual(db.execute(f"SELECT id FROM {table} WHERE name = 'ab'"), [])
+                db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES
+from mainSUBD import Database, SEGMENT_ROWS, Table
+
+SEGMENTS = 4
+
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def open(self, directory):
+        db = Database(directory)
+        self.addCleanup(db.close)
+        return db
+
+    def create(self, db, storage):
+        # score растёт вместе с номером строки, а значение tag у каждого отрезка своё
+        db.execute(f"CREATE TABLE t (id INT, tag VARCHAR(8), score INT) WITH (storage = {storage})")
+        db.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                       [(i, f"s{i // SEGMENT_ROWS}", i) for i in range(SEGMENTS * SEGMENT_ROWS)])
+        return db.tables['t']
+
+    def test_candidates(self):
+        """Тест: карта зон и фильтры Блума оставляют только отрезки, где может быть строка под условием"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                db = self.open(f"{self.tmp.name}/{storage}")
+                table = self.create(db, storage)
+                self.assertEqual(table._segment_candidates(('score', '>=', 3 * SEGMENT_ROWS)), {3})
+                self.assertEqual(table._segment_candidates(('score', '<', 0)), set())
+                # равенство по INT отсекается картой зон так же, как диапазон
+                self.assertEqual(table._segment_candidates(('score', '=', SEGMENT_ROWS + 5)), {1})
+                self.assertEqual(table._segment_candidates(('score', '=', SEGMENTS * SEGMENT_ROWS)), set())
+                self.assertEqual(table._segment_candidates(('tag', '=', 's2')), {2})
+                self.assertEqual(table._segment_candidates(('tag', '=', 'missing')), set())
+                # по сравнению строк на неравенство фильтр не применяется
+                self.assertEqual(table._segment_candidates(('tag', '>', 's2')), set(range(SEGMENTS)))
+                self.assertEqual(table._segment_candidates(('OR', [('tag', '=', 's0'), ('score', '=', SEGMENT_ROWS)])),
+                                 {0, 1})
+                self.assertEqual(table._segment_candidates(('AND', [('tag', '=', 's0'), ('score', '=', SEGMENT_ROWS)])),
+                                 set())
+                # отрезок без живых строк пропускается
+                db.execute("DELETE FROM t WHERE tag = 's1'")
+                self.assertEqual(table._segment_candidates(('tag', '>', '')), {0, 2, 3})
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM t WHERE tag = 's1' OR score < 3"), [[3]])
+                last = 3 * SEGMENT_ROWS
+                self.assertEqual(db.execute(f"SELECT id FROM t WHERE tag = 's3' AND score < {last + 2}"),
+                                 [[last], [last + 1]])
+
+    def test_scan_skips_segments(self):
+        """Тест: проход без индекса читает только отрезки-кандидаты, а отсутствующее значение - ни одного"""
+        db = self.open(self.tmp.name)
+        self.create(db, 'row')
+        with mock.patch.object(Table, '_mmap_scan', autospec=True, side_effect=Table._mmap_scan) as scan:
+            rows = db.execute("SELECT id FROM t WHERE tag = 's2'")
+            self.assertEqual(rows, [[i] for i in range(2 * SEGMENT_ROWS, 3 * SEGMENT_ROWS)])
+            row_size = db.tables['t'].row_size
+            self.assertEqual(scan.call_args.args[2], [(2 * SEGMENT_ROWS * row_size, 3 * SEGMENT_ROWS * row_size)])
+            self.assertEqual(db.execute("SELECT id FROM t WHERE tag = 'missing'"), [])
+            self.assertEqual(scan.call_args.args[2], [])
+            # у tag нет индекса, поэтому OR идёт проходом; равенство по INT сводит его к одному отрезку
+            target = 3 * SEGMENT_ROWS + 7
+            self.assertEqual(db.execute(f"SELECT id FROM t WHERE score = {target} OR tag = 'missing'"), [[target]])
+            self.assertEqual(scan.call_args.args[2], [(3 * SEGMENT_ROWS * row_size, 4 * SEGMENT_ROWS * row_size)])
+
+    def test_reopen(self):
+        """Тест: карта сохраняется при закрытии, а без её файла проход читает всю таблицу"""
+        db = self.open(self.tmp.name)
+        self.create(db, 'row')
+        db.close()
+        db = self.open(self.tmp.name)
+        self.assertEqual(db.tables['t']._segment_candidates(('tag', '=', 's3')), {3})
+        db.close()
+        os.remove(os.path.join(self.tmp.name, 't.seg'))
+        db = self.open(self.tmp.name)
+        self.assertIsNone(db.tables['t']._segment_candidates(('tag', '=', 's3')))
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t WHERE tag = 's3'"), [[SEGMENT_ROWS]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from helpers import SUBD  # noqa: F401 - путь к модулям сервера
+from client import Client
+from mainSUBD import Database
+from server import Server
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(self.tmp.name, wal_file='db.wal')
+        self.addCleanup(self.db.close)
+        self.db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+        self.db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(10)])
+        self.server = await Server(self.db, port=0, transaction_timeout=0.5).start()
+        self.addAsyncCleanup(self.server.close)
+
+    async def connect(self):
+        client = await Client.connect(port=self.server.port)
+        self.addAsyncCleanup(client.close)
+        return client
+
+    async def test_pipelining(self):
+        """Тест конвейера: ответы на запросы, отправленные не дожидаясь друг друга, приходят по порядку"""
+        client = await self.connect()
+        requests = [client.execute("SELECT name FROM t WHERE id = ?", [i % 10]) for i in range(50)]
+        requests.append(client.execute("SELECT * FROM missing"))
+        requests.append(client.executemany("INSERT INTO t VALUES (?, ?)", [(10, 'n10'), (11, 'n11')]))
+        requests.append(client.execute("SELECT COUNT(*) FROM t"))
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        self.assertEqual(results[:50], [[[f"n{i % 10}"]] for i in range(50)])
+        # ошибка одного запроса не мешает следующим
+        self.assertIsInstance(results[50], ValueError)
+        self.assertEqual(results[51:], [None, [[12]]])
+
+    async def test_transaction_thread(self):
+        """Тест: запросы от BEGIN до COMMIT выполняются в одном потоке соединения, писатели других соединений ждут"""
+        threads = {}
+        execute = self.server._execute
+
+        def record(request):
+            threads.setdefault(request['sql'], set()).add(threading.get_ident())
+            return execute(request)
+
+        owner_sql = ["BEGIN", "INSERT INTO t VALUES (?, ?)", "DELETE FROM t WHERE id < 5",
+                     "SELECT COUNT(*) FROM t WHERE id >= 0", "COMMIT"]
+        with mock.patch.object(self.server, '_execute', record):
+            owner, other = await self.connect(), await self.connect()
+            await owner.execute(owner_sql[0])
+            await owner.execute(owner_sql[1], [20, 'n20'])
+            await owner.execute(owner_sql[2])
+            # чтение другого соединения не ждёт транзакцию и видит строки до неё
+            self.assertEqual(await other.execute("SELECT COUNT(*) FROM t"), [[10]])
+            insert = asyncio.create_task(other.execute("INSERT INTO t VALUES (30, 'n30')"))
+            await asyncio.sleep(0.1)
+            self.assertFalse(insert.done())
+            self.assertEqual(await owner.execute(owner_sql[3]), [[6]])
+            await owner.execute(owner_sql[4])
+            await insert
+        transaction = set().union(*(threads[sql] for sql in owner_sql))
+        self.assertEqual(len(transaction), 1)
+        self.assertTrue(transaction.isdisjoint(threads["SELECT COUNT(*) FROM t"]))
+        self.assertEqual(await other.execute("SELECT COUNT(*) FROM t"), [[7]])
+
+    async def test_copy_rejected(self):
+        """Тест: COPY, читающий файл на машине сервера, по сети не выполняется"""
+        path = os.path.join(self.tmp.name, 'rows.csv')
+        with open(path, 'w') as f:
+            f.write("100,secret\n")
+        client = await self.connect()
+        copy = f"COPY t FROM '{path}' WITH (header = false)"
+        for sql, params in [(copy, None), (f"  {copy}", []), ("COPY t FROM '/etc/passwd' WITH (delimiter = ':')", None)]:
+            with self.subTest(sql=sql):
+                with self.assertRaises(ValueError):
+                    await client.execute(sql, params)
+        self.assertEqual(await client.execute("SELECT COUNT(*) FROM t"), [[10]])
+
+    async def test_transaction_timeout(self):
+        """Тест: транзакция молчащего клиента откатывается по transaction_timeout, а соединение закрывается"""
+        client, other = await self.connect(), await self.connect()
+        await client.execute("BEGIN")
+        await client.execute("DELETE FROM t")
+        await asyncio.sleep(1)
+        with self.assertRaises(ConnectionError):
+            await client.execute("COMMIT")
+        self.assertEqual(await other.execute("SELECT COUNT(*) FROM t"), [[10]])
+        # блокировка писателей освобождена
+        await asyncio.wait_for(other.execute("INSERT INTO t VALUES (10, 'n10')"), 5)
+        self.assertEqual(await other.execute("SELECT COUNT(*) FROM t"), [[11]])
+
+
+if __name__ == '__main__':
+    unittest.main()
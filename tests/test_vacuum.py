@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from helpers import STORAGES, run_and_crash
+from mainSUBD import CURSOR_CHUNK_ROWS, Database
+
+ROWS = 3 * CURSOR_CHUNK_ROWS
+
+
+class TestVacuum(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(self.tmp.name, wal_file='db.wal')
+        self.addCleanup(self.db.close)
+
+    def create(self, table, storage):
+        self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+        self.db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+        self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, f"n{i % 10}") for i in range(ROWS)])
+        self.db.execute(f"DELETE FROM {table} WHERE id < {ROWS // 2}")
+        return [[i, f"n{i % 10}"] for i in range(ROWS // 2, ROWS)]
+
+    def test_cursor_survives_vacuum(self):
+        """Тест: потоковый курсор, открытый до VACUUM, дочитывает свои строки после него"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                expected = self.create(table, storage)
+                full = self.db.execute(f"SELECT * FROM {table}", stream=True)
+                by_name = self.db.execute(f"SELECT id FROM {table} WHERE name = 'n3'", stream=True)
+                by_id = self.db.execute(f"SELECT id FROM {table} WHERE id >= {ROWS - 5}", stream=True)
+                head = full.fetchmany(10)
+                self.db.execute(f"VACUUM {table}")
+                self.assertEqual(head + full.fetchall(), expected)
+                self.assertEqual(sorted(by_name.fetchall()), [[row[0]] for row in expected if row[1] == 'n3'])
+                self.assertEqual(by_id.fetchall(), [[i] for i in range(ROWS - 5, ROWS)])
+                # после замены файлов новые запросы читают сжатую таблицу
+                self.assertEqual(self.db.tables[table].dead_rows, 0)
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table}"), expected)
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE id = {ROWS - 1}"), [[ROWS - 1]])
+                # хеш-индекс отдаёт строки в порядке своих цепочек
+                self.assertEqual(sorted(self.db.execute(f"SELECT id FROM {table} WHERE name = 'n7'")),
+                                 [[row[0]] for row in expected if row[1] == 'n7'])
+
+    def test_select_during_vacuum(self):
+        """Тест: пока VACUUM строит новые файлы, SELECT из другого потока не ждёт его"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                expected = self.create(table, storage)
+                target = self.db.tables[table]
+                prepare_compact = target._prepare_compact
+                results = []
+
+                def prepare_with_select():
+                    reader = threading.Thread(target=lambda: results.append(
+                        self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE name = 'n1'")))
+                    reader.start()
+                    reader.join(10)
+                    self.assertFalse(reader.is_alive())
+                    return prepare_compact()
+
+                target._prepare_compact = prepare_with_select
+                self.db.execute(f"VACUUM {table}")
+                del target._prepare_compact
+                self.assertEqual(results, [[[sum(1 for row in expected if row[1] == 'n1')]]])
+                self.assertEqual(self.db.execute(f"SELECT * FROM {table}"), expected)
+
+    def test_reopen_after_vacuum(self):
+        """Тест индексов и данных после VACUUM и повторного открытия базы"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                expected = self.create(f"t_{storage}", storage)
+                self.db.execute(f"VACUUM t_{storage}")
+        self.db.close()
+        db = Database(self.tmp.name, wal_file='db.wal')
+        self.addCleanup(db.close)
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                self.assertEqual(db.execute(f"SELECT COUNT(*) FROM t_{storage} WHERE name = 'n5'"),
+                                 [[sum(1 for row in expected if row[1] == 'n5')]])
+                self.assertEqual(db.execute(f"SELECT name FROM t_{storage} WHERE id = {ROWS - 2}"),
+                                 [[f"n{(ROWS - 2) % 10}"]])
+                self.assertEqual(db.execute(f"SELECT id FROM t_{storage} WHERE id < {ROWS // 2}"), [])
+
+    @mock.patch('mainSUBD.EXTERNAL_SORT_RUN', 500)
+    def test_vacuum_ratio(self):
+        """Тест: DELETE сжимает таблицу сам, когда доля удалённых строк достигает vacuum_ratio, но не в транзакции"""
+        self.db.close()
+        self.db = Database(self.tmp.name, wal_file='db.wal', vacuum_ratio=0.5)
+        self.addCleanup(self.db.close)
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                table = f"t_{storage}"
+                self.db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                self.db.execute(f"CREATE INDEX {table}_name ON {table} (name)")
+                self.db.executemany(f"INSERT INTO {table} VALUES (?, ?)", [(i, f"n{i % 10}") for i in range(ROWS)])
+                target = self.db.tables[table]
+                self.db.execute(f"DELETE FROM {table} WHERE id < {ROWS // 4}")
+                self.assertEqual((target.row_count, target.dead_rows), (ROWS, ROWS // 4))
+                self.db.execute("BEGIN")
+                self.db.execute(f"DELETE FROM {table} WHERE id < {ROWS // 2}")
+                self.assertEqual(target.dead_rows, ROWS // 2)
+                self.db.execute("COMMIT")
+                # порог достигнут следующим DELETE вне транзакции
+                self.db.execute(f"DELETE FROM {table} WHERE name = 'n0'")
+                live = [i for i in range(ROWS // 2, ROWS) if i % 10]
+                self.assertEqual((target.row_count, target.dead_rows), (len(live), 0))
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table}"), [[i] for i in live])
+                self.assertEqual(sorted(self.db.execute(f"SELECT id FROM {table} WHERE name = 'n3'")),
+                                 [[i] for i in live if i % 10 == 3])
+                self.assertEqual(self.db.execute(f"SELECT id FROM {table} WHERE id >= {ROWS - 3}"),
+                                 [[i] for i in live if i >= ROWS - 3])
+        # временные файлы построения индексов удалены
+        self.assertEqual([name for name in os.listdir(self.tmp.name) if name.startswith('vacuum_')], [])
+
+    def test_crash_before_index_swap(self):
+        """Тест восстановления после сбоя между заменой файлов данных и заменой индексов"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                directory = os.path.join(self.tmp.name, storage)
+                run_and_crash(directory, f"""
+                    db.execute("CREATE TABLE t (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+                    db.execute("CREATE INDEX t_name ON t (name)")
+                    db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{{i % 10}}") for i in range({ROWS})])
+                    db.execute("DELETE FROM t WHERE id < {ROWS // 2}")
+                    db.tables['t']._install_indexes = lambda *args: os._exit(0)
+                    db.execute("VACUUM t")
+                """, wal_file='db.wal')
+                db = Database(directory, wal_file='db.wal')
+                self.addCleanup(db.close)
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM t"), [[ROWS - ROWS // 2]])
+                self.assertEqual(db.execute("SELECT id FROM t WHERE id = 0"), [])
+                self.assertEqual(db.execute(f"SELECT id FROM t WHERE id = {ROWS - 1}"), [[ROWS - 1]])
+                self.assertEqual(sorted(db.execute("SELECT id FROM t WHERE name = 'n4'")),
+                                 [[i] for i in range(ROWS // 2, ROWS) if i % 10 == 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
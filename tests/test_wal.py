@@ -0,0 +1,189 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import STORAGES, run_and_crash
+import mainSUBD
+from mainSUBD import Database, WriteAheadLog, np
+
+
+CREATE = """
+    db.execute("CREATE TABLE t (id INT, name VARCHAR(8)) WITH (storage = {storage})")
+    db.execute("CREATE INDEX t_name ON t (name)")
+    for i in range(1, 4):
+        db.execute(f"INSERT INTO t VALUES ({{i}}, 'n{{i}}')")
+    # строки уходят в контрольную точку: восстановление не перепишет их из журнала
+    db.wal.checkpoint()
+"""
+
+
+class TestWal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # каталог удаляется последним, после закрытия баз
+        self.addCleanup(self.tmp.cleanup)
+
+    def reopen(self, directory):
+        db = Database(directory, wal_file='db.wal')
+        self.addCleanup(db.close)
+        return db
+
+    def assert_rows(self, db, expected_ids):
+        self.assertEqual(sorted(row[0] for row in db.execute("SELECT id FROM t")), expected_ids)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t"), [[len(expected_ids)]])
+        # индексы после восстановления сходятся с файлом данных
+        for i in range(1, 5):
+            expected = [[i]] if i in expected_ids else []
+            self.assertEqual(db.execute(f"SELECT id FROM t WHERE id = {i}"), expected)
+            self.assertEqual(db.execute(f"SELECT id FROM t WHERE name = 'n{i}'"), expected)
+
+    def test_uncommitted_insert_and_delete(self):
+        """Тест: незафиксированные INSERT и DELETE одной транзакции после сбоя не видны оба"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                directory = os.path.join(self.tmp.name, storage)
+                run_and_crash(directory, CREATE.format(storage=storage), """
+                    db.execute("BEGIN")
+                    db.execute("DELETE FROM t WHERE id = 2")
+                    db.execute("INSERT INTO t VALUES (4, 'n4')")
+                """, wal_file='db.wal')
+                self.assert_rows(self.reopen(directory), [1, 2, 3])
+
+    def test_committed_insert_and_delete(self):
+        """Тест: зафиксированная транзакция с INSERT и DELETE переживает сбой"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                directory = os.path.join(self.tmp.name, storage)
+                run_and_crash(directory, CREATE.format(storage=storage), """
+                    db.execute("BEGIN")
+                    db.execute("DELETE FROM t WHERE id = 2")
+                    db.execute("INSERT INTO t VALUES (4, 'n4')")
+                    db.execute("COMMIT")
+                """, wal_file='db.wal')
+                self.assert_rows(self.reopen(directory), [1, 3, 4])
+
+    @unittest.skipIf(np is None, "numpy не установлен")
+    def test_uncommitted_numpy_delete(self):
+        """Тест отката пометок удаления, сделанных маской numpy"""
+        directory = os.path.join(self.tmp.name, 'numpy')
+        run_and_crash(directory, """
+            db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+            for i in range(1, 4):
+                db.execute(f"INSERT INTO t VALUES ({i}, 'n{i}')")
+            db.wal.checkpoint()
+            db.execute("BEGIN")
+            db.execute("DELETE FROM t WHERE name = 'n2'")
+            db.execute("DELETE FROM t")
+        """, wal_file='db.wal', scan_mode='numpy')
+        db = self.reopen(directory)
+        self.assertEqual(db.execute("SELECT id FROM t"), [[1], [2], [3]])
+
+    def test_uncommitted_group(self):
+        """Тест: DELETE из незафиксированной группы (group_commit) откатывается при восстановлении"""
+        directory = os.path.join(self.tmp.name, 'group')
+        run_and_crash(directory, CREATE.format(storage='row'), """
+            db.group_commit = 100
+            db.execute("DELETE FROM t WHERE id = 2")
+            db.execute("INSERT INTO t VALUES (4, 'n4')")
+        """, wal_file='db.wal')
+        self.assert_rows(self.reopen(directory), [1, 2, 3])
+
+    def test_autocommit_delete(self):
+        """Тест: DELETE, фиксируемый сразу, пишет журнал одним fsync без before-image и после сбоя доводится"""
+        db = self.reopen(self.tmp.name)
+        db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+        db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(1, 4)])
+        with mock.patch.object(mainSUBD.os, 'fsync', wraps=os.fsync) as fsync, \
+                mock.patch.object(WriteAheadLog, 'log_undo') as log_undo:
+            db.execute("DELETE FROM t WHERE name = 'n1'")
+        self.assertEqual(fsync.call_count, 1)
+        log_undo.assert_not_called()
+        # сбой после пометки первой из двух строк
+        crash = """
+            db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+            for i in range(1, 5):
+                db.execute(f"INSERT INTO t VALUES ({i}, 'n{i % 2}')")
+            db.wal.checkpoint()
+            db.group_commit = {group_commit}
+            table = db.tables['t']
+            mark_deleted = table._mark_deleted
+            def crash_after_first(offset):
+                mark_deleted(offset)
+                os._exit(0)
+            table._mark_deleted = crash_after_first
+            db.execute("DELETE FROM t WHERE name = 'n0'")
+        """
+        # зафиксированный DELETE повторяется при восстановлении, а из незафиксированной группы - откатывается
+        for group_commit, expected in [(1, [1, 3]), (100, [1, 2, 3, 4])]:
+            with self.subTest(group_commit=group_commit):
+                directory = os.path.join(self.tmp.name, f"group{group_commit}")
+                run_and_crash(directory, crash.replace('{group_commit}', str(group_commit)), wal_file='db.wal')
+                db = self.reopen(directory)
+                self.assertEqual(db.execute("SELECT id FROM t"), [[i] for i in expected])
+                self.assertEqual(db.execute("SELECT COUNT(*) FROM t"), [[len(expected)]])
+
+    def test_lazy_open_in_transaction(self):
+        """Тест: таблица, открытая посреди транзакции, не фиксирует её предыдущие запросы"""
+        directory = os.path.join(self.tmp.name, 'lazy')
+        db = Database(directory)
+        for table in ('t1', 't2'):
+            db.execute(f"CREATE TABLE {table} (id INT, name VARCHAR(8))")
+        db.close()
+        # обе таблицы открываются при первом обращении уже внутри транзакции
+        run_and_crash(directory, """
+            db.execute("BEGIN")
+            db.execute("INSERT INTO t1 VALUES (1, 'n1')")
+            db.execute("INSERT INTO t2 VALUES (2, 'n2')")
+        """, wal_file='db.wal')
+        db = self.reopen(directory)
+        self.assertEqual(db.execute("SELECT * FROM t1"), [])
+        self.assertEqual(db.execute("SELECT * FROM t2"), [])
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t1 WHERE id = 1"), [[0]])
+
+    def test_rollback(self):
+        """Тест ROLLBACK: строки транзакции отменяются и не возвращаются после сбоя"""
+        for storage in STORAGES:
+            with self.subTest(storage=storage):
+                directory = os.path.join(self.tmp.name, storage)
+                run_and_crash(directory, CREATE.format(storage=storage), """
+                    db.execute("BEGIN")
+                    db.execute("DELETE FROM t WHERE id = 2")
+                    db.execute("DELETE FROM t")
+                    db.execute("INSERT INTO t VALUES (4, 'n4')")
+                    assert db.execute("SELECT id FROM t") == [[4]]
+                    db.execute("ROLLBACK")
+                    assert sorted(db.execute("SELECT id FROM t")) == [[1], [2], [3]]
+                    db.execute("DELETE FROM t WHERE id = 3")
+                """, wal_file='db.wal')
+                self.assert_rows(self.reopen(directory), [1, 2])
+
+    def test_rollback_without_wal(self):
+        """Тест ROLLBACK в базе без журнала"""
+        db = Database(self.tmp.name)
+        self.addCleanup(db.close)
+        db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+        db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(1, 4)])
+        db.execute("BEGIN")
+        db.execute("DELETE FROM t WHERE id = 1")
+        db.executemany("INSERT INTO t VALUES (?, ?)", [(5, 'n5')])
+        db.execute("ROLLBACK")
+        self.assertEqual(db.execute("SELECT id FROM t"), [[1], [2], [3]])
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM t WHERE id = 5"), [[0]])
+        with self.assertRaises(ValueError):
+            db.execute("ROLLBACK")
+
+    def test_ddl_in_transaction(self):
+        """Тест: DDL и VACUUM внутри транзакции запрещены"""
+        db = Database(self.tmp.name, wal_file='db.wal')
+        self.addCleanup(db.close)
+        db.execute("CREATE TABLE t (id INT, name VARCHAR(8))")
+        db.execute("BEGIN")
+        for sql in ["VACUUM t", "CREATE TABLE u (id INT)", "DROP TABLE t"]:
+            with self.assertRaises(ValueError):
+                db.execute(sql)
+        db.execute("COMMIT")
+
+
+if __name__ == '__main__':
+    unittest.main()